@@ -1,25 +1,398 @@
 from PyQt6 import QtWidgets, QtGui, QtCore
 from typing import List, Dict, Optional
 from collections import defaultdict
-import traceback
+import logging
+import functools
+import contextlib
+import threading
+import queue
+import json
+import math
+import time
 import re
 import os
 import sys
 
+from layout_model import (CellBounds, CellGrid, ElementRecord, LayoutSnapshot, LayoutIndex, clip_segments,
+                          element_bbox, compute_cell_assignment,
+                          compute_virtual_lines, collect_vline_registrations, recompute_layout)
+from drc import RuleDeck, check_layout, check_layout_parallel, violation_sort_key
+from nets import NetIndex
+
+
+# Журналирование по подсистемам (логгеры curse.*). Уровни задаются переменной
+# окружения CURSE_LOG: общий уровень и/или уровни подсистем через запятую,
+# например CURSE_LOG=INFO или CURSE_LOG=WARNING,vlines=DEBUG,cells=INFO.
+# По умолчанию выводятся только предупреждения и ошибки.
+LOG_ENV = "CURSE_LOG"
+log = logging.getLogger("curse")
+log_cells = logging.getLogger("curse.cells")
+log_vlines = logging.getLogger("curse.vlines")
+log_ui = logging.getLogger("curse.ui")
+log_io = logging.getLogger("curse.io")
+log_autosave = logging.getLogger("curse.autosave")
+log_tasks = logging.getLogger("curse.tasks")
+
+
+def configure_logging(spec=None):
+    """Настраивает логгеры curse.* по строке вида "INFO,cells=DEBUG" (по умолчанию — из CURSE_LOG)"""
+    if spec is None:
+        spec = os.environ.get(LOG_ENV, "")
+
+    if not log.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter(
+            "%(asctime)s %(levelname)s %(name)s: %(message)s", "%H:%M:%S"))
+        log.addHandler(handler)
+        log.propagate = False
+    log.setLevel(logging.WARNING)
+
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, level_name = part.rpartition("=")
+        level = logging.getLevelName(level_name.strip().upper())
+        if not isinstance(level, int):
+            log.warning("Неизвестный уровень журналирования в %s: %s", LOG_ENV, part)
+            continue
+        (logging.getLogger(f"curse.{name.strip()}") if name else log).setLevel(level)
+
+
+class PerfStats:
+    """
+    Накопитель времён операций. Для каждой операции хранит число вызовов,
+    последнее, суммарное и максимальное время и гистограмму по бакетам log2
+    от времени в микросекундах (бакет i — [2^i, 2^(i+1)) мкс), по которой
+    оценивается p95. record() можно вызывать из рабочих потоков.
+    """
+    BUCKETS = 32
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ops = {}
+
+    def record(self, name, seconds):
+        micros = max(1, int(seconds * 1e6))
+        bucket = min(micros.bit_length() - 1, self.BUCKETS - 1)
+        with self.lock:
+            op = self.ops.get(name)
+            if op is None:
+                op = self.ops[name] = {"count": 0, "last": 0.0, "total": 0.0, "max": 0.0,
+                                       "hist": [0] * self.BUCKETS}
+            op["count"] += 1
+            op["last"] = seconds
+            op["total"] += seconds
+            op["max"] = max(op["max"], seconds)
+            op["hist"][bucket] += 1
+
+    def percentile(self, name, q=0.95):
+        """Верхняя граница бакета, в который попадает квантиль q (в секундах)"""
+        with self.lock:
+            op = self.ops.get(name)
+            if op is None or not op["count"]:
+                return 0.0
+            threshold = q * op["count"]
+            seen = 0
+            for i, n in enumerate(op["hist"]):
+                seen += n
+                if seen >= threshold:
+                    return min((1 << (i + 1)) / 1e6, op["max"])
+            return op["max"]
+
+    def last(self, name):
+        with self.lock:
+            op = self.ops.get(name)
+            return op["last"] if op else 0.0
+
+    def reset(self):
+        with self.lock:
+            self.ops.clear()
+
+    def report(self):
+        """Сводка по всем операциям (времена в миллисекундах) для JSON-отчёта"""
+        with self.lock:
+            names = sorted(self.ops)
+        result = {}
+        for name in names:
+            with self.lock:
+                op = dict(self.ops[name])
+            result[name] = {
+                "count": op["count"],
+                "last_ms": round(op["last"] * 1e3, 3),
+                "mean_ms": round(op["total"] / op["count"] * 1e3, 3),
+                "p95_ms": round(self.percentile(name) * 1e3, 3),
+                "max_ms": round(op["max"] * 1e3, 3),
+                "histogram_us_log2": op["hist"],
+            }
+        return result
+
+
+# Общий накопитель времён операций редактора
+PERF = PerfStats()
+
+
+def timed(name):
+    """Декоратор: учитывает время вызова функции в PERF под именем name"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                PERF.record(name, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+class MaterialStyleRegistry:
+    """
+    Общие перья, кисти и шрифты (flyweight). QPen/QBrush/QFont в Qt неявно
+    разделяемые, поэтому элементы, получившие объект из реестра, ссылаются
+    на одни данные стиля вместо собственной копии. Объекты кэшируются по
+    цвету/толщине/стилю и после выдачи не изменяются: restyle() меняет
+    описание материала и одним проходом переназначает стиль его элементам.
+    Материалы подключаются через load() из словарей InfiniteCanvas.
+    """
+    DEFAULT_COLOR = "black"
+    DEFAULT_Z = 5
+
+    def __init__(self):
+        self.line_materials = {}
+        self.contact_materials = {}
+        self.two_point_types = {}
+        self._cache = {}
+
+    def load(self, line_materials, contact_materials, two_point_types):
+        self.line_materials = line_materials
+        self.contact_materials = contact_materials
+        self.two_point_types = two_point_types
+
+    def _get(self, key, factory):
+        obj = self._cache.get(key)
+        if obj is None:
+            obj = self._cache[key] = factory()
+        return obj
+
+    def pen(self, color, width=1, style=QtCore.Qt.PenStyle.SolidLine, cap=QtCore.Qt.PenCapStyle.SquareCap):
+        """color — имя/#rrggbb или кортеж (r, g, b[, a]); cap — форма концов (по умолчанию как у QPen)"""
+        def make():
+            pen = QtGui.QPen(QtGui.QColor(*color) if isinstance(color, tuple) else QtGui.QColor(color))
+            pen.setWidth(width)
+            pen.setStyle(style)
+            pen.setCapStyle(cap)
+            return pen
+        return self._get(("pen", color, width, style, cap), make)
+
+    def no_pen(self):
+        return self._get(("pen", None), lambda: QtGui.QPen(QtCore.Qt.PenStyle.NoPen))
+
+    def brush(self, color):
+        def make():
+            return QtGui.QBrush(QtGui.QColor(*color) if isinstance(color, tuple) else QtGui.QColor(color))
+        return self._get(("brush", color), make)
+
+    def font(self, point_size):
+        def make():
+            font = QtGui.QFont()
+            font.setPointSize(point_size)
+            return font
+        return self._get(("font", point_size), make)
+
+    def outline_pen(self):
+        """Обводка контактов и соединительной линии двухточечного контакта"""
+        return self.pen(self.DEFAULT_COLOR)
+
+    def line_pen(self, material, width):
+        """Перо провода материала толщиной width пикселей (неизвестный материал — чёрное)"""
+        params = self.line_materials.get(material)
+        if params is None:
+            return self.pen(self.DEFAULT_COLOR, width)
+        return self.pen(params["color"], width, params["style"])
+
+    def contact_params(self, material, default_color=None):
+        return self.contact_materials.get(
+            material, {"color": default_color or self.DEFAULT_COLOR, "z": self.DEFAULT_Z})
+
+    def contact_brush(self, material, default_color=None):
+        return self.brush(self.contact_params(material, default_color)["color"])
+
+    def restyle(self, scene, material, color, style=None):
+        """
+        Меняет цвет материала (для проводов — и стиль линии; для двухточечного
+        типа color — пара цветов) и переназначает перья/кисти всем его
+        элементам на сцене. Возвращает число обновлённых элементов.
+        """
+        brushes = {}
+        if material in self.line_materials:
+            self.line_materials[material]["color"] = color
+            if style is not None:
+                self.line_materials[material]["style"] = style
+        elif material in self.contact_materials:
+            self.contact_materials[material]["color"] = color
+            brushes[material] = self.brush(color)
+        elif material in self.two_point_types:
+            self.two_point_types[material]["colors"] = tuple(color)
+            brushes[material] = self.brush(color[0])
+            brushes[f"{material}_r"] = self.brush(color[1])
+        else:
+            return 0
+
+        count = 0
+        for item in scene.items():
+            name, kind = item.data(1), item.data(0)
+            if kind == "wire" and name == material:
+                item.setPen(self.line_pen(material, item.pen().width()))
+            elif kind == "contact" and name in brushes and hasattr(item, "setBrush"):
+                item.setBrush(brushes[name])
+            else:
+                continue
+            count += 1
+        return count
+
+
+# Общий реестр стилей материалов
+STYLES = MaterialStyleRegistry()
+
+
+def materialized(func):
+    """
+    Декоратор метода InfiniteCanvas, которому нужна вся раскладка на сцене:
+    на время вызова выгруженные ячейки возвращаются (CellVirtualizer).
+    Если метод запускает порционную операцию, раскладка остаётся на сцене до
+    её завершения: run_chunked удерживает выгрузку на всё время работы.
+    """
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        with self.virtualizer.all_materialized():
+            return func(self, *args, **kwargs)
+    return wrapper
+
+
+# --- Оценка занимаемой памяти ---
+
+# Примерный размер C++-части элементов сцены (объект, d-указатель, кэш
+# геометрии, перо/кисть), байт. Python-обёртка считается отдельно через
+# sys.getsizeof. Цифры — ориентир для сравнения сессий, а не точный учёт.
+QT_ITEM_BYTES = {
+    "QGraphicsLineItem": 240,
+    "QGraphicsEllipseItem": 260,
+    "QGraphicsRectItem": 250,
+    "QGraphicsSimpleTextItem": 320,
+    "QGraphicsTextItem": 1500,   # с собственным QTextDocument
+    "QGraphicsItemGroup": 200,
+    "QGraphicsItem": 180,
+}
+
+# data(0) элемента -> строка отчёта о памяти
+MEMORY_KINDS = {
+    "grid": "grid",
+    "axis": "axis", "axis_mark": "axis", "axis_label": "axis",
+    "wire": "wire",
+    "contact": "contact", "contact_line": "contact",
+    "vline": "vline",
+    "transistor": "transistor",
+    "cell": "cell-border",
+    "column": "table", "row": "table",
+    "column_comment": "buffer", "row_comment": "buffer", "cell_comment": "buffer",
+}
+
+
+def estimate_item_bytes(item):
+    """Оценка памяти одного QGraphicsItem: C++-часть по QT_ITEM_BYTES плюс обёртка"""
+    base = QT_ITEM_BYTES["QGraphicsItem"]
+    for cls in type(item).__mro__:
+        if cls.__name__ in QT_ITEM_BYTES:
+            base = QT_ITEM_BYTES[cls.__name__]
+            break
+    return base + sys.getsizeof(item)
+
+
+def deep_sizeof(obj, seen=None):
+    """
+    sys.getsizeof с обходом dict/list/tuple/set. Каждый объект считается
+    один раз (seen — множество id); Qt-объекты внутри не раскрываются.
+    """
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += deep_sizeof(key, seen) + deep_sizeof(value, seen)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for value in obj:
+            size += deep_sizeof(value, seen)
+    return size
+
+
+# Ключ QGraphicsItem.data() для постоянного идентификатора элемента модели.
+# data(0) — тип, data(1) — материал/имя, data(2) — толщина/размер.
+ELEMENT_UID = 3
+_next_element_uid = 1
+
+
+def element_uid(item):
+    """Возвращает идентификатор элемента, при необходимости выдаёт новый"""
+    global _next_element_uid
+    uid = item.data(ELEMENT_UID)
+    if uid is None:
+        uid = _next_element_uid
+        _next_element_uid += 1
+        item.setData(ELEMENT_UID, uid)
+    return uid
+
+
+def reserve_element_uid(uid):
+    """Сдвигает счётчик идентификаторов за uid (после восстановления из журнала)"""
+    global _next_element_uid
+    _next_element_uid = max(_next_element_uid, int(uid) + 1)
+
 
 class InfiniteCanvas(QtWidgets.QMainWindow):
-    def __init__(self, start_x=0, start_y=0, cell_size=20):
+    RECOMPUTE_RETRY_MS = 100
+    # Операции, которые показывает панель производительности (если уже измерялись)
+    HUD_OPERATIONS = ("assign_elements_to_cells", "recompute_layout", "auto_create_virtual_lines",
+                      "apply_virtual_lines", "draw_cell_borders", "update_comments",
+                      "matrixing", "export_to_cif")
+    HUD_INTERVAL_MS = 500
+
+    def __init__(self, start_x=0, start_y=0, cell_size=20, autosave_dir=".autosave"):
         super().__init__()
         self.cell_size = cell_size
         self.step = 40  # логический шаг (базовое деление осей)
         self.semi_step = 20
         self.current_tool = None
         self.undo_stack = []
-
-        # Границы рабочей области
+        self.undo_parked = []   # состояние CellVirtualizer для каждого снимка undo_stack
+        # Подписчики на изменения модели: callable(op, items)
+        self.model_listeners = []
+        self.journal = None
+        # Экспорт ячеек с проводами, обрезанными по границе ячейки (меню «Файл»)
+        self.clip_exports = False
+        # Живая проверка DRC (recheck_drc) должна видеть индекс до правки,
+        # поэтому подписывается раньше обновления индекса
+        self.drc_live = False
+        self.model_listeners.append(self._drc_on_model_change)
+        # Пространственный индекс проводов и контактов (см. spatial_index)
+        self._spatial_index = None
+        self.model_listeners.append(self._update_spatial_index)
+        # Цепи (связность) проводов и контактов (см. net_index)
+        self._net_index = None
+        self.model_listeners.append(self._update_net_index)
+        # Подсветка цепи инструментом «Цепь»: элемент сцены и закреплённый щелчком элемент цепи
+        self.net_highlight = None
+        self._net_pinned_key = None
+
+        # Начальная рабочая область. Холст не ограничен: сцена расширяется
+        # кусками SCENE_CHUNK по мере появления элементов и прокрутки
+        # (см. ensure_scene_covers), привязка к сетке границ не учитывает
         self.min_x = -200
         self.min_y = -200
-        self.max_x = 6000  # Можно увеличить при необходимости
+        self.max_x = 6000
         self.max_y = 6000
 
         self.setWindowTitle("Графический редактор")
@@ -39,13 +412,44 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
             scene_width, scene_height
         )
 
-        self.view = QtWidgets.QGraphicsView(self.scene)
+        self.view = PerfGraphicsView(self.scene)
         self.view.setRenderHint(QtGui.QPainter.RenderHint.Antialiasing)
         self.view.setDragMode(QtWidgets.QGraphicsView.DragMode.NoDrag)
         self.view.scale(1, -1)
+        self.view.set_grid(self.cell_size, self.step)
+        self._bulk_depth = 0    # вложенность bulk_insert
         self.scene.selectionChanged.connect(self.update_properties_panel)
+        self.scene.setBspTreeDepth(self.bsp_depth_for(self.scene.sceneRect()))
+        self._scene_grow_timer = QtCore.QTimer(self)
+        self._scene_grow_timer.setSingleShot(True)
+        self._scene_grow_timer.setInterval(0)
+        self._scene_grow_timer.timeout.connect(self._cover_viewport)
+        self.view.horizontalScrollBar().valueChanged.connect(self._scene_grow_timer.start)
+        self.view.verticalScrollBar().valueChanged.connect(self._scene_grow_timer.start)
+        self.model_listeners.append(self._grow_scene_for_change)
 
         self.cell_manager = CellManager(self.scene)
+        # Выгрузка элементов ячеек вне экрана (меню «Вид»)
+        self.virtualizer = CellVirtualizer(self)
+        self.cell_manager.virtualizer = self.virtualizer
+
+        # Фоновый пересчёт ячеек и виртуальных линий (см. schedule_recompute)
+        self._recompute_generation = 0
+        self._recompute_jobs = {}
+        self._recompute_signals = RecomputeSignals()
+        self._recompute_signals.finished.connect(self._on_recompute_finished)
+        self._recompute_timer = QtCore.QTimer(self)
+        self._recompute_timer.setSingleShot(True)
+        self._recompute_timer.setInterval(0)
+        self._recompute_timer.timeout.connect(self._start_recompute)
+        # Текущая порционная операция (ChunkedTaskRunner), см. run_chunked
+        self.active_task = None
+        self.time_slicing = True
+        # Панель производительности в строке состояния (toggle_perf_hud)
+        self.perf_hud_label = None
+        self.perf_hud_timer = None
+        # Запись событий ввода для воспроизведения (toggle_input_recording)
+        self.input_recorder = None
 
         # 2) Создаём CellCommentManager, передавая ссылку на текущий объект (self)
         self.cell_comment_manager = CellCommentManager(self.scene, self)
@@ -76,8 +480,6 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
         self._vline_counter = 0
 
         # Инициализация
-        self.draw_grid()
-        self.draw_axes()
         self.moving_item = None
         self.move_start_pos = None
         # Перемещение и рисование
@@ -116,6 +518,18 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
             "CENEPA": {"colors": ("#00ccff", "#ff00aa")}
         }
 
+        STYLES.load(self.LINE_MATERIALS, self.CONTACT_MATERIALS, self.TWO_POINT_CONTACT_TYPES)
+
+        # Проверка правил (меню «Проверка»): правила по материалам и текущие отметки
+        self.drc_deck = RuleDeck.from_materials(self.LINE_MATERIALS, self.CONTACT_MATERIALS)
+        self.drc_workers = os.cpu_count() or 1  # процессов для полной проверки (1 — в этом процессе)
+        self.drc_markers = {}                  # нарушение -> DrcMarkerItem
+        self._drc_by_key = defaultdict(set)    # ключ элемента -> его нарушения
+        self._drc_full_timer = QtCore.QTimer(self)
+        self._drc_full_timer.setSingleShot(True)
+        self._drc_full_timer.setInterval(0)
+        self._drc_full_timer.timeout.connect(self.check_drc)
+
         self.vlines_visible = True
 
         self.view.viewport().installEventFilter(self)
@@ -124,6 +538,327 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
         self.view.centerOn(start_x, start_y)
         self.create_menu()
 
+        # Журнал автосохранения: восстановление запускаем после старта цикла событий
+        if autosave_dir:
+            self.journal = LayoutJournal(self, autosave_dir)
+            self.model_listeners.append(self.journal.on_model_change)
+            QtCore.QTimer.singleShot(0, self.journal.start)
+
+    def closeEvent(self, event):
+        if self.input_recorder is not None:
+            self.input_recorder.stop()
+            self.input_recorder = None
+        if self.journal is not None:
+            self.journal.close()
+        if LAYER_BATCH.scene is self.scene:
+            LAYER_BATCH.disable()
+        LOD.table_rects.pop(self.scene, None)
+        super().closeEvent(event)
+
+    def spatial_index(self):
+        """
+        LayoutIndex (R-дерево layout_model) по проводам и контактам: ключ —
+        элемент сцены, у выгруженных CellVirtualizer элементов — ("parked", n).
+        Строится загрузкой STR при первом обращении после массового изменения,
+        дальше обновляется по notify_model_change.
+        """
+        if self._spatial_index is None:
+            self._spatial_index = LayoutIndex(self.keyed_records())
+        return self._spatial_index
+
+    def keyed_records(self):
+        """[(ключ, ElementRecord)] проводов и контактов, ключи — как в spatial_index"""
+        snapshot, items = self.cell_manager.take_snapshot()
+        return [(item if item is not None else ("parked", i), record)
+                for i, (item, record) in enumerate(zip(items, snapshot.elements))]
+
+    def invalidate_spatial_index(self):
+        self._spatial_index = None
+
+    def _update_spatial_index(self, op, items):
+        index = self._spatial_index
+        if index is None:
+            return
+        if op == "reset":
+            self._spatial_index = None
+            return
+        for item in items:
+            for element in [item] + item.childItems():
+                if op == "remove":
+                    index.remove(element)
+                elif op in ("add", "update") and element.scene() is self.scene:
+                    record = CellManager.element_record(element)
+                    if record is not None:
+                        index.add(element, record)
+
+    def net_index(self):
+        """
+        NetIndex (nets.py) по проводам и контактам с ключами и геометрией как
+        в spatial_index; эллипсы TwoPointContactGroup связаны между собой.
+        Строится при первом обращении, дальше обновляется по notify_model_change.
+        """
+        if self._net_index is None:
+            pairs = self.keyed_records()
+            links = [tuple(self.contact_pair(group)) for group in self.scene.items()
+                     if isinstance(group, TwoPointContactGroup)]
+            self._net_index = NetIndex(pairs, [link for link in links if len(link) == 2])
+        return self._net_index
+
+    @staticmethod
+    def contact_pair(group):
+        """Эллипсы-контакты TwoPointContactGroup"""
+        return [child for child in group.childItems()
+                if child.data(0) == "contact" and isinstance(child, QtWidgets.QGraphicsEllipseItem)]
+
+    def invalidate_net_index(self):
+        self._net_index = None
+
+    def _update_net_index(self, op, items):
+        index = self._net_index
+        if index is None:
+            return
+        if op == "reset":
+            self._net_index = None
+            self.clear_net_highlight()
+            return
+        for item in items:
+            pair = self.contact_pair(item) if isinstance(item, TwoPointContactGroup) else []
+            for element in [item] + item.childItems():
+                if op == "remove":
+                    index.remove(element)
+                elif op in ("add", "update") and element.scene() is self.scene:
+                    record = CellManager.element_record(element)
+                    if record is not None:
+                        index.add(element, record, links=[other for other in pair if other is not element])
+        if self.net_highlight is not None:
+            self.refresh_net_highlight()
+
+    NET_PICK_RADIUS = 5     # как у инструмента удаления
+    NET_LIST_LIMIT = 500    # элементов цепи в списке панели свойств
+
+    def net_key_at(self, scene_pos):
+        """Ключ (как в net_index) ближайшего к точке провода или контакта в радиусе выбора"""
+        x, y, r = scene_pos.x(), scene_pos.y(), self.NET_PICK_RADIUS
+        index = self.net_index()
+        keys = [key for key in self.spatial_index().query((x - r, y - r, x + r, y + r)) if key in index]
+        if not keys:
+            return None
+        return min(keys, key=lambda key: (index.distance(key, x, y), index.shapes[key].kind != "contact"))
+
+    def pick_net(self, scene_pos, pin=False):
+        """
+        Подсвечивает цепь элемента под курсором. pin — щелчок: цепь закрепляется
+        и выводится в панель свойств; без элемента под курсором при наведении
+        остаётся закреплённая цепь.
+        """
+        key = self.net_key_at(scene_pos)
+        if pin:
+            self._net_pinned_key = key
+            if key is None:
+                self.clear_net_highlight()
+                self.clear_properties_panel()
+                return
+        elif key is None:
+            key = self._net_pinned_key
+        if key is None:
+            self.clear_net_highlight()
+            return
+        self.highlight_net(self.net_index().net(key))
+        if pin:
+            self.show_net_properties(self.net_highlight.net)
+
+    def highlight_net(self, net):
+        """Подсветка цепи net; фигуры берутся из net_index, работа пропорциональна размеру цепи"""
+        if self.net_highlight is not None and self.net_highlight.net == net:
+            return
+        index = self.net_index()
+        self.clear_net_highlight(keep_pin=True)
+        self.net_highlight = NetHighlightItem(net, [index.shapes[key] for key in index.members(net)])
+        self.scene.addItem(self.net_highlight)
+
+    def clear_net_highlight(self, keep_pin=False):
+        if self.net_highlight is not None and self.net_highlight.scene() is self.scene:
+            self.scene.removeItem(self.net_highlight)
+        self.net_highlight = None
+        if not keep_pin:
+            self._net_pinned_key = None
+
+    def refresh_net_highlight(self):
+        """После правки: перерисовывает закреплённую цепь (номер мог смениться) или снимает подсветку"""
+        key = self._net_pinned_key
+        self.clear_net_highlight(keep_pin=True)
+        if key is not None and key in self.net_index():
+            self.highlight_net(self.net_index().net(key))
+        else:
+            self._net_pinned_key = None
+
+    def net_summary(self, net):
+        """(фигуры, слои, имена ячеек) цепи net; ячейки — по CellManager.cell_grid"""
+        index = self.net_index()
+        shapes = [index.shapes[key] for key in index.members(net)]
+        grid = self.cell_manager.cell_grid()
+        cells = set()
+        for shape in shapes:
+            x1, y1, x2, y2 = shape.segment
+            for x, y in ((x1, y1), (x2, y2)):
+                ci = grid.cell_at(x, y)
+                if ci is not None:
+                    cells.add(ci)
+            if shape.kind == "wire":
+                cells.update(grid.cells_crossed(x1, y1, x2, y2))
+        layers = sorted({str(shape.layer) for shape in shapes})
+        names = sorted(grid.cells[ci].name or f"({grid.cells[ci].x1:g}, {grid.cells[ci].y1:g})" for ci in cells)
+        return shapes, layers, names
+
+    def show_net_properties(self, net):
+        """Панель свойств цепи: состав, слои, ячейки и список элементов (щелчок — к элементу)"""
+        self.clear_properties_panel()
+        self.properties_label.show()
+        shapes, layers, cells = self.net_summary(net)
+        wires = sum(1 for shape in shapes if shape.kind == "wire")
+
+        title = QtWidgets.QLabel(f"Цепь {net}")
+        title.setFont(QtGui.QFont("Arial", 10, QtGui.QFont.Weight.Bold))
+        self.properties_layout.addWidget(title)
+        self.properties_layout.addWidget(QtWidgets.QLabel(
+            f"Элементов: {len(shapes)} (проводов {wires}, контактов {len(shapes) - wires})"))
+        for caption, values in (("Слои", layers), ("Ячейки", cells)):
+            label = QtWidgets.QLabel(f"{caption}: {', '.join(values) if values else '—'}")
+            label.setWordWrap(True)
+            self.properties_layout.addWidget(label)
+
+        elements = QtWidgets.QListWidget()
+        for shape in sorted(shapes, key=lambda s: (s.kind, str(s.layer), s.segment))[:self.NET_LIST_LIMIT]:
+            x1, y1, x2, y2 = shape.segment
+            if shape.kind == "wire":
+                text = f"Wire({shape.layer}) ({x1:g}, {y1:g})-({x2:g}, {y2:g})"
+            else:
+                text = f"Contact({shape.layer}) ({x1:g}, {y1:g})"
+            entry = QtWidgets.QListWidgetItem(text)
+            entry.setData(QtCore.Qt.ItemDataRole.UserRole, ((x1 + x2) / 2, (y1 + y2) / 2))
+            elements.addItem(entry)
+        if len(shapes) > self.NET_LIST_LIMIT:
+            elements.addItem(f"… и ещё {len(shapes) - self.NET_LIST_LIMIT}")
+
+        def go_to(entry):
+            center = entry.data(QtCore.Qt.ItemDataRole.UserRole)
+            if center:
+                self.view.centerOn(*center)
+
+        elements.itemClicked.connect(go_to)
+        self.properties_layout.addWidget(elements)
+
+    def run_chunked(self, title, work, on_done=None, rollback=None, perf_name=None, bulk=False):
+        """
+        Выполняет длинную операцию порциями через цикл событий (ChunkedTaskRunner):
+        work — генератор, выдающий (done, total); on_done вызывается по завершении,
+        rollback — при отмене или ошибке. Если уже идёт другая порционная
+        операция или time_slicing выключен (скрипты, замеры), work выполняется
+        сразу целиком.
+        perf_name — имя операции в PERF (по умолчанию title).
+        bulk — work массово добавляет элементы: пока он выполняется, индекс сцены
+        отключён (см. bulk_insert), on_done/rollback вызываются уже после его перестроения.
+        """
+        if self.active_task is not None or not self.time_slicing:
+            start = time.perf_counter()
+            with self.bulk_insert() if bulk else contextlib.nullcontext():
+                for _ in work:
+                    pass
+            if on_done:
+                on_done()
+            PERF.record(perf_name or title, time.perf_counter() - start)
+            return None
+
+        if bulk:
+            self.begin_bulk_insert()
+            on_done = self._after_bulk_insert(on_done)
+            rollback = self._after_bulk_insert(rollback)
+
+        runner = ChunkedTaskRunner(self, title, work, on_done, rollback, perf_name)
+        self.active_task = runner
+        # Выгрузка ячеек приостановлена до _on_task_finished: операция может
+        # работать с элементами, возвращёнными на сцену (@materialized)
+        self.virtualizer.hold()
+        runner.finished.connect(lambda ok: self._on_task_finished(runner))
+        runner.start()
+        return runner
+
+    @contextlib.contextmanager
+    def bulk_insert(self):
+        """
+        Массовое добавление элементов: на время блока индекс сцены отключён
+        (NoIndex), и addItem не перестраивает BSP-дерево на каждом элементе;
+        после блока индекс строится один раз. Блоки могут быть вложенными.
+        """
+        self.begin_bulk_insert()
+        try:
+            yield
+        finally:
+            self.end_bulk_insert()
+
+    def begin_bulk_insert(self):
+        self._bulk_depth += 1
+        if self._bulk_depth == 1:
+            self.scene.setItemIndexMethod(QtWidgets.QGraphicsScene.ItemIndexMethod.NoIndex)
+
+    def end_bulk_insert(self):
+        self._bulk_depth -= 1
+        if self._bulk_depth > 0:
+            return
+        self.ensure_scene_covers(self.scene.itemsBoundingRect())
+        self.scene.setItemIndexMethod(QtWidgets.QGraphicsScene.ItemIndexMethod.BspTreeIndex)
+        self.scene.setBspTreeDepth(self.bsp_depth_for(self.scene.sceneRect()))
+        log_ui.debug("Индекс сцены перестроен: %d элементов", len(self.scene.items()))
+
+    def _after_bulk_insert(self, callback):
+        """Обёртка для on_done/rollback порционной операции с bulk=True"""
+        def wrapped():
+            self.end_bulk_insert()
+            if callback is not None:
+                callback()
+        return wrapped
+
+    def _on_task_finished(self, runner):
+        if self.active_task is runner:
+            self.active_task = None
+        runner.deleteLater()
+        self.virtualizer.release()
+
+    def _rollback_point(self):
+        """
+        Запоминает сетку ячеек перед порционной операцией.
+        Возвращает (added, rollback): в added операция складывает созданные
+        элементы сцены, rollback удаляет их и возвращает сетку.
+        """
+        cm = self.cell_manager
+        columns, rows, cells = cm.columns[:], cm.rows[:], cm.cells[:]
+        added = []
+
+        def rollback():
+            for item in added:
+                if item.scene() is self.scene:
+                    self.scene.removeItem(item)
+            cm.columns, cm.rows = columns, rows
+            cm.cells[:] = cells
+            cm.assign_elements_to_cells()
+            cm.draw_cell_borders()
+            self.cell_comment_manager.update_comments(cm.columns, cm.rows)
+            log_tasks.info("Операция отменена, изменения откатаны")
+
+        return added, rollback
+
+    def notify_model_change(self, op, items=()):
+        """
+        Сообщает подписчикам об изменении модели.
+        op: "add", "remove", "update" — для перечисленных элементов;
+            "grid" — изменились столбцы/строки; "reset" — массовое изменение.
+        """
+        items = list(items)
+        for listener in self.model_listeners:
+            try:
+                listener(op, items)
+            except Exception as e:
+                log.exception("Ошибка в обработчике изменения модели: %s", e)
 
     def create_menu(self):
         menu_bar = self.menuBar()
@@ -148,6 +883,439 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
         export_comment_cif_action = QtGui.QAction("Загрузка спецификации", self)
         export_comment_cif_action.triggered.connect(self.export_comment_fragments_to_cif)
         file_menu.addAction(export_comment_cif_action)
+
+        clip_action = QtGui.QAction("Обрезать провода по границам ячеек", self)
+        clip_action.setCheckable(True)
+        clip_action.setChecked(self.clip_exports)
+        clip_action.toggled.connect(self.toggle_clip_exports)
+        file_menu.addAction(clip_action)
+
+        view_menu = menu_bar.addMenu("Вид")
+
+        self.perf_hud_action = QtGui.QAction("Панель производительности", self)
+        self.perf_hud_action.setCheckable(True)
+        self.perf_hud_action.setShortcut(QtGui.QKeySequence("F12"))
+        self.perf_hud_action.toggled.connect(self.toggle_perf_hud)
+        view_menu.addAction(self.perf_hud_action)
+
+        perf_report_action = QtGui.QAction("Сохранить отчёт производительности...", self)
+        perf_report_action.triggered.connect(self.save_perf_report)
+        view_menu.addAction(perf_report_action)
+
+        perf_reset_action = QtGui.QAction("Сбросить статистику производительности", self)
+        perf_reset_action.triggered.connect(PERF.reset)
+        view_menu.addAction(perf_reset_action)
+
+        virtualize_action = QtGui.QAction("Выгружать ячейки вне экрана", self)
+        virtualize_action.setCheckable(True)
+        virtualize_action.toggled.connect(self.virtualizer.set_enabled)
+        view_menu.addAction(virtualize_action)
+
+        self.layer_batch_action = QtGui.QAction("Пакетная отрисовка слоёв", self)
+        self.layer_batch_action.setCheckable(True)
+        self.layer_batch_action.toggled.connect(self.toggle_layer_batching)
+        view_menu.addAction(self.layer_batch_action)
+
+        lod_action = QtGui.QAction("Упрощать отрисовку при отдалении", self)
+        lod_action.setCheckable(True)
+        lod_action.setChecked(LOD.enabled)
+        lod_action.toggled.connect(self.toggle_lod)
+        view_menu.addAction(lod_action)
+
+        restyle_action = QtGui.QAction("Цвет материала...", self)
+        restyle_action.triggered.connect(self.restyle_material)
+        view_menu.addAction(restyle_action)
+
+        memory_report_action = QtGui.QAction("Отчёт о памяти...", self)
+        memory_report_action.triggered.connect(self.show_memory_report)
+        view_menu.addAction(memory_report_action)
+
+        self.record_input_action = QtGui.QAction("Запись ввода...", self)
+        self.record_input_action.setCheckable(True)
+        self.record_input_action.toggled.connect(self.toggle_input_recording)
+        view_menu.addAction(self.record_input_action)
+
+        check_menu = menu_bar.addMenu("Проверка")
+
+        drc_action = QtGui.QAction("Проверить правила (DRC)", self)
+        drc_action.setShortcut(QtGui.QKeySequence("F9"))
+        drc_action.triggered.connect(self.run_drc)
+        check_menu.addAction(drc_action)
+
+        drc_rules_action = QtGui.QAction("Загрузить правила DRC...", self)
+        drc_rules_action.triggered.connect(self.load_drc_rules)
+        check_menu.addAction(drc_rules_action)
+
+        drc_clear_action = QtGui.QAction("Убрать отметки DRC", self)
+        drc_clear_action.triggered.connect(self.stop_drc)
+        check_menu.addAction(drc_clear_action)
+
+    def toggle_layer_batching(self, enabled):
+        """Включает/выключает отрисовку проводов и контактов слоями по материалам"""
+        if enabled:
+            LAYER_BATCH.enable(self.scene, self.LINE_MATERIALS, self.CONTACT_MATERIALS)
+        else:
+            LAYER_BATCH.disable()
+        log_ui.debug("Пакетная отрисовка слоёв: %s", enabled)
+
+    @timed("drc")
+    def check_drc(self):
+        """Полная проверка правил drc_deck; нарушения сохраняются и отмечаются на сцене"""
+        pairs = self.keyed_records()
+        if self.drc_workers > 1 and len(pairs) >= self.DRC_PARALLEL_MIN:
+            cm = self.cell_manager
+            keys = [key for key, _ in pairs]
+            violations = [v._replace(keys=tuple(keys[i] for i in v.keys))
+                          for v in check_layout_parallel([record for _, record in pairs], self.drc_deck,
+                                                         cm.columns, cm.rows, self.drc_workers)]
+        else:
+            violations = check_layout(pairs, self.drc_deck)
+        self.clear_drc_markers()
+        with self.bulk_insert():
+            for violation in violations:
+                self._add_drc_violation(violation)
+        self.drc_live = True
+        # recheck_drc берёт из индекса положение элементов до правки
+        self.spatial_index()
+        return violations
+
+    @property
+    def drc_violations(self):
+        """Текущие нарушения (после полной проверки и правок) в порядке отметок"""
+        return sorted(self.drc_markers, key=violation_sort_key)
+
+    def stop_drc(self):
+        """Убирает отметки и выключает живую проверку до следующего полного запуска"""
+        self.drc_live = False
+        self._drc_full_timer.stop()
+        self.clear_drc_markers()
+
+    DRC_PARALLEL_MIN = 20000  # меньшие раскладки быстрее проверить без запуска процессов
+    DRC_REACH = 16  # наибольшая полутолщина провода / радиус контакта, учитываемые при поиске соседей
+
+    def _drc_on_model_change(self, op, items):
+        if not self.drc_live:
+            return
+        if op == "reset":
+            # Массовое изменение — полная проверка, один раз после серии правок
+            self._drc_full_timer.start()
+        elif op in ("add", "update", "remove"):
+            if self._spatial_index is None and op != "add":
+                # Индекс сброшен (reset, выгрузка/возврат ячеек CellVirtualizer) и
+                # построился бы по уже изменённой сцене: прежнее положение потеряно
+                self._drc_full_timer.start()
+            else:
+                self.recheck_drc(items, removed=(op == "remove"))
+
+    @timed("drc_incremental")
+    def recheck_drc(self, items, removed=False):
+        """
+        Перепроверяет после правки только окрестность изменённых элементов.
+        Старое положение берётся из spatial_index (он ещё не обновлён), соседи —
+        запросом к нему; если индекс был сброшен, _drc_on_model_change вместо
+        этого запускает полную проверку. Заново ищутся нарушения изменённых элементов и
+        контактов рядом с ними (их перекрытие могло измениться); остальные
+        нарушения и отметки остаются как есть.
+        """
+        index = self.spatial_index()
+        changed = {}
+        area = None
+        for item in items:
+            for element in [item] + item.childItems():
+                old = index.records.get(element)
+                new = None
+                if not removed and element.scene() is self.scene:
+                    new = CellManager.element_record(element)
+                if old is None and new is None:
+                    continue
+                changed[element] = new
+                for record in (old, new):
+                    if record is not None:
+                        box = element_bbox(record)
+                        area = box if area is None else (min(area[0], box[0]), min(area[1], box[1]),
+                                                         max(area[2], box[2]), max(area[3], box[3]))
+        if not changed:
+            return
+
+        reach = self.drc_deck.max_spacing() + self.DRC_REACH
+        region = (area[0] - reach, area[1] - reach, area[2] + reach, area[3] + reach)
+        subjects = set(changed)
+        for key in index.query(region):
+            if key not in changed and index.records[key].kind == "contact":
+                subjects.add(key)
+        halo = (region[0] - reach, region[1] - reach, region[2] + reach, region[3] + reach)
+        pairs = [(key, index.records[key]) for key in index.query(halo) if key not in changed]
+        pairs += [(key, record) for key, record in changed.items() if record is not None]
+        fresh = check_layout(pairs, self.drc_deck, subjects)
+
+        stale = set()
+        for key in subjects:
+            stale.update(self._drc_by_key.get(key, ()))
+        for violation in stale:
+            self._drop_drc_violation(violation)
+        for violation in fresh:
+            self._add_drc_violation(violation)
+        log_ui.debug("DRC по правке: элементов %d, соседей %d, снято %d, найдено %d",
+                     len(changed), len(pairs), len(stale), len(fresh))
+
+    def run_drc(self):
+        violations = self.check_drc()
+        counts = defaultdict(int)
+        for v in violations:
+            counts[v.rule] += 1
+        log_ui.info("DRC: нарушений %d %s", len(violations), dict(counts))
+        if not violations:
+            QtWidgets.QMessageBox.information(self, "DRC", "Нарушений правил не найдено.")
+            return
+        lines = [f"Нарушений: {len(violations)}"]
+        lines += [f"  {rule}: {count}" for rule, count in sorted(counts.items())]
+        lines += ["", *(v.message() for v in violations[:20])]
+        if len(violations) > 20:
+            lines.append("...")
+        QtWidgets.QMessageBox.warning(self, "DRC", "\n".join(lines))
+
+    def _add_drc_violation(self, violation):
+        if violation in self.drc_markers:
+            return
+        marker = DrcMarkerItem(violation)
+        self.scene.addItem(marker)
+        self.drc_markers[violation] = marker
+        for key in violation.keys:
+            self._drc_by_key[key].add(violation)
+
+    def _drop_drc_violation(self, violation):
+        marker = self.drc_markers.pop(violation, None)
+        if marker is not None and marker.scene() is self.scene:
+            self.scene.removeItem(marker)
+        for key in violation.keys:
+            violations = self._drc_by_key.get(key)
+            if violations is not None:
+                violations.discard(violation)
+                if not violations:
+                    del self._drc_by_key[key]
+
+    def clear_drc_markers(self):
+        for marker in self.drc_markers.values():
+            if marker.scene() is self.scene:
+                self.scene.removeItem(marker)
+        self.drc_markers.clear()
+        self._drc_by_key.clear()
+
+    def load_drc_rules(self):
+        """Дополняет правила DRC из JSON-файла: {"M1": {"min_spacing": 6}, ...}"""
+        path, _ = QtWidgets.QFileDialog.getOpenFileName(self, "Правила DRC", "", "JSON (*.json)")
+        if not path:
+            return
+        try:
+            self.drc_deck.update_from_json(path)
+        except (OSError, ValueError, TypeError) as e:
+            QtWidgets.QMessageBox.critical(self, "Ошибка", f"Не удалось загрузить правила:\n{e}")
+            return
+        log_io.info("Загружены правила DRC из %s", path)
+
+    def toggle_clip_exports(self, enabled):
+        """Спецификации и CIF ячеек содержат только части проводов внутри ячейки"""
+        self.clip_exports = enabled
+
+    def toggle_lod(self, enabled):
+        LOD.enabled = enabled
+        self.scene.update()
+
+    def restyle_material(self):
+        """Меняет цвет материала провода/контакта сразу у всех его элементов"""
+        materials = list(self.LINE_MATERIALS) + list(self.CONTACT_MATERIALS)
+        material, ok = QtWidgets.QInputDialog.getItem(self, "Цвет материала", "Материал:", materials, 0, False)
+        if not ok:
+            return
+        params = self.LINE_MATERIALS.get(material) or self.CONTACT_MATERIALS[material]
+        color = QtWidgets.QColorDialog.getColor(QtGui.QColor(params["color"]), self, f"Цвет {material}")
+        if not color.isValid():
+            return
+        count = STYLES.restyle(self.scene, material, color.name())
+        log_ui.info("Материал %s перекрашен в %s: %d элементов", material, color.name(), count)
+
+    def toggle_input_recording(self, enabled):
+        """Начинает/останавливает запись событий ввода (InputRecorder)"""
+        if not enabled:
+            if self.input_recorder is not None:
+                self.input_recorder.stop()
+                self.input_recorder = None
+            return
+
+        file_name, _ = QtWidgets.QFileDialog.getSaveFileName(
+            self, "Файл записи ввода", "session.jsonl", "JSON Lines (*.jsonl)")
+        if not file_name:
+            self.record_input_action.setChecked(False)
+            return
+        try:
+            self.input_recorder = InputRecorder(self, file_name)
+            self.input_recorder.start()
+        except OSError as e:
+            self.input_recorder = None
+            self.record_input_action.setChecked(False)
+            QtWidgets.QMessageBox.critical(self, "Ошибка", f"Не удалось начать запись: {e}")
+
+    def memory_report(self):
+        """
+        Число элементов и оценка памяти по видам: элементы сцены (по data(0)),
+        снимки отмены (включая удалённые со сцены элементы, которые они
+        удерживают), Cell.elements/cif_layers/virtual_lines и объекты CellComment.
+        """
+        cm = self.cell_manager
+        label_items = {id(item) for item in cm.cell_graphics_items if item.data(0) is None}
+
+        scene_items = self.scene.items()
+        on_scene = {id(item) for item in scene_items}
+        scene = defaultdict(lambda: {"count": 0, "bytes": 0})
+        for item in scene_items:
+            kind = MEMORY_KINDS.get(item.topLevelItem().data(0))
+            if kind is None:
+                kind = "label" if id(item) in label_items else "other"
+            scene[kind]["count"] += 1
+            scene[kind]["bytes"] += estimate_item_bytes(item)
+
+        retained = {}
+        list_bytes = 0
+        for snapshot in self.undo_stack:
+            list_bytes += sys.getsizeof(snapshot)
+            for item in snapshot:
+                if id(item) not in on_scene:
+                    retained[id(item)] = item
+        undo = {
+            "snapshots": len(self.undo_stack),
+            "references": sum(len(snapshot) for snapshot in self.undo_stack),
+            "retained_items": len(retained),
+            "bytes": list_bytes + sum(estimate_item_bytes(item) for item in retained.values()),
+        }
+
+        seen = set()
+        cells = {
+            "count": len(cm.cells),
+            "element_refs": sum(len(cell.elements) for cell in cm.cells),
+            "elements_bytes": sum(sys.getsizeof(cell.elements) for cell in cm.cells),
+            "cif_records": sum(len(v) for cell in cm.cells for v in cell.cif_layers.values()),
+            "cif_layers_bytes": sum(deep_sizeof(cell.cif_layers, seen) for cell in cm.cells),
+            "virtual_lines_bytes": sum(deep_sizeof(cell.virtual_lines, seen) for cell in cm.cells),
+        }
+
+        parked = self.virtualizer.parked
+        virtualized = {
+            "cells": len(parked),
+            "records": sum(len(records) for records in parked.values()),
+            "bytes": deep_sizeof(parked),
+        }
+
+        comment_objects = [item.data(1) for item in self.cell_comment_manager.comment_items
+                           if isinstance(item.data(1), CellComment)]
+        seen.update(id(c.item) for c in comment_objects)  # группы уже учтены в scene
+        comments = {
+            "count": len(comment_objects),
+            "bytes": sum(sys.getsizeof(c) + deep_sizeof(vars(c), seen) for c in comment_objects),
+        }
+
+        total = (sum(v["bytes"] for v in scene.values()) + undo["bytes"] + comments["bytes"] + virtualized["bytes"] +
+                 cells["elements_bytes"] + cells["cif_layers_bytes"] + cells["virtual_lines_bytes"])
+        return {
+            "scene": dict(sorted(scene.items())),
+            "undo": undo,
+            "cells": cells,
+            "comments": comments,
+            "virtualized": virtualized,
+            "total_bytes": total,
+        }
+
+    def show_memory_report(self):
+        """Показывает memory_report таблицей; из диалога отчёт можно сохранить в JSON"""
+        report = self.memory_report()
+
+        def kb(n):
+            return f"{n / 1024:,.1f} КБ"
+
+        rows = [f"{kind:<12} {v['count']:>8}  {kb(v['bytes']):>12}" for kind, v in report["scene"].items()]
+        undo, cells, comments = report["undo"], report["cells"], report["comments"]
+        rows += [
+            "",
+            f"Снимки отмены: {undo['snapshots']}, ссылок {undo['references']}, "
+            f"удержано удалённых элементов {undo['retained_items']} — {kb(undo['bytes'])}",
+            f"Ячейки: {cells['count']}, Cell.elements {cells['element_refs']} ссылок — "
+            f"{kb(cells['elements_bytes'])}",
+            f"cif_layers: {cells['cif_records']} записей — {kb(cells['cif_layers_bytes'])}, "
+            f"virtual_lines — {kb(cells['virtual_lines_bytes'])}",
+            f"CellComment: {comments['count']} — {kb(comments['bytes'])}",
+            f"Выгружено: {report['virtualized']['records']} элементов в "
+            f"{report['virtualized']['cells']} ячейках — {kb(report['virtualized']['bytes'])}",
+            "",
+            f"Итого (оценка): {kb(report['total_bytes'])}",
+        ]
+        text = "\n".join(rows)
+        log.info("Отчёт о памяти:\n%s", text)
+
+        box = QtWidgets.QMessageBox(self)
+        box.setWindowTitle("Память")
+        box.setText("<pre>" + text + "</pre>")
+        save_button = box.addButton("Сохранить...", QtWidgets.QMessageBox.ButtonRole.ActionRole)
+        box.addButton(QtWidgets.QMessageBox.StandardButton.Close)
+        box.exec()
+        if box.clickedButton() is not save_button:
+            return
+
+        file_name, _ = QtWidgets.QFileDialog.getSaveFileName(
+            self, "Сохранить отчёт о памяти", "memory_report.json", "JSON (*.json)")
+        if not file_name:
+            return
+        report["created"] = time.strftime("%Y-%m-%d %H:%M:%S")
+        try:
+            with open(file_name, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            log_io.info("Отчёт о памяти сохранён в %s", file_name)
+        except OSError as e:
+            QtWidgets.QMessageBox.critical(self, "Ошибка", f"Не удалось сохранить отчёт: {e}")
+
+    def toggle_perf_hud(self, enabled):
+        """Показывает/скрывает в строке состояния последние и p95 времена операций"""
+        if enabled:
+            if self.perf_hud_label is None:
+                self.perf_hud_label = QtWidgets.QLabel()
+                self.statusBar().addPermanentWidget(self.perf_hud_label, 1)
+                self.perf_hud_timer = QtCore.QTimer(self)
+                self.perf_hud_timer.setInterval(self.HUD_INTERVAL_MS)
+                self.perf_hud_timer.timeout.connect(self.update_perf_hud)
+            self.perf_hud_label.show()
+            self.statusBar().show()
+            self.update_perf_hud()
+            self.perf_hud_timer.start()
+        elif self.perf_hud_label is not None:
+            self.perf_hud_timer.stop()
+            self.perf_hud_label.hide()
+            self.statusBar().hide()
+
+    def update_perf_hud(self):
+        parts = []
+        for name in self.HUD_OPERATIONS:
+            if name in PERF.ops:
+                parts.append(f"{name}: {PERF.last(name) * 1e3:.1f}/{PERF.percentile(name) * 1e3:.1f} мс")
+        parts.append(f"элементов: {len(self.scene.items())}")
+        parts.append(f"кадр: {PERF.last('paint') * 1e3:.1f}/{PERF.percentile('paint') * 1e3:.1f} мс")
+        self.perf_hud_label.setText("  |  ".join(parts))
+
+    def save_perf_report(self):
+        """Сохраняет сводку PERF в JSON"""
+        file_name, _ = QtWidgets.QFileDialog.getSaveFileName(
+            self, "Сохранить отчёт производительности", "perf_report.json", "JSON (*.json)")
+        if not file_name:
+            return
+        report = {
+            "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "scene_items": len(self.scene.items()),
+            "cells": len(self.cell_manager.cells),
+            "operations": PERF.report(),
+        }
+        try:
+            with open(file_name, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            log_io.info("Отчёт производительности сохранён в %s", file_name)
+        except OSError as e:
+            QtWidgets.QMessageBox.critical(self, "Ошибка", f"Не удалось сохранить отчёт: {e}")
     # создание таблицы с ячейками
     def table_creation(self):
         # Диалог для выбора размера ячеек по X (в логических шагах)
@@ -204,32 +1372,42 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
 
         cell_count_y = count_y_dialog.intValue()
 
-        # Очищаем существующие ячейки
-        if hasattr(self, 'cell_manager'):
-            self.cell_manager.columns.clear()
-            self.cell_manager.rows.clear()
-            self.cell_manager.cells.clear()
-            self.cell_manager.draw_cell_borders()
+        cm = self.cell_manager
+        added, rollback = self._rollback_point()
 
-        # Создаем столбцы (X)
-        for i in range(cell_count_x + 1):
-            x_pos = i * cell_size_x
-            self.create_column(QtCore.QPointF(x_pos, 0))
+        # Очищаем существующие ячейки
+        cm.columns.clear()
+        cm.rows.clear()
+        cm.cells.clear()
+        cm.draw_cell_borders()
+
+        # Столбцы (X), затем строки (Y)
+        positions = [(True, i * cell_size_x) for i in range(cell_count_x + 1)]
+        positions += [(False, j * cell_size_y) for j in range(cell_count_y + 1)]
+
+        def work():
+            for n, (is_column, value) in enumerate(positions, 1):
+                if is_column:
+                    added.append(self.create_column(QtCore.QPointF(value, 0), redraw=False))
+                else:
+                    added.append(self.create_row(QtCore.QPointF(0, value), redraw=False))
+                yield n, len(positions)
 
-        # Создаем строки (Y)
-        for j in range(cell_count_y + 1):
-            y_pos = j * cell_size_y
-            self.create_row(QtCore.QPointF(0, y_pos))
+        def done():
+            # Обновляем отображение
+            cm.update_cells()
+            cm.draw_cell_borders()
+            self.cell_comment_manager.update_comments(cm.columns, cm.rows)
 
-        # Обновляем отображение
-        self.cell_manager.draw_cell_borders()
-        self.cell_comment_manager.update_comments(
-            self.cell_manager.columns,
-            self.cell_manager.rows
-        )
+            self.notify_model_change("reset")
+            log_cells.info("Создана таблица %dx%d ячеек размером %dx%d шагов",
+                          cell_count_x, cell_count_y, steps_x, steps_y)
 
-        print(f"Создана таблица {cell_count_x}x{cell_count_y} ячеек размером {steps_x}x{steps_y} шагов")
+        self.run_chunked("Создание таблицы", work(), done, rollback, perf_name="table_creation",
+                         bulk=True)
 
+    @materialized
+    @timed("export_comment_fragments_to_cif")
     def export_comment_fragments_to_cif(self):
         if not hasattr(self, 'cell_comment_manager') or not self.cell_comment_manager.comment_items:
             QtWidgets.QMessageBox.information(self, "Экспорт", "Нет комментариев для экспорта.")
@@ -252,11 +1430,11 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
 
             QtWidgets.QMessageBox.information(self, "Успех",
                                               "Комментарий-фрагменты экспортированы в comments_fragments.cif")
-            print("Экспорт комментариев в CIF завершён.")
+            log_io.info("Экспорт комментариев в CIF завершён")
 
         except Exception as e:
             QtWidgets.QMessageBox.critical(self, "Ошибка", f"Не удалось экспортировать: {str(e)}")
-            print(f"Ошибка при экспорте комментариев: {e}")
+            log_io.error("Ошибка при экспорте комментариев: %s", e)
 
     def export_to_cif(self):
         """Экспорт всех ячеек в CIF-формате"""
@@ -265,39 +1443,45 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
             return
 
         try:
-            with open("cells_info.txt", "w", encoding="utf-8") as f:
-                # Заголовок CIF-файла
-                f.write("CIF 2.0;\n")
-                f.write("(Generated by Circuit Editor);\n\n")
-
-                # Экспорт каждой ячейки
-                for i, cell in enumerate(self.cell_manager.cells, 1):
-                    f.write(f"\n\n### Ячейка {i} ###\n")
-                    f.write(f"# Координаты: ({cell.x1}, {cell.y1}) - ({cell.x2}, {cell.y2})\n")
-
-                    # Получаем CIF-описание ячейки
-                    cif_data = self._get_cell_cif(cell)
-                    f.write(cif_data)
+            self.write_cells_cif("cells_info.txt")
 
             # Вывод в терминал
-            print("Успешный экспорт в cells_info.txt")
-            print("Содержимое файла:")
-            with open("cells_info.txt", "r", encoding="utf-8") as f:
-                print(f.read())
+            log_io.info("Успешный экспорт в cells_info.txt")
+            if log_io.isEnabledFor(logging.DEBUG):
+                with open("cells_info.txt", "r", encoding="utf-8") as f:
+                    log_io.debug("Содержимое файла:\n%s", f.read())
 
             QtWidgets.QMessageBox.information(self, "Успех", "Ячейки экспортированы в cells_info.txt")
 
         except Exception as e:
             QtWidgets.QMessageBox.critical(self, "Ошибка", f"Не удалось экспортировать: {str(e)}")
-            print(f"Ошибка экспорта: {str(e)}")
+            log_io.error("Ошибка экспорта: %s", e)
+
+    @materialized
+    @timed("export_to_cif")
+    def write_cells_cif(self, path):
+        """Записывает CIF-описание всех ячеек и буферов в файл path (без диалогов)"""
+        with open(path, "w", encoding="utf-8") as f:
+            # Заголовок CIF-файла
+            f.write("CIF 2.0;\n")
+            f.write("(Generated by Circuit Editor);\n\n")
+
+            # Экспорт каждой ячейки
+            for i, cell in enumerate(self.cell_manager.cells, 1):
+                f.write(f"\n\n### Ячейка {i} ###\n")
+                f.write(f"# Координаты: ({cell.x1}, {cell.y1}) - ({cell.x2}, {cell.y2})\n")
 
-        if hasattr(self, 'cell_comment_manager'):
-            for i, comment in enumerate(self.cell_comment_manager.comment_items, 1):
-                if hasattr(comment, 'data') and comment.data(0) in ["column_comment", "row_comment"]:
-                    comment_obj = comment.data(1)
-                    if isinstance(comment_obj, CellComment):
-                        f.write(f"\n\n### Комментарий {i}: {comment_obj.text} ###\n")
-                        f.write(comment_obj.to_cif(100 + i))  # fragment_id = 100+i
+                # Получаем CIF-описание ячейки
+                cif_data = self._get_cell_cif(cell)
+                f.write(cif_data)
+
+            if hasattr(self, 'cell_comment_manager'):
+                for i, comment in enumerate(self.cell_comment_manager.comment_items, 1):
+                    if hasattr(comment, 'data') and comment.data(0) in ["column_comment", "row_comment"]:
+                        comment_obj = comment.data(1)
+                        if isinstance(comment_obj, CellComment):
+                            f.write(f"\n\n### Комментарий {i}: {comment_obj.text} ###\n")
+                            f.write(comment_obj.to_cif(100 + i))  # fragment_id = 100+i
 
     def _get_cell_cif(self, cell) -> str:
         """Генерирует CIF-описание для одной ячейки"""
@@ -306,6 +1490,13 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
             f"DF 1;  # Уровень масштабирования"
         ]
 
+        wires = [item for item in cell.elements
+                 if hasattr(item, 'data') and item.data(0) == "wire"]
+        segments = [(line.x1(), line.y1(), line.x2(), line.y2()) for line in (w.line() for w in wires)]
+        if self.clip_exports:
+            segments = clip_segments(segments, (cell.x1, cell.y1, cell.x2, cell.y2))
+        wire_segments = {id(w): seg for w, seg in zip(wires, segments)}
+
         # Группируем элементы по слоям
         layers = {}
         for item in cell.elements:
@@ -317,11 +1508,14 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
                 layers[layer] = []
 
             if item.data(0) == "wire":
-                line = item.line()
+                segment = wire_segments[id(item)]
+                if segment is None:
+                    continue
+                x1, y1, x2, y2 = segment
                 layers[layer].append(
                     f"W {item.data(2)} "  # Ширина
-                    f"({int(line.x1())} {int(line.y1())}) "
-                    f"({int(line.x2())} {int(line.y2())});"
+                    f"({int(x1)} {int(y1)}) "
+                    f"({int(x2)} {int(y2)});"
                 )
             elif item.data(0) == "contact":
                 pos = item.scenePos()
@@ -337,6 +1531,8 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
 
         return "\n".join(cif_lines)
 
+    @materialized
+    @timed("save_cells_to_files")
     def save_cells_to_files(self):
         """Сохраняет все пользовательские элементы холста в файл grid_specification.txt"""
         filename = "grid_specification.txt"
@@ -386,11 +1582,11 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
                         except AttributeError:
                             continue
 
-            print(f"Спецификация сохранена в файл {filename}")
+            log_io.info("Спецификация сохранена в файл %s", filename)
             QtWidgets.QMessageBox.information(self, "Сохранение", f"Файл {filename} успешно сохранен")
 
         except Exception as e:
-            print(f"Ошибка при сохранении: {str(e)}")
+            log_io.error("Ошибка при сохранении: %s", e)
             QtWidgets.QMessageBox.critical(self, "Ошибка", f"Не удалось сохранить файл: {str(e)}")
 
     def create_tools(self):
@@ -399,6 +1595,7 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
             ("Линия", "line"),
             ("Транзистор", "transistor"),
             ("Контакт", "contact"),
+            ("Цепь", "net"),
             ("Удаление", "delete"),
             ("Граница столбца", "column"),
             ("Граница строки", "row"),
@@ -560,7 +1757,7 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
                 # --- 2.2. Показать все элементы внутри этой ячейки ---
                 rect = QtCore.QRectF(cell.x1, cell.y1, cell.x2 - cell.x1, cell.y2 - cell.y1)
 
-                for item in self.scene.items():
+                for item in self.scene.items(rect):
                     if not hasattr(item, "data"):
                         continue
                     kind = item.data(0)
@@ -634,6 +1831,7 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
     def cells_creation_buff(self, comment):
         pass
 
+    @materialized
     def show_buffer_specification(self, comment):
         """
         Собирает текстовую спецификацию для всех элементов во всех ячейках буфера
@@ -649,8 +1847,8 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
 
             rect = QtCore.QRectF(cell.x1, cell.y1, cell.x2 - cell.x1, cell.y2 - cell.y1)
 
-            # Перебираем все элементы сцены и собираем те, что попадают в rect
-            for item in self.scene.items():
+            # Элементы, попадающие в rect, — выборкой по индексу сцены
+            for item in self.scene.items(rect):
                 if not hasattr(item, "data"):
                     continue
                 kind = item.data(0)
@@ -725,7 +1923,17 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
         )
         if not ok or factor <= 1:
             return
+        self.matrix_buffer(comment, factor)
 
+    @materialized
+    @timed("matrix_buffer")
+    def matrix_buffer(self, comment, factor):
+        """
+        Дублирует буфер (столбец или строку ячеек) factor раз: раздвигает сетку
+        и копирует провода и контакты исходных ячеек в новые.
+        Копирование идёт порциями (run_chunked); «Отмена» возвращает сетку
+        и удаляет уже созданные копии.
+        """
         cm = self.cell_manager
         is_column_buffer = (comment.kind == "column")
         is_row_buffer = (comment.kind == "row")
@@ -741,214 +1949,121 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
         if not original_cells:
             return
 
-        ### ==  Матрицирование по столбцам  (vertical buffer)  == ###
-        if is_column_buffer:
-            orig_cols = cm.columns[:]  # копия списка X‐координат
-            if buf_index >= len(orig_cols) - 1:
-                return
-
-            left = orig_cols[buf_index]
-            right = orig_cols[buf_index + 1]
-            width = right - left
-
-            # 2) Строим новый список столбцов:
-            #    – сначала все старые до left (включая left),
-            #    – затем вставляем factor раз: left + k*width,
-            #    – затем все старые после right, сдвинутые вправо на width*(factor−1).
-            new_cols = orig_cols[: buf_index + 1]  # всё до и включая left
-            for k in range(1, factor + 1):
-                new_cols.append(left + width * k)
-            for old_x in orig_cols[buf_index + 2:]:
-                new_cols.append(old_x + width * (factor - 1))
-            new_cols.sort()
-            cm.columns = new_cols
-
-            # 3) Пересобираем ячейки и рисуем границы
-            cm.update_cells()
-            cm.draw_cell_borders()
-
-            # 4) Словарь для быстрой проверки: (x1,y1)→Cell
-            step = self.cell_size
-            eps = 1e-6
-            cell_by_origin = {}
-            for c in cm.cells:
-                key = (round(c.x1, 6), round(c.y1, 6))
-                cell_by_origin[key] = c
+        orig_lines = cm.columns[:] if is_column_buffer else cm.rows[:]
+        if buf_index >= len(orig_lines) - 1:
+            return
 
-            # 5) Копируем содержимое: для каждой из original_cells
-            for orig_cell in original_cells:
-                x1_o, y1_o = orig_cell.x1, orig_cell.y1
-                x2_o, y2_o = orig_cell.x2, orig_cell.y2
+        start = orig_lines[buf_index]
+        size = orig_lines[buf_index + 1] - start
+
+        # 2) Строим новый список столбцов (строк):
+        #    – сначала все старые до start (включая start),
+        #    – затем вставляем factor раз: start + k*size,
+        #    – затем все старые после буфера, сдвинутые на size*(factor−1)
+        #      (для строк — прибавляем: Y растёт вверх).
+        new_lines = orig_lines[: buf_index + 1]
+        for k in range(1, factor + 1):
+            new_lines.append(start + size * k)
+        for old in orig_lines[buf_index + 2:]:
+            new_lines.append(old + size * (factor - 1))
+        new_lines.sort()
+
+        added, rollback = self._rollback_point()
+        if is_column_buffer:
+            cm.columns = new_lines
+        else:
+            cm.rows = new_lines
 
-                for k in range(1, factor + 1):
-                    dx_own = width * k
+        # 3) Пересобираем ячейки и рисуем границы
+        cm.update_cells()
+        cm.draw_cell_borders()
 
-                    key = (round(x1_o + dx_own, 6), round(y1_o, 6))
-                    if key not in cell_by_origin:
-                        continue
-                    target_cell = cell_by_origin[key]
+        # 4) Словарь для быстрой проверки: (x1,y1)→Cell
+        cell_by_origin = {(round(c.x1, 6), round(c.y1, 6)): c for c in cm.cells}
 
-                    # Перебираем все провода и контакты в сцене
-                    for item in self.scene.items():
-                        if not hasattr(item, "data"):
-                            continue
-                        kind0 = item.data(0)
-
-                        # — Провода (wire)
-                        if kind0 == "wire" and isinstance(item, QtWidgets.QGraphicsLineItem):
-                            ln = item.line()
-                            p1 = QtCore.QPointF(ln.x1(), ln.y1())
-                            p2 = QtCore.QPointF(ln.x2(), ln.y2())
-                            if ((x1_o - eps <= p1.x() <= x2_o + eps and y1_o - eps <= p1.y() <= y2_o + eps) or
-                                    (x1_o - eps <= p2.x() <= x2_o + eps and y1_o - eps <= p2.y() <= y2_o + eps)):
-                                ln_copy = GridSnapLineItem(
-                                    ln.x1() + dx_own, ln.y1(),
-                                    ln.x2() + dx_own, ln.y2(),
-                                    cell_size=step
-                                )
-                                ln_copy.setPen(item.pen())
-                                ln_copy.setData(0, item.data(0))
-                                ln_copy.setData(1, item.data(1))
-                                ln_copy.setData(2, item.data(2))
-                                ln_copy.setFlag(QtWidgets.QGraphicsItem.GraphicsItemFlag.ItemIsSelectable, True)
-                                ln_copy.setFlag(QtWidgets.QGraphicsItem.GraphicsItemFlag.ItemIsMovable, True)
-                                self.scene.addItem(ln_copy)
-                                target_cell.add_element(ln_copy)
-
-                        # — Контакты (contact)
-                        elif kind0 == "contact" and isinstance(item, QtWidgets.QGraphicsEllipseItem):
-                            pos = item.scenePos()
-                            if (x1_o - eps <= pos.x() <= x2_o + eps and y1_o - eps <= pos.y() <= y2_o + eps):
-                                size = item.data(2)
-                                contact_copy = GridSnapEllipseItem(
-                                    -size / 2, -size / 2, size, size, cell_size=step
-                                )
-                                contact_copy.setPos(pos.x() + dx_own, pos.y())
-                                contact_copy.setData(0, item.data(0))
-                                contact_copy.setData(1, item.data(1))
-                                contact_copy.setData(2, size)
-                                pen = QtGui.QPen(item.pen().color())
-                                pen.setWidth(item.pen().width())
-                                contact_copy.setPen(pen)
-                                contact_copy.setBrush(item.brush())
-                                contact_copy.setFlag(QtWidgets.QGraphicsItem.GraphicsItemFlag.ItemIsSelectable, True)
-                                contact_copy.setFlag(QtWidgets.QGraphicsItem.GraphicsItemFlag.ItemIsMovable, True)
-                                self.scene.addItem(contact_copy)
-                                target_cell.add_element(contact_copy)
-
-                    target_cell.draw_border(self.scene)
+        # 5) Источники копирования собираем до начала копирования,
+        #    чтобы созданные копии не копировались повторно
+        eps = 1e-6
+        index = self.spatial_index()
+
+        jobs = []
+        for orig_cell in original_cells:
+            # Провода с концом в ячейке и контакты с центром в ней — по R-дереву
+            rect = (orig_cell.x1 - eps, orig_cell.y1 - eps, orig_cell.x2 + eps, orig_cell.y2 + eps)
+            found, seen = [], set()
+            for item, _, _ in index.endpoints_in(rect):
+                if not isinstance(item, tuple) and id(item) not in seen:
+                    seen.add(id(item))
+                    found.append(item)
+            src_wires = [item for item in found if item.data(0) == "wire"]
+            src_contacts = [item for item in found if item.data(0) == "contact"]
 
+            for k in range(1, factor + 1):
+                dx, dy = (size * k, 0) if is_column_buffer else (0, size * k)
+                key = (round(orig_cell.x1 + dx, 6), round(orig_cell.y1 + dy, 6))
+                if key in cell_by_origin:
+                    jobs.append((cell_by_origin[key], dx, dy, src_wires, src_contacts))
+
+        def work():
+            for n, (target_cell, dx, dy, src_wires, src_contacts) in enumerate(jobs, 1):
+                for item in src_wires:
+                    ln_copy = self._copy_wire_item(item, dx, dy)
+                    added.append(ln_copy)
+                    target_cell.add_element(ln_copy)
+                for item in src_contacts:
+                    contact_copy = self._copy_contact_item(item, dx, dy)
+                    added.append(contact_copy)
+                    target_cell.add_element(contact_copy)
+
+                added.append(target_cell.draw_border(self.scene))
+                yield n, len(jobs)
+
+        def done():
             # 6) Обновляем распределение элементов по ячейкам
             cm.assign_elements_to_cells()
 
             # 7) Перерисовываем «буферы» (CellComment)
             self.cell_comment_manager.update_comments(cm.columns, cm.rows)
-            return
-
-        ### ==  Матрицирование по строкам  (horizontal buffer)  == ###
-        if is_row_buffer:
-            orig_rows = cm.rows[:]
-            if buf_index >= len(orig_rows) - 1:
-                return
-
-            bottom = orig_rows[buf_index]
-            top = orig_rows[buf_index + 1]
-            height = top - bottom
-
-            # 2) Строим новый список строк:
-            #    – сначала все старые до bottom (включая bottom),
-            #    – затем вставляем factor раз: bottom + k*height,
-            #    – затем все старые после top, сдвинутые вверх (+=) на height*(factor−1).
-            new_rows = orig_rows[: buf_index + 1]
-            for k in range(1, factor + 1):
-                new_rows.append(bottom + height * k)
-            for old_y in orig_rows[buf_index + 2:]:
-                # ВНИМАНИЕ: здесь прибавляем, а не вычитаем!
-                new_rows.append(old_y + height * (factor - 1))
-            new_rows.sort()
-            cm.rows = new_rows
-
-            # 3) Пересобираем ячейки и рисуем границы
-            cm.update_cells()
-            cm.draw_cell_borders()
-
-            # 4) Словарь для быстрого поиска ячейки по координате (x1,y1)
-            step = self.cell_size
-            eps = 1e-6
-            cell_by_origin = {}
-            for c in cm.cells:
-                key = (round(c.x1, 6), round(c.y1, 6))
-                cell_by_origin[key] = c
-
-            # 5) Для каждой исходной ячейки копируем содержимое «вниз»
-            for orig_cell in original_cells:
-                x1_o, y1_o = orig_cell.x1, orig_cell.y1
-                x2_o, y2_o = orig_cell.x2, orig_cell.y2
-
-                for k in range(1, factor + 1):
-                    dx_own = 0
-                    dy_own = height * k  # ПОМНИМ: растёт Y вверх, поэтому «перенос вниз» → прибавляем
-
-                    key = (round(x1_o, 6), round(y1_o + dy_own, 6))
-                    if key not in cell_by_origin:
-                        continue
-                    target_cell = cell_by_origin[key]
-
-                    for item in self.scene.items():
-                        if not hasattr(item, "data"):
-                            continue
-                        kind0 = item.data(0)
-
-                        # — Провода
-                        if kind0 == "wire" and isinstance(item, QtWidgets.QGraphicsLineItem):
-                            ln = item.line()
-                            p1 = QtCore.QPointF(ln.x1(), ln.y1())
-                            p2 = QtCore.QPointF(ln.x2(), ln.y2())
-                            if ((x1_o - eps <= p1.x() <= x2_o + eps and y1_o - eps <= p1.y() <= y2_o + eps) or
-                                    (x1_o - eps <= p2.x() <= x2_o + eps and y1_o - eps <= p2.y() <= y2_o + eps)):
-                                ln_copy = GridSnapLineItem(
-                                    ln.x1() + dx_own, ln.y1() + dy_own,
-                                    ln.x2() + dx_own, ln.y2() + dy_own,
-                                    cell_size=step
-                                )
-                                ln_copy.setPen(item.pen())
-                                ln_copy.setData(0, item.data(0))
-                                ln_copy.setData(1, item.data(1))
-                                ln_copy.setData(2, item.data(2))
-                                ln_copy.setFlag(QtWidgets.QGraphicsItem.GraphicsItemFlag.ItemIsSelectable, True)
-                                ln_copy.setFlag(QtWidgets.QGraphicsItem.GraphicsItemFlag.ItemIsMovable, True)
-                                self.scene.addItem(ln_copy)
-                                target_cell.add_element(ln_copy)
-
-                        # — Контакты
-                        elif kind0 == "contact" and isinstance(item, QtWidgets.QGraphicsEllipseItem):
-                            pos = item.scenePos()
-                            if (x1_o - eps <= pos.x() <= x2_o + eps and y1_o - eps <= pos.y() <= y2_o + eps):
-                                size = item.data(2)
-                                contact_copy = GridSnapEllipseItem(
-                                    -size / 2, -size / 2, size, size, cell_size=step
-                                )
-                                contact_copy.setPos(pos.x() + dx_own, pos.y() + dy_own)
-                                contact_copy.setData(0, item.data(0))
-                                contact_copy.setData(1, item.data(1))
-                                contact_copy.setData(2, size)
-                                pen = QtGui.QPen(item.pen().color())
-                                pen.setWidth(item.pen().width())
-                                contact_copy.setPen(pen)
-                                contact_copy.setBrush(item.brush())
-                                contact_copy.setFlag(QtWidgets.QGraphicsItem.GraphicsItemFlag.ItemIsSelectable, True)
-                                contact_copy.setFlag(QtWidgets.QGraphicsItem.GraphicsItemFlag.ItemIsMovable, True)
-                                self.scene.addItem(contact_copy)
-                                target_cell.add_element(contact_copy)
-
-                    target_cell.draw_border(self.scene)
-
-            # 6) Обновляем распределение элементов
-            cm.assign_elements_to_cells()
-
-            # 7) Перерисовываем «буферы»
-            self.cell_comment_manager.update_comments(cm.columns, cm.rows)
-            return
+            self.notify_model_change("reset")
+
+        self.run_chunked("Матрицирование буфера", work(), done, rollback, perf_name="matrixing",
+                         bulk=True)
+
+    def _copy_wire_item(self, item, dx, dy):
+        """Копия провода, сдвинутая на (dx, dy), добавленная на сцену"""
+        ln = item.line()
+        cls = GridSnapLineItemWithDots if isinstance(item, GridSnapLineItemWithDots) else GridSnapLineItem
+        ln_copy = cls(
+            ln.x1() + dx, ln.y1() + dy,
+            ln.x2() + dx, ln.y2() + dy,
+            cell_size=self.cell_size
+        )
+        ln_copy.setPen(item.pen())
+        ln_copy.setData(0, item.data(0))
+        ln_copy.setData(1, item.data(1))
+        ln_copy.setData(2, item.data(2))
+        ln_copy.setFlag(QtWidgets.QGraphicsItem.GraphicsItemFlag.ItemIsSelectable, True)
+        ln_copy.setFlag(QtWidgets.QGraphicsItem.GraphicsItemFlag.ItemIsMovable, True)
+        self.scene.addItem(ln_copy)
+        return ln_copy
+
+    def _copy_contact_item(self, item, dx, dy):
+        """Копия контакта, сдвинутая на (dx, dy), добавленная на сцену"""
+        pos = item.scenePos()
+        size = item.data(2)
+        contact_copy = GridSnapEllipseItem(
+            -size / 2, -size / 2, size, size, cell_size=self.cell_size
+        )
+        contact_copy.setPos(pos.x() + dx, pos.y() + dy)
+        contact_copy.setData(0, item.data(0))
+        contact_copy.setData(1, item.data(1))
+        contact_copy.setData(2, size)
+        contact_copy.setPen(item.pen())
+        contact_copy.setBrush(item.brush())
+        contact_copy.setFlag(QtWidgets.QGraphicsItem.GraphicsItemFlag.ItemIsSelectable, True)
+        contact_copy.setFlag(QtWidgets.QGraphicsItem.GraphicsItemFlag.ItemIsMovable, True)
+        self.scene.addItem(contact_copy)
+        return contact_copy
 
     def show_comment_properties(self, comment):
         self.clear_properties_panel()
@@ -979,39 +2094,135 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
     def show_cell_elements_properties(self, cell):
         """
         Отображает спецификацию всех элементов ячейки с координатами относительно ячейки
-        в формате, похожем на C++.
-        Координаты отсчитываются от левого нижнего угла ячейки (cell.x1, cell.y1).
+        в формате, похожем на C++ (см. build_cell_spec).
         """
-        # Определяем прямоугольник ячейки
-        rect = QtCore.QRectF(cell.x1, cell.y1, cell.x2 - cell.x1, cell.y2 - cell.y1)
+        spec_text, (n_transistors, n_contacts, n_wires) = self.build_cell_spec(cell)
 
-        # Получаем левый нижний угол ячейки как точку отсчета
-        cell_origin = QtCore.QPointF(cell.x1, cell.y1)
+        # Создаем диалоговое окно с возможностью копирования текста
+        dialog = QtWidgets.QDialog(self)
+        dialog.setWindowTitle(f"Шаблон ячейки {cell.name}")
+        dialog.setModal(True)
+        dialog.resize(800, 600)
 
-        # Списки для хранения разных типов элементов
-        transistor_specs = []
-        contact_specs = []
-        wire_specs = []
+        layout = QtWidgets.QVBoxLayout(dialog)
 
-        # Перебираем все элементы на сцене
-        for item in self.scene.items():
-            # Проверяем, есть ли у элемента данные и какого он типа
-            if not hasattr(item, "data"):
-                continue
-            kind = item.data(0)
+        # Информация о ячейке
+        total_elements = n_transistors + n_contacts + n_wires
+        # Размеры в единицах сетки
+        cell_width_units = (cell.x2 - cell.x1) / 40.0
+        cell_height_units = (cell.y2 - cell.y1) / 40.0
 
-            # Обрабатываем только провода, контакты и транзисторы
-            if kind not in ["wire", "contact", "transistor"]:
-                continue
+        info_label = QtWidgets.QLabel(
+            f"Ячейка: {cell.name}\n"
+            f"Границы: ({cell.x1:.2f}, {cell.y1:.2f}) - ({cell.x2:.2f}, {cell.y2:.2f}) [пиксели]\n"
+            f"Размер: {cell_width_units:.2f} x {cell_height_units:.2f} [единицы сетки]\n"
+            f"Элементов: {total_elements} (T: {n_transistors}, C: {n_contacts}, W: {n_wires})"
+        )
+        info_label.setStyleSheet("QLabel { background-color: #f0f0f0; padding: 10px; border: 1px solid #ccc; }")
+        layout.addWidget(info_label)
 
-            # Проверяем, принадлежит ли элемент данной ячейке
-            element_in_cell = False
+        # Текстовое поле для отображения спецификации
+        text_edit = QtWidgets.QTextEdit()
+        text_edit.setPlainText(spec_text)
+        text_edit.setReadOnly(True)
+        text_edit.setFont(QtGui.QFont("Courier", 9))  # Моноширинный шрифт для лучшего отображения
+        layout.addWidget(text_edit)
 
-            if kind == "wire" and isinstance(item, QtWidgets.QGraphicsLineItem):
-                ln = item.line()
-                p1 = item.mapToScene(QtCore.QPointF(ln.x1(), ln.y1()))
-                p2 = item.mapToScene(QtCore.QPointF(ln.x2(), ln.y2()))
-                element_in_cell = rect.contains(p1) or rect.contains(p2)
+        # Кнопки
+        button_layout = QtWidgets.QHBoxLayout()
+
+        copy_button = QtWidgets.QPushButton("Копировать в буфер")
+        copy_button.clicked.connect(lambda: QtWidgets.QApplication.clipboard().setText(spec_text))
+        button_layout.addWidget(copy_button)
+
+        save_button = QtWidgets.QPushButton("Сохранить в файл")
+
+        def save_to_file():
+            file_path, _ = QtWidgets.QFileDialog.getSaveFileName(
+                dialog,
+                "Сохранить layout спецификацию",
+                f"{cell.name}_layout.cpp",
+                "C++ files (*.cpp *.h);;Text files (*.txt);;All files (*.*)"
+            )
+            if file_path:
+                try:
+                    with open(file_path, 'w', encoding='utf-8') as f:
+                        f.write(spec_text)
+                    QtWidgets.QMessageBox.information(dialog, "Успех", f"Layout спецификация сохранена в {file_path}")
+                except Exception as e:
+                    QtWidgets.QMessageBox.critical(dialog, "Ошибка", f"Не удалось сохранить файл:\n{str(e)}")
+
+        save_button.clicked.connect(save_to_file)
+        button_layout.addWidget(save_button)
+
+        close_button = QtWidgets.QPushButton("Закрыть")
+        close_button.clicked.connect(dialog.accept)
+        button_layout.addWidget(close_button)
+
+        layout.addLayout(button_layout)
+
+        dialog.exec()
+
+    @materialized
+    @timed("build_cell_spec")
+    def build_cell_spec(self, cell):
+        """
+        Формирует C++-спецификацию элементов ячейки.
+        Координаты отсчитываются от левого нижнего угла ячейки (cell.x1, cell.y1).
+        Возвращает (текст, (транзисторов, контактов, проводов)).
+        """
+        # Определяем прямоугольник ячейки
+        rect = QtCore.QRectF(cell.x1, cell.y1, cell.x2 - cell.x1, cell.y2 - cell.y1)
+
+        # Получаем левый нижний угол ячейки как точку отсчета
+        cell_origin = QtCore.QPointF(cell.x1, cell.y1)
+
+        # Списки для хранения разных типов элементов
+        transistor_specs = []
+        contact_specs = []
+        wire_specs = []
+        clip = self.clip_exports
+        clipped_wires = []  # (элемент, p1, p2) — обрезаются все разом после обхода
+
+        def wire_spec(item, p1, p2):
+            # Координаты концов линии относительно левого нижнего угла ячейки
+            p1_rel = p1 - cell_origin
+            p2_rel = p2 - cell_origin
+
+            # Преобразуем координаты в единицы сетки (делим на self.step = 40)
+            p1_x_units = p1_rel.x() / 40.0
+            p1_y_units = p1_rel.y() / 40.0
+            p2_x_units = p2_rel.x() / 40.0
+            p2_y_units = p2_rel.y() / 40.0
+
+            material = item.data(1) or "M2"  # Материал (по умолчанию M2)
+            logic_width = item.data(2) or -3  # Логическая толщина (по умолчанию -3)
+
+            return f'WIRE({material}, {logic_width}, {p1_x_units:.2f}, {p1_y_units:.2f}, {p2_x_units:.2f}, {p2_y_units:.2f});'
+
+        # Перебираем все элементы на сцене
+        for item in self.scene.items():
+            # Проверяем, есть ли у элемента данные и какого он типа
+            if not hasattr(item, "data"):
+                continue
+            kind = item.data(0)
+
+            # Обрабатываем только провода, контакты и транзисторы
+            if kind not in ["wire", "contact", "transistor"]:
+                continue
+
+            # Проверяем, принадлежит ли элемент данной ячейке
+            element_in_cell = False
+
+            if kind == "wire" and isinstance(item, QtWidgets.QGraphicsLineItem):
+                ln = item.line()
+                p1 = item.mapToScene(QtCore.QPointF(ln.x1(), ln.y1()))
+                p2 = item.mapToScene(QtCore.QPointF(ln.x2(), ln.y2()))
+                if clip:
+                    # Принадлежность и геометрию даст обрезка по ячейке
+                    clipped_wires.append((item, p1, p2))
+                    continue
+                element_in_cell = rect.contains(p1) or rect.contains(p2)
 
             elif kind == "contact" and isinstance(item, QtWidgets.QGraphicsEllipseItem):
                 pos = item.scenePos()
@@ -1029,21 +2240,7 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
 
             # Формируем спецификацию элемента с координатами относительно ячейки
             if kind == "wire":
-                # Координаты концов линии относительно левого нижнего угла ячейки
-                p1_rel = p1 - cell_origin
-                p2_rel = p2 - cell_origin
-
-                # Преобразуем координаты в единицы сетки (делим на self.step = 40)
-                p1_x_units = p1_rel.x() / 40.0
-                p1_y_units = p1_rel.y() / 40.0
-                p2_x_units = p2_rel.x() / 40.0
-                p2_y_units = p2_rel.y() / 40.0
-
-                material = item.data(1) or "M2"  # Материал (по умолчанию M2)
-                logic_width = item.data(2) or -3  # Логическая толщина (по умолчанию -3)
-
-                spec = f'WIRE({material}, {logic_width}, {p1_x_units:.2f}, {p1_y_units:.2f}, {p2_x_units:.2f}, {p2_y_units:.2f});'
-                wire_specs.append(spec)
+                wire_specs.append(wire_spec(item, p1, p2))
 
 
             elif kind == "contact":
@@ -1125,6 +2322,16 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
                 spec = f'W(1.00) L({line_length_units:.2f}) OR({direction}) {ttype}({transistor_x_units:.2f}, {transistor_y_units:.2f});'
                 transistor_specs.append(spec)
 
+        if clipped_wires:
+            segments = clip_segments(
+                [(p1.x(), p1.y(), p2.x(), p2.y()) for _, p1, p2 in clipped_wires],
+                (cell.x1, cell.y1, cell.x2, cell.y2)
+            )
+            for (item, _, _), segment in zip(clipped_wires, segments):
+                if segment is not None:
+                    x1, y1, x2, y2 = segment
+                    wire_specs.append(wire_spec(item, QtCore.QPointF(x1, y1), QtCore.QPointF(x2, y2)))
+
         # Формируем итоговый текст в C++ стиле
         cell_width = (cell.x2 - cell.x1) / 40.0  # Преобразуем в единицы сетки
         cell_height = (cell.y2 - cell.y1) / 40.0  # Преобразуем в единицы сетки
@@ -1168,71 +2375,7 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
         cpp_lines.append('}')
 
         spec_text = '\n'.join(cpp_lines)
-
-        # Создаем диалоговое окно с возможностью копирования текста
-        dialog = QtWidgets.QDialog(self)
-        dialog.setWindowTitle(f"Шаблон ячейки {cell.name}")
-        dialog.setModal(True)
-        dialog.resize(800, 600)
-
-        layout = QtWidgets.QVBoxLayout(dialog)
-
-        # Информация о ячейке
-        total_elements = len(transistor_specs) + len(contact_specs) + len(wire_specs)
-        # Размеры в единицах сетки
-        cell_width_units = (cell.x2 - cell.x1) / 40.0
-        cell_height_units = (cell.y2 - cell.y1) / 40.0
-
-        info_label = QtWidgets.QLabel(
-            f"Ячейка: {cell.name}\n"
-            f"Границы: ({cell.x1:.2f}, {cell.y1:.2f}) - ({cell.x2:.2f}, {cell.y2:.2f}) [пиксели]\n"
-            f"Размер: {cell_width_units:.2f} x {cell_height_units:.2f} [единицы сетки]\n"
-            f"Элементов: {total_elements} (T: {len(transistor_specs)}, C: {len(contact_specs)}, W: {len(wire_specs)})"
-        )
-        info_label.setStyleSheet("QLabel { background-color: #f0f0f0; padding: 10px; border: 1px solid #ccc; }")
-        layout.addWidget(info_label)
-
-        # Текстовое поле для отображения спецификации
-        text_edit = QtWidgets.QTextEdit()
-        text_edit.setPlainText(spec_text)
-        text_edit.setReadOnly(True)
-        text_edit.setFont(QtGui.QFont("Courier", 9))  # Моноширинный шрифт для лучшего отображения
-        layout.addWidget(text_edit)
-
-        # Кнопки
-        button_layout = QtWidgets.QHBoxLayout()
-
-        copy_button = QtWidgets.QPushButton("Копировать в буфер")
-        copy_button.clicked.connect(lambda: QtWidgets.QApplication.clipboard().setText(spec_text))
-        button_layout.addWidget(copy_button)
-
-        save_button = QtWidgets.QPushButton("Сохранить в файл")
-
-        def save_to_file():
-            file_path, _ = QtWidgets.QFileDialog.getSaveFileName(
-                dialog,
-                "Сохранить layout спецификацию",
-                f"{cell.name}_layout.cpp",
-                "C++ files (*.cpp *.h);;Text files (*.txt);;All files (*.*)"
-            )
-            if file_path:
-                try:
-                    with open(file_path, 'w', encoding='utf-8') as f:
-                        f.write(spec_text)
-                    QtWidgets.QMessageBox.information(dialog, "Успех", f"Layout спецификация сохранена в {file_path}")
-                except Exception as e:
-                    QtWidgets.QMessageBox.critical(dialog, "Ошибка", f"Не удалось сохранить файл:\n{str(e)}")
-
-        save_button.clicked.connect(save_to_file)
-        button_layout.addWidget(save_button)
-
-        close_button = QtWidgets.QPushButton("Закрыть")
-        close_button.clicked.connect(dialog.accept)
-        button_layout.addWidget(close_button)
-
-        layout.addLayout(button_layout)
-
-        dialog.exec()
+        return spec_text, (len(transistor_specs), len(contact_specs), len(wire_specs))
 
     def save_as(self, text, cell_name=None):
         """
@@ -1249,7 +2392,7 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
             try:
                 with open(file_name, 'w', encoding='utf-8') as f:
                     f.write(text)
-                print(f"Спецификация сохранена в {file_name}")
+                log_io.info("Спецификация сохранена в %s", file_name)
             except Exception as e:
                 QtWidgets.QMessageBox.critical(self, "Ошибка", f"Не удалось сохранить файл: {e}")
 
@@ -1345,6 +2488,7 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
 
         self.properties_layout.addStretch()
 
+    @materialized
     def show_cell_properties_dialog(self, cell):
         rect = QtCore.QRectF(cell.x1, cell.y1, cell.x2 - cell.x1, cell.y2 - cell.y1)
         step = self.step  # обычно 40
@@ -1465,7 +2609,7 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
           cell22right--btm--0
           cell22right--top--<y2-y1>
         """
-        print(f"\n=== Отладка show_vline_specification для ячейки {cell.name} ===")
+        log_vlines.debug("show_vline_specification для ячейки %s", cell.name)
 
         # 1) Сначала ищем реальные vline-элементы, привязанные к этой ячейке
         found = []
@@ -1497,7 +2641,7 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
                 x1, y1 = p1_scene.x(), p1_scene.y()
                 x2, y2 = p2_scene.x(), p2_scene.y()
             except Exception as e:
-                print(f"Ошибка при получении координат vline {full_name}: {e}")
+                log_vlines.warning("Ошибка при получении координат vline %s: %s", full_name, e)
                 continue
 
             # Вычисляем локальную координату относительно (cell.x1, cell.y1)
@@ -1509,12 +2653,12 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
                 val = (x1 + x2) / 2 - cell.x1
             else:
                 # По умолчанию (для безопасности)
-                print(f"Неизвестный edge_type {edge_type} для {full_name}, используем x")
+                log_vlines.warning("Неизвестный edge_type %s для %s, используем x", edge_type, full_name)
                 val = (x1 + x2) / 2 - cell.x1
 
             found.append((full_name, edge_type, val))
 
-        print(f"  Всего найдено подходящих vline: {len(found)}")
+        log_vlines.debug("Всего найдено подходящих vline: %d", len(found))
 
         # 2) Добавляем «собственные» границы ячейки (8 строк).
         # Координаты относительно (cell.x1, cell.y1):
@@ -1574,13 +2718,14 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
 
         dlg.exec()
 
+    @materialized
     def cell_creation(self, cell):
         """
         Удаляет текущую ячейку, открывает диалог для выбора .cpp-файла со спецификацией,
         парсит его и создаёт новую ячейку с границами, виртуальными линиями, проводами,
         контактами и транзисторами из этой спецификации.
         """
-        print(f"\n=== Отладка cell_creation для ячейки {cell.name} ===")
+        log_cells.debug("cell_creation для ячейки %s", cell.name)
 
         # 1) Удаляем текущую ячейку (границы и все её элементы)
         if hasattr(self, "cell_manager") and self.cell_manager is not None:
@@ -1597,7 +2742,7 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
             "C++ файлы (*.cpp);;Все файлы (*)"
         )
         if not file_name:
-            print("Файл не выбран")
+            log_cells.info("Файл не выбран")
             return
 
         # 3) Читаем содержимое файла
@@ -1713,103 +2858,113 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
 
         # 9) Добавляем в CellManager
         if hasattr(self, "cell_manager") and self.cell_manager is not None:
+            added, rollback = self._rollback_point()
             self.cell_manager.add_cell(new_cell)
         else:
             QtWidgets.QMessageBox.critical(self, "Ошибка", "CellManager не найден")
             return
 
-        # 10) Рисуем в сцене виртуальные линии, провода, контакты, транзисторы
+        # 10) Рисуем в сцене виртуальные линии, провода, контакты, транзисторы —
+        #     порциями, по одному элементу на шаг
+        total = len(vlines) + len(wires) + len(contacts) + len(transistors)
 
-        # 10.1) Виртуальные линии
-        for name, axis, val in vlines:
-            if axis == 'x':
-                # Горизонтальная: (x=val, y=y_min) → (x=val, y=y_max)
-                line_item = QtWidgets.QGraphicsLineItem(val, y_min, val, y_max)
-            else:
-                # Вертикальная: (x=x_min, y=val) → (x=x_max, y=val)
-                line_item = QtWidgets.QGraphicsLineItem(x_min, val, x_max, val)
-
-            line_item.setData(0, "vline")
-            line_item.setData(1, name)
-            pen = QtGui.QPen(QtGui.QColor("red"))
-            pen.setWidth(1)
-            pen.setStyle(QtCore.Qt.PenStyle.DashLine)
-            line_item.setPen(pen)
-            self.scene.addItem(line_item)
-            # Регистрируем пересечения
-            self.cell_manager.register_vline_intersections(line_item)
-
-        # 10.2) Провода
-        for mat, width_val, x1, y1, x2, y2 in wires:
-            wire_item = GridSnapLineItem(x1, y1, x2, y2, cell_size=self.cell_size)
-            wire_item.setData(0, "wire")
-            wire_item.setData(1, mat)
-            wire_item.setData(2, width_val)
-            # Применяем стиль провода (аналогично show_line_properties)
-            if mat in self.LINE_MATERIALS:
-                self.set_line_style(wire_item, mat, width_val)
-            else:
-                pen = QtGui.QPen(QtGui.QColor("black"))
-                pen.setWidth(max(1, abs(width_val)))
-                pen.setStyle(QtCore.Qt.PenStyle.SolidLine)
-                wire_item.setPen(pen)
-
-            self.scene.addItem(wire_item)
-
-        # 10.3) Контакты
-        contact_size = 10  # фиксированный пиксельный размер (можно вынести в параметр)
-        for mat, x, y in contacts:
-            ellipse = GridSnapEllipseItem(-contact_size / 2, -contact_size / 2, contact_size, contact_size,
-                                          cell_size=self.cell_size)
-            ellipse.setPos(QtCore.QPointF(x, y))
-            if mat in self.CONTACT_MATERIALS:
-                params = self.CONTACT_MATERIALS[mat]
-                ellipse.setBrush(QtGui.QBrush(QtGui.QColor(params["color"])))
-                ellipse.setZValue(params["z"])
-            else:
-                ellipse.setBrush(QtGui.QBrush(QtGui.QColor("black")))
-                ellipse.setZValue(5)
-
-            ellipse.setData(0, "contact")
-            ellipse.setData(1, mat)
-            ellipse.setData(2, contact_size)
-            pen = QtGui.QPen(QtGui.QColor("black"))
-            pen.setWidth(1)
-            ellipse.setPen(pen)
-            self.scene.addItem(ellipse)
-
-        # 10.4) Транзисторы
-        for w_val, l_val, direction, ttype, x, y in transistors:
-            # Преобразуем длину L из «логических единиц» в пиксели:
-            # В спецификации L(<l_val>) задаётся в «grid-единицах» (то есть 1.00 = 40 пикселей),
-            # поэтому:
-            line_length_pixels = l_val * self.step
-            t_item = TransistorItem(
-                cell_size=self.cell_size,
-                line_length=line_length_pixels,
-                ttype=ttype,
-                direction=direction
-            )
-            # Точка привязки TransistorItem — это центр нижней грани квадрата →
-            # поэтому при создании нам нужно поставить его так, чтобы точка (0,0) внутри
-            # TransistorItem («центр низа») оказалась в (x, y) в сценных координатах.
-            # У TransistorItem локально квадрат рисуется от (-20,0) до (+20,40) (step=40),
-            # а точка привязки — (0,0), так что достаточно:
-            t_item.setPos(QtCore.QPointF(x, y))
-            t_item.setData(0, "transistor")
-            self.scene.addItem(t_item)
-
-        # 11) Перераспределяем элементы по ячейкам и рисуем их границы
-        if hasattr(self, "cell_manager") and self.cell_manager is not None:
+        def work():
+            n = 0
+
+            # 10.1) Виртуальные линии
+            for name, axis, val in vlines:
+                if axis == 'x':
+                    # Горизонтальная: (x=val, y=y_min) → (x=val, y=y_max)
+                    line_item = QtWidgets.QGraphicsLineItem(val, y_min, val, y_max)
+                else:
+                    # Вертикальная: (x=x_min, y=val) → (x=x_max, y=val)
+                    line_item = QtWidgets.QGraphicsLineItem(x_min, val, x_max, val)
+
+                line_item.setData(0, "vline")
+                line_item.setData(1, name)
+                line_item.setPen(STYLES.pen("red", 1, QtCore.Qt.PenStyle.DashLine))
+                self.scene.addItem(line_item)
+                added.append(line_item)
+                # Регистрируем пересечения
+                self.cell_manager.register_vline_intersections(line_item)
+                n += 1
+                yield n, total
+
+            # 10.2) Провода
+            for mat, width_val, x1, y1, x2, y2 in wires:
+                wire_item = GridSnapLineItem(x1, y1, x2, y2, cell_size=self.cell_size)
+                wire_item.setData(0, "wire")
+                wire_item.setData(1, mat)
+                wire_item.setData(2, width_val)
+                # Применяем стиль провода (аналогично show_line_properties)
+                if mat in self.LINE_MATERIALS:
+                    self.set_line_style(wire_item, mat, width_val)
+                else:
+                    wire_item.setPen(STYLES.line_pen(mat, max(1, abs(width_val))))
+
+                self.scene.addItem(wire_item)
+                added.append(wire_item)
+                n += 1
+                yield n, total
+
+            # 10.3) Контакты
+            contact_size = 10  # фиксированный пиксельный размер (можно вынести в параметр)
+            for mat, x, y in contacts:
+                ellipse = GridSnapEllipseItem(-contact_size / 2, -contact_size / 2, contact_size, contact_size,
+                                              cell_size=self.cell_size)
+                ellipse.setPos(QtCore.QPointF(x, y))
+                ellipse.setBrush(STYLES.contact_brush(mat))
+                ellipse.setZValue(STYLES.contact_params(mat)["z"])
+
+                ellipse.setData(0, "contact")
+                ellipse.setData(1, mat)
+                ellipse.setData(2, contact_size)
+                ellipse.setPen(STYLES.outline_pen())
+                self.scene.addItem(ellipse)
+                added.append(ellipse)
+                n += 1
+                yield n, total
+
+            # 10.4) Транзисторы
+            for w_val, l_val, direction, ttype, x, y in transistors:
+                # Преобразуем длину L из «логических единиц» в пиксели:
+                # В спецификации L(<l_val>) задаётся в «grid-единицах» (то есть 1.00 = 40 пикселей),
+                # поэтому:
+                line_length_pixels = l_val * self.step
+                t_item = TransistorItem(
+                    cell_size=self.cell_size,
+                    line_length=line_length_pixels,
+                    ttype=ttype,
+                    direction=direction
+                )
+                # Точка привязки TransistorItem — это центр нижней грани квадрата →
+                # поэтому при создании нам нужно поставить его так, чтобы точка (0,0) внутри
+                # TransistorItem («центр низа») оказалась в (x, y) в сценных координатах.
+                # У TransistorItem локально квадрат рисуется от (-20,0) до (+20,40) (step=40),
+                # а точка привязки — (0,0), так что достаточно:
+                t_item.setPos(QtCore.QPointF(x, y))
+                t_item.setData(0, "transistor")
+                self.scene.addItem(t_item)
+                added.append(t_item)
+                n += 1
+                yield n, total
+
+        def done():
+            # 11) Перераспределяем элементы по ячейкам и рисуем их границы
             self.cell_manager.assign_elements_to_cells()
             self.cell_manager.draw_cell_borders()
 
-        # 12) Обновляем панель свойств (чтобы ничего не осталось выделенным старого)
-        self.update_properties_panel()
+            # 12) Обновляем панель свойств (чтобы ничего не осталось выделенным старого)
+            self.update_properties_panel()
+            self.notify_model_change("reset")
+
+            QtWidgets.QMessageBox.information(self, "Успех", f"Ячейка «{cell_name}» создана успешно")
+            log_cells.info("Ячейка «%s» создана", cell_name)
 
-        QtWidgets.QMessageBox.information(self, "Успех", f"Ячейка «{cell_name}» создана успешно")
-        print(f"Ячейка «{cell_name}» создана")
+        self.run_chunked(f"Создание ячейки «{cell_name}»", work(), done, rollback,
+                         perf_name="cell_creation", bulk=True)
 
+    @materialized
     def copy_cell(self, original_cell, direction="offset"):
         # Вычисляем координаты новой ячейки в зависимости от направления
         if direction == "x":
@@ -1878,7 +3033,7 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
         # Отобразим границу скопированной ячейки
         new_cell.draw_border(self.scene)
 
-        print(f"Ячейка скопирована: ({new_cell.x1}, {new_cell.y1}) – ({new_cell.x2}, {new_cell.y2})")
+        log_cells.info("Ячейка скопирована: (%s, %s) – (%s, %s)", new_cell.x1, new_cell.y1, new_cell.x2, new_cell.y2)
 
         if hasattr(self, 'cell_manager'):
             self.cell_manager.cells.append(new_cell)
@@ -1888,6 +3043,7 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
                 self.cell_manager.columns,
                 self.cell_manager.rows
             )
+        self.notify_model_change("reset")
 
     def show_transistor_properties(self, transistor):
         """
@@ -1963,6 +3119,7 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
 
             # Принудительно обновляем элемент
             transistor.update()
+            self.notify_model_change("update", [transistor])
 
         length_spin.valueChanged.connect(on_length_changed)
         self.property_widgets["trans_length"] = length_spin
@@ -1980,6 +3137,7 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
         def on_type_changed():
             transistor.ttype = type_combo.currentText()
             transistor.update()
+            self.notify_model_change("update", [transistor])
 
         type_combo.currentIndexChanged.connect(on_type_changed)
         self.property_widgets["trans_type"] = type_combo
@@ -2033,6 +3191,7 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
 
             # Принудительно обновляем элемент
             transistor.update()
+            self.notify_model_change("update", [transistor])
 
         direction_combo.currentIndexChanged.connect(on_direction_changed)
         self.property_widgets["trans_direction"] = direction_combo
@@ -2086,13 +3245,10 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
             if material in self.LINE_MATERIALS:
                 self.set_line_style(line_item, material, logic_width)
             else:
-                # Для пользовательских материалов можно задать стандартный стиль
-                # Например, сплошная линия с базовой толщиной
-                pen = QtGui.QPen()
-                pen.setColor(QtGui.QColor("black"))
-                pen.setWidth(max(1, logic_width))
-                pen.setStyle(QtCore.Qt.PenStyle.SolidLine)
-                line_item.setPen(pen)
+                # Для пользовательских материалов — сплошная чёрная линия с базовой толщиной
+                line_item.setPen(STYLES.line_pen(material, max(1, logic_width)))
+
+            self.notify_model_change("update", [line_item])
 
         # Обрабатываем как изменение индекса, так и редактирование текста
         material_combo.currentIndexChanged.connect(update_line)
@@ -2131,7 +3287,7 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
                     if new_name:  # Разрешаем пустые имена, если нужно
                         line_item.setData(1, new_name)
                 except Exception as e:
-                    print(f"Ошибка при переименовании виртуальной линии: {e}")
+                    log_vlines.error("Ошибка при переименовании виртуальной линии: %s", e)
 
             name_edit.editingFinished.connect(rename_vline)
 
@@ -2143,7 +3299,7 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
             self.properties_layout.addStretch()
 
         except Exception as e:
-            print(f"Ошибка в show_vline_properties: {e}")
+            log_ui.error("Ошибка в show_vline_properties: %s", e)
             self.clear_properties_panel()
 
     def show_vline_controls(self):
@@ -2187,6 +3343,8 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
 
     def set_tool(self, tool_id):
         self.clear_properties_panel()
+        if tool_id != "net":
+            self.clear_net_highlight()
         self.current_tool = tool_id
         if tool_id == "vline":
             self.show_vline_controls()
@@ -2194,93 +3352,20 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
             self.properties_label.show()
         else:
             self.properties_label.hide()
-        print(f"Выбран инструмент: {tool_id}")
-
-    def draw_grid(self):
-        light_pen = QtGui.QPen(QtGui.QColor("#e8eaed"))
-        light_pen.setWidth(0)
-
-        dark_pen = QtGui.QPen(QtGui.QColor("lightgray"))
-        dark_pen.setWidth(0)
-
-        for x in range(-4000, 8000, self.cell_size):
-            pen = dark_pen if x % self.step == 0 else light_pen
-            line = self.scene.addLine(x, -4000, x, 8000, pen)
-            line.setData(0, "grid")
-
-        for y in range(-4000, 8000, self.cell_size):
-            pen = dark_pen if y % self.step == 0 else light_pen
-            line = self.scene.addLine(-4000, y, 8000, y, pen)
-            line.setData(0, "grid")
-
-    def draw_axes(self):
-        axis_pen = QtGui.QPen(QtGui.QColor('#697c85'))
-        axis_pen.setWidth(2)
-
-        x_axis = self.scene.addLine(self.min_x, 0, self.max_x, 0, axis_pen)
-        y_axis = self.scene.addLine(0, self.min_y, 0, self.max_y, axis_pen)
-
-        for axis in [x_axis, y_axis]:
-            axis.setData(0, "axis")
-            axis.setFlag(QtWidgets.QGraphicsItem.GraphicsItemFlag.ItemIsSelectable, False)
-            axis.setFlag(QtWidgets.QGraphicsItem.GraphicsItemFlag.ItemIsMovable, False)
-
-        font = QtGui.QFont("Arial", 8)
-        step = self.step
-
-
-        # Отметки по X с шагом self.step
-        for x in range(self.min_x, self.max_x + 1, (self.step*5)):
-            tick = self.scene.addLine(x, -5, x, 5, axis_pen)
-            tick.setData(0, "axis_mark")
-            tick.setFlag(QtWidgets.QGraphicsItem.GraphicsItemFlag.ItemIsSelectable, False)
-            tick.setFlag(QtWidgets.QGraphicsItem.GraphicsItemFlag.ItemIsMovable, False)
-
-            if x != 0 and (x // self.step) % 5 == 0:  # Только для 5, 10, 15, ...
-                text = self.scene.addText(str(x // self.step), font)
-                text.setDefaultTextColor(QtGui.QColor('#2d3538'))
-                text.setPos(x - 10, -10)
-                text.setData(0, "axis_label")
-                text.setScale(1)
-                text.setTransform(QtGui.QTransform().scale(1, -1))
-                text.setFlag(QtWidgets.QGraphicsItem.GraphicsItemFlag.ItemIsSelectable, False)
-                text.setFlag(QtWidgets.QGraphicsItem.GraphicsItemFlag.ItemIsMovable, False)
-
-        # Отметки по Y с шагом self.step
-        for y in range(self.min_y, self.max_y + 1, self.step*5):
-            tick = self.scene.addLine(-5, y, 5, y, axis_pen)
-            tick.setData(0, "axis_mark")
-            tick.setFlag(QtWidgets.QGraphicsItem.GraphicsItemFlag.ItemIsSelectable, False)
-            tick.setFlag(QtWidgets.QGraphicsItem.GraphicsItemFlag.ItemIsMovable, False)
-
-            if y != 0 and (y // self.step) % 5 == 0:
-                text = self.scene.addText(str(y // self.step), font)
-                text.setDefaultTextColor(QtGui.QColor('#2d3538'))
-                text.setPos(-30, y - 8)
-                text.setData(0, "axis_label")
-                text.setScale(1)
-                text.setTransform(QtGui.QTransform().scale(1, -1))
-                text.setFlag(QtWidgets.QGraphicsItem.GraphicsItemFlag.ItemIsSelectable, False)
-                text.setFlag(QtWidgets.QGraphicsItem.GraphicsItemFlag.ItemIsMovable, False)
-
-    def snap_to_grid(self, pos):
-        """Привязка к сетке с учетом границ"""
-        x = max(self.min_x, min(self.max_x,
-                                round(pos.x() / self.cell_size) * self.cell_size))
-        y = max(self.min_y, min(self.max_y,
-                                round(pos.y() / self.cell_size) * self.cell_size))
-        return QtCore.QPointF(x, y)
+        log_ui.debug("Выбран инструмент: %s", tool_id)
 
     def save_state_for_undo(self):
         snapshot = []
         for item in self.scene.items():
             if hasattr(item, 'data'):
                 item_type = item.data(0)
-                if item_type in ["grid", "axis", "axis_mark", "axis_label"]:
+                if item_type in ["grid", "axis", "axis_mark", "axis_label", "layer_batch", "drc_marker",
+                                 "net_highlight"]:
                     continue
 
             snapshot.append(item)
         self.undo_stack.append(snapshot)
+        self.undo_parked.append(self.virtualizer.save_state())
 
     def undo_last_action(self):
         if not self.undo_stack:
@@ -2288,17 +3373,21 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
             return
 
         last_snapshot = self.undo_stack.pop()
+        last_parked = self.undo_parked.pop()
 
         # Удалить всё, кроме сетки и осей
         self.toolbar.clear_all_elements()
 
         # Восстановить элементы из снимка
-        for item in last_snapshot:
-            self.scene.addItem(item)
+        with self.bulk_insert():
+            for item in last_snapshot:
+                self.scene.addItem(item)
+            self.virtualizer.restore_state(last_parked)
 
         if hasattr(self, 'cell_manager'):
             self.cell_manager.assign_elements_to_cells()
             self.cell_manager.draw_cell_borders()
+        self.notify_model_change("reset")
 
     def eventFilter(self, source, event):
         # 1) Средняя кнопка — панорамирование
@@ -2326,6 +3415,8 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
             return True
 
         elif event.type() == QtCore.QEvent.Type.MouseButtonRelease and event.button() == QtCore.Qt.MouseButton.RightButton:
+            if self.moving_item is not None:
+                self.notify_model_change("update", [self.moving_item])
             self.moving_item = None
             self.move_start_pos = None
             self.view.setCursor(QtCore.Qt.CursorShape.ArrowCursor)
@@ -2360,16 +3451,14 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
             elif self.current_tool == "column":
                 scene_pos = self.view.mapToScene(event.pos())
                 self.create_column(scene_pos)
-                # после создания столбца сразу пересчитываем всё:
-                self.cell_manager.assign_elements_to_cells()
-                self.update_virtual_lines_on_element_change()
+                # после создания столбца пересчитываем всё в фоне:
+                self.schedule_recompute()
                 return True
 
             elif self.current_tool == "row":
                 scene_pos = self.view.mapToScene(event.pos())
                 self.create_row(scene_pos)
-                self.cell_manager.assign_elements_to_cells()
-                self.update_virtual_lines_on_element_change()
+                self.schedule_recompute()
                 return True
 
             elif self.current_tool == "vline":
@@ -2380,6 +3469,10 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
             elif self.current_tool == "transistor":
                 return self.handle_transistor_creation(event)
 
+            elif self.current_tool == "net":
+                self.pick_net(self.view.mapToScene(event.pos()), pin=True)
+                return True
+
             else:
                 self.last_pos = event.pos()
 
@@ -2414,7 +3507,12 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
                     self.temp_line.setLine(new_line)
                 return True
 
-            # 4.3) Панорамирование ладонью (move tool)
+            # 4.3) Инструмент «Цепь» — подсветка цепи под курсором
+            # (событие не поглощается: подсказки элементов сцены остаются)
+            elif self.current_tool == "net" and not event.buttons():
+                self.pick_net(self.view.mapToScene(event.pos()))
+
+            # 4.4) Панорамирование ладонью (move tool)
 
 
         # 5) Отпускание левой кнопки
@@ -2431,10 +3529,10 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
                 else:
                     end_point = QtCore.QPointF(x0, scene_pos.y())
                 self.temp_line.setLine(QtCore.QLineF(x0, y0, end_point.x(), end_point.y()))
+                self.notify_model_change("add", [self.temp_line])
 
-                # **Главное: обновляем ячейки и создаем виртуальные линии**
-                self.cell_manager.assign_elements_to_cells()
-                self.update_virtual_lines_on_element_change()
+                # **Главное: обновляем ячейки и создаем виртуальные линии (в фоне)**
+                self.schedule_recompute()
 
                 self.temp_line = None
                 self.line_start = None
@@ -2482,26 +3580,23 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
             else:
                 if current_scale > 0.25:
                     self.view.scale(zoom_factor, zoom_factor)
+            self._scene_grow_timer.start()
+            self.virtualizer.schedule()
             return super().eventFilter(source, event)
 
         return super().eventFilter(source, event)
 
     def set_line_style(self, line_item, material_name, logic_width):
         """Устанавливает стиль линии и точек"""
-        material = self.LINE_MATERIALS.get(material_name, self.LINE_MATERIALS["M2"])
-        color = QtGui.QColor(material["color"])
-        style = material["style"]
-        z = material["z"]
+        if material_name not in self.LINE_MATERIALS:
+            material_name = "M2"
 
         # Линейное преобразование: логическая -3...10 → визуальная 3...16
         visual_width = logic_width + 6
 
-        pen = QtGui.QPen(color)
-        pen.setWidth(max(1, visual_width))  # минимальная ширина = 1 px
-        pen.setStyle(style)
-
-        line_item.setPen(pen)  # Теперь setPen также установит цвет точек
-        line_item.setZValue(z)
+        # минимальная ширина = 1 px; перо общее для всех проводов материала этой толщины
+        line_item.setPen(STYLES.line_pen(material_name, max(1, visual_width)))
+        line_item.setZValue(self.LINE_MATERIALS[material_name]["z"])
 
     def line_creation(self, event):
         if self.active_layer not in [0, 1]:
@@ -2533,51 +3628,66 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
         if hasattr(self, 'cell_manager'):
             self.cell_manager.assign_elements_to_cells()
 
-    def auto_create_virtual_lines(self):
+    @timed("auto_create_virtual_lines")
+    def auto_create_virtual_lines(self, on_done=None):
         """
         Автоматически создаёт виртуальные линии:
-         1) Удаляет все старые vline из сцены
-         2) Проходит по всем «wire» и «contact» и собирает список vline_data
-         3) Для каждого vline_data формирует имя по схеме <source>_<cell.name>_<edge_type>(N)
-         4) Рисует GridSnapLineItem и сразу же регистрирует его пересечения в ячейках
+         1) Снимает с модели неизменяемый снимок проводов, контактов и ячеек
+         2) layout_model.compute_virtual_lines собирает vline_data и формирует
+            имена по схеме <source>_<cell.name>_<edge_type>(N)
+         3) Старые vline удаляются, новые рисуются порциями и регистрируются в ячейках
+        Линии строятся асинхронно (run_chunked): к возврату их может ещё не быть
+        на сцене. on_done(created) вызывается со списком созданных линий после
+        построения (при отмене не вызывается).
+        Возвращает рассчитанный список vline_data.
         """
-        print("Создание виртуальных линий...")
-        self.clear_virtual_lines()
-
-        line_counters = defaultdict(int)
-        created_vlines = []
-
-        all_vlines_data = []
+        snapshot, _ = self.cell_manager.take_snapshot()
+        vlines_data = compute_virtual_lines(snapshot)
+        self.apply_virtual_lines(
+            vlines_data, collect_vline_registrations(snapshot.cells, vlines_data), on_done)
+        return vlines_data
 
-        # 1) Собираем vline_data из всех проводов
-        for item in self.scene.items():
-            if isinstance(item, QtWidgets.QGraphicsLineItem) and hasattr(item, 'data') and item.data(0) == "wire":
-                all_vlines_data.extend(self.analyze_element_for_virtual_lines(item, None))
-
-        # 2) Собираем vline_data из всех контактов
-        for item in self.scene.items():
-            if isinstance(item, QtWidgets.QGraphicsEllipseItem) and hasattr(item, 'data') and item.data(0) == "contact":
-                all_vlines_data.extend(self.analyze_element_for_virtual_lines(item, None))
-
-        # 3) Формируем имена и создаём сами QGraphicsLineItem
-        for vline_data in all_vlines_data:
-            cell = vline_data.get('cell')
-            if cell is None:
-                continue
-            source = vline_data.get('source', 'unknown')
-            edge_type = vline_data.get('edge_type', 'unknown')
+    def apply_virtual_lines(self, vlines_data, registrations, on_done=None):
+        """
+        Заменяет виртуальные линии на сцене рассчитанными заранее
+        (vline_data из layout_model) и записывает регистрации в ячейки.
+        Линии создаются порциями через run_chunked; при отмене возвращаются
+        прежние линии и прежние регистрации ячеек. on_done(created) — после построения.
+        Вызывается только из GUI-потока.
+        """
+        old_vlines = [item for item in self.scene.items()
+                      if isinstance(item, QtWidgets.QGraphicsLineItem) and item.data(0) == "vline"]
+        for item in old_vlines:
+            self.scene.removeItem(item)
+        # apply_assignment к этому моменту уже мог очистить регистрации
+        old_registrations = [(cell, list(cell.virtual_lines)) for cell in self.cell_manager.cells]
 
-            key = f"{source}_{cell.name}_{edge_type}"
-            line_counters[key] += 1
-            suffix = "" if line_counters[key] == 1 else f"({line_counters[key] - 1})"
-            vline_data['name'] = f"{key}{suffix}"
+        created_vlines = []
 
-            vline = self.create_virtual_line_from_data(vline_data)
-            if vline:
-                created_vlines.append(vline)
+        def work():
+            for n, vline_data in enumerate(vlines_data, 1):
+                vline = self.create_virtual_line_from_data(vline_data)
+                if vline:
+                    created_vlines.append(vline)
+                yield n, len(vlines_data)
+
+        def done():
+            self.cell_manager.apply_vline_registrations(registrations)
+            log_vlines.info("Создано %d виртуальных линий, регистраций в ячейках: %d",
+                            len(created_vlines), sum(len(entries) for entries in registrations))
+            if on_done:
+                on_done(created_vlines)
+
+        def rollback():
+            for item in created_vlines:
+                self.scene.removeItem(item)
+            for item in old_vlines:
+                self.scene.addItem(item)
+            for cell, entries in old_registrations:
+                cell.virtual_lines = entries
 
-        print(f"Создано {len(created_vlines)} виртуальных линий")
-        return created_vlines
+        self.run_chunked("Построение виртуальных линий", work(), done, rollback,
+                         perf_name="apply_virtual_lines")
 
     def clear_virtual_lines(self):
         """Удаляет все существующие виртуальные линии"""
@@ -2590,197 +3700,17 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
         for item in items_to_remove:
             self.scene.removeItem(item)
 
-    def analyze_element_for_virtual_lines(self, element, cell=None):
-        """
-        Возвращает список vline_data для данного element (wire или contact).
-        Если cell=None, означает «проверяем все ячейки сразу» (для контактов оптимальнее так).
-        """
-        virtual_lines_data = []
-        eps = 2.0
-
-        if not hasattr(element, 'data'):
-            return virtual_lines_data
-
-        element_type = element.data(0)
-        source_name = element.data(1) or "unknown"
-
-        # 1) Провода (wire)
-        if element_type == "wire" and isinstance(element, QtWidgets.QGraphicsLineItem):
-            ln = element.line()
-            pos = element.scenePos()
-            p1 = QtCore.QPointF(ln.x1() + pos.x(), ln.y1() + pos.y())
-            p2 = QtCore.QPointF(ln.x2() + pos.x(), ln.y2() + pos.y())
-
-            # Если cell передан, проверяем только его; иначе — все ячейки
-            cells_to_check = [cell] if cell else self.cell_manager.cells
-
-            for point in (p1, p2):
-                for c in cells_to_check:
-                    if c is None:
-                        continue
-                    vline_data = self.check_point_on_cell_edge(point, c, eps)
-                    if vline_data:
-                        vline_data["source"] = source_name
-                        if not self.virtual_line_exists_at_position(vline_data, virtual_lines_data):
-                            virtual_lines_data.append(vline_data)
-
-        # 2) Контакты (contact)
-        elif element_type == "contact" and isinstance(element, QtWidgets.QGraphicsEllipseItem):
-            center = element.scenePos()
-            cx, cy = center.x(), center.y()
-
-            # Если cell передан, проверяем только его грань; иначе — все ячейки
-            cells_to_check = [cell] if cell else self.cell_manager.cells
-
-            for c in cells_to_check:
-                if c is None:
-                    continue
-                # проверяем по четырём возможным граням
-                # если центр лежит ровно на левой/правой/нижней/верхней грани, создаём один
-                # vline_data с горизонталью (для левой/правой) или вертикалью (для нижней/верхней).
-                # edge='left' и 'right' → горизонтальная линия; edge='bottom' и 'top' → вертикальная.
-
-                # левая грань
-                if abs(cx - c.x1) < eps and (c.y1 <= cy <= c.y2):
-                    vline_data = {
-                        'start_point': QtCore.QPointF(c.x1, cy),
-                        'end_point':   QtCore.QPointF(c.x2, cy),
-                        'edge_type':   'lft',
-                        'cell':        c,
-                        'source':      source_name
-                    }
-                    if not self.virtual_line_exists_at_position(vline_data, virtual_lines_data):
-                        virtual_lines_data.append(vline_data)
-
-                # правая грань
-                if abs(cx - c.x2) < eps and (c.y1 <= cy <= c.y2):
-                    vline_data = {
-                        'start_point': QtCore.QPointF(c.x1, cy),
-                        'end_point':   QtCore.QPointF(c.x2, cy),
-                        'edge_type':   'rht',
-                        'cell':        c,
-                        'source':      source_name
-                    }
-                    if not self.virtual_line_exists_at_position(vline_data, virtual_lines_data):
-                        virtual_lines_data.append(vline_data)
-
-                # нижняя грань
-                if abs(cy - c.y1) < eps and (c.x1 <= cx <= c.x2):
-                    vline_data = {
-                        'start_point': QtCore.QPointF(cx, c.y1),
-                        'end_point':   QtCore.QPointF(cx, c.y2),
-                        'edge_type':   'btm',
-                        'cell':        c,
-                        'source':      source_name
-                    }
-                    if not self.virtual_line_exists_at_position(vline_data, virtual_lines_data):
-                        virtual_lines_data.append(vline_data)
-
-                # верхняя грань
-                if abs(cy - c.y2) < eps and (c.x1 <= cx <= c.x2):
-                    vline_data = {
-                        'start_point': QtCore.QPointF(cx, c.y1),
-                        'end_point':   QtCore.QPointF(cx, c.y2),
-                        'edge_type':   'top',
-                        'cell':        c,
-                        'source':      source_name
-                    }
-                    if not self.virtual_line_exists_at_position(vline_data, virtual_lines_data):
-                        virtual_lines_data.append(vline_data)
-
-        return virtual_lines_data
-
-    def virtual_line_exists_at_position(self, new_vline_data, existing_data_list):
-        """Проверяет, существует ли уже виртуальная линия в данной позиции"""
-        eps = 1.0
-        new_start = new_vline_data['start_point']
-        new_end = new_vline_data['end_point']
-
-        for existing in existing_data_list:
-            existing_start = existing['start_point']
-            existing_end = existing['end_point']
-
-            # Проверяем совпадение координат (с учетом направления)
-            if ((abs(new_start.x() - existing_start.x()) < eps and
-                 abs(new_start.y() - existing_start.y()) < eps and
-                 abs(new_end.x() - existing_end.x()) < eps and
-                 abs(new_end.y() - existing_end.y()) < eps) or
-                    (abs(new_start.x() - existing_end.x()) < eps and
-                     abs(new_start.y() - existing_end.y()) < eps and
-                     abs(new_end.x() - existing_start.x()) < eps and
-                     abs(new_end.y() - existing_start.y()) < eps)):
-                return True
-
-        return False
-
-    def check_point_on_cell_edge(self, point, cell, eps=2.0):
-        """
-        Проверяет, находится ли точка на краю ячейки
-        Возвращает данные для создания виртуальной линии или None
-        """
-        x, y = point.x(), point.y()
-
-        # Проверяем левый край (x = cell.x1)
-        if abs(x - cell.x1) < eps and cell.y1 <= y <= cell.y2:
-            return {
-                'start_point': QtCore.QPointF(cell.x1, y),
-                'end_point': QtCore.QPointF(cell.x2, y),
-                'edge_type': 'lft',
-                'cell': cell,
-                'original_point': point
-            }
-
-        # Проверяем правый край (x = cell.x2)
-        if abs(x - cell.x2) < eps and cell.y1 <= y <= cell.y2:
-            return {
-                'start_point': QtCore.QPointF(cell.x2, y),
-                'end_point': QtCore.QPointF(cell.x1, y),
-                'edge_type': 'rht',
-                'cell': cell,
-                'original_point': point
-            }
-
-        # Проверяем нижний край (y = cell.y1)
-        if abs(y - cell.y1) < eps and cell.x1 <= x <= cell.x2:
-            return {
-                'start_point': QtCore.QPointF(x, cell.y1),
-                'end_point': QtCore.QPointF(x, cell.y2),
-                'edge_type': 'btm',
-                'cell': cell,
-                'original_point': point
-            }
-
-        # Проверяем верхний край (y = cell.y2)
-        if abs(y - cell.y2) < eps and cell.x1 <= x <= cell.x2:
-            return {
-                'start_point': QtCore.QPointF(x, cell.y2),
-                'end_point': QtCore.QPointF(x, cell.y1),
-                'edge_type': 'top',
-                'cell': cell,
-                'original_point': point
-            }
-
-        return None
-
     def create_virtual_line_from_data(self, vline_data):
         """
         Создаёт виртуальную линию из vline_data, который уже содержит ключ 'name'.
+        Регистрация в ячейках выполняется отдельно (apply_virtual_lines).
         """
         try:
-            start = vline_data['start_point']
-            end = vline_data['end_point']
+            (x1, y1), (x2, y2) = vline_data['start'], vline_data['end']
             vline_name = vline_data['name']
 
-            vline = GridSnapLineItem(
-                start.x(), start.y(),
-                end.x(), end.y(),
-                cell_size=self.cell_size
-            )
-
-            pen = QtGui.QPen(QtGui.QColor("red"))
-            pen.setWidth(2)
-            pen.setStyle(QtCore.Qt.PenStyle.DashLine)
-            vline.setPen(pen)
+            vline = GridSnapLineItem(x1, y1, x2, y2, cell_size=self.cell_size)
+            vline.setPen(STYLES.pen("red", 2, QtCore.Qt.PenStyle.DashLine))
 
             vline.setData(0, "vline")
             vline.setData(1, vline_name)
@@ -2793,16 +3723,10 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
 
             self.scene.addItem(vline)
 
-            # Зарегистрируем в ячейках
-            if hasattr(self, 'cell_manager'):
-                self.cell_manager.register_vline_intersections(vline)
-
-            print(f"Создана виртуальная линия: {vline_name}")
             return vline
 
         except Exception as e:
-            print(f"Ошибка при создании виртуальной линии: {e}")
-            import traceback; traceback.print_exc()
+            log_vlines.exception("Ошибка при создании виртуальной линии: %s", e)
             return None
 
     def update_virtual_lines_on_element_change(self):
@@ -2814,6 +3738,50 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
             self.cell_manager.assign_elements_to_cells()
             self.auto_create_virtual_lines()
 
+    def schedule_recompute(self):
+        """
+        Откладывает пересчёт ячеек и виртуальных линий в рабочий поток.
+        Вызовы в пределах одного события сливаются в один расчёт, а результат,
+        устаревший к моменту готовности, отбрасывается.
+        """
+        self._recompute_generation += 1
+        self._recompute_timer.start(0)
+
+    def _start_recompute(self):
+        """Снимает снимок модели в GUI-потоке и отдаёт расчёт в QThreadPool"""
+        if self.active_task is not None:
+            # Идёт порционная операция — модель в промежуточном состоянии
+            self._recompute_timer.start(self.RECOMPUTE_RETRY_MS)
+            return
+        cm = self.cell_manager
+        snapshot, items = cm.take_snapshot()
+        generation = self._recompute_generation
+        self._recompute_jobs[generation] = (cm, list(cm.cells), cm.revision, items)
+        QtCore.QThreadPool.globalInstance().start(
+            RecomputeTask(generation, snapshot, self._recompute_signals))
+
+    def _on_recompute_finished(self, generation, result):
+        """Применяет результат фонового пересчёта одним пакетом"""
+        job = self._recompute_jobs.pop(generation, None)
+        for old in [g for g in self._recompute_jobs if g < generation]:
+            del self._recompute_jobs[old]
+        if job is None or result is None or generation != self._recompute_generation:
+            return
+
+        cm, cells, revision, items = job
+        stale = (self.active_task is not None or
+                 cm is not self.cell_manager or cm.revision != revision or
+                 len(cells) != len(cm.cells) or
+                 any(a is not b for a, b in zip(cells, cm.cells)) or
+                 any(item is not None and item.scene() is not self.scene for item in items))
+        if stale:
+            # Модель изменили синхронно, пока шёл расчёт — считаем заново
+            self.schedule_recompute()
+            return
+
+        cm.apply_assignment(result.assignment, items)
+        self.apply_virtual_lines(result.vlines, result.registrations)
+
     def vline_creation(self, event):
         """
         Автоматическое создание виртуальных линий вместо ручного рисования
@@ -2821,13 +3789,14 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
         # Сохраняем состояние для undo
         self.save_state_for_undo()
 
-        # Запускаем автоматическое создание
-        created_lines = self.auto_create_virtual_lines()
+        def report(created):
+            if created:
+                log_vlines.info("Виртуальные линии созданы автоматически: %d шт.", len(created))
+            else:
+                log_vlines.info("Не найдено элементов для создания виртуальных линий")
 
-        if created_lines:
-            print(f"Виртуальные линии созданы автоматически: {len(created_lines)} шт.")
-        else:
-            print("Не найдено элементов для создания виртуальных линий")
+        # Запускаем автоматическое создание (линии строятся порциями, отчёт — по готовности)
+        self.auto_create_virtual_lines(on_done=report)
 
     def line_creation_with_auto_vlines(self, event):
         """Создание линии с автоматическим обновлением виртуальных линий и точками на концах"""
@@ -2875,48 +3844,26 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
         contact_size = 10  # базовый диаметр, можно потом менять в свойствах
 
         # ————— ВСЕГДА СОЗДАЁМ ОДИНОЧНЫЙ КОНТАКТ —————
-        contact = GridSnapEllipseItem(
-            -contact_size / 2, -contact_size / 2,
-            contact_size, contact_size,
-            cell_size=self.cell_size
-        )
-        contact.setPos(position)
-
-        params = self.CONTACT_MATERIALS[default_material]
-        contact.setBrush(QtGui.QBrush(QtGui.QColor(params["color"])))
-        contact.setZValue(params["z"])
-
-        contact.setData(0, "contact")
-        contact.setData(1, default_material)
-        contact.setData(2, contact_size)
-
-        pen = QtGui.QPen(QtGui.QColor("black"))
-        pen.setWidth(1)
-        contact.setPen(pen)
-
-        contact.setFlag(QtWidgets.QGraphicsItem.GraphicsItemFlag.ItemIsSelectable, True)
-        contact.setFlag(QtWidgets.QGraphicsItem.GraphicsItemFlag.ItemIsMovable, True)
-
+        contact = self.create_contact_item(position, default_material, contact_size)
         self.scene.addItem(contact)
+        self.notify_model_change("add", [contact])
 
         # После добавления контакта:
-        self.cell_manager.assign_elements_to_cells()
-        self.update_virtual_lines_on_element_change()
+        self.schedule_recompute()
 
         return contact
 
     def create_transistor(self, position):
         """Создает TransistorItem с поддержкой направления, привязывает к сетке и помечает data(0)="transistor"."""
         try:
-            print("Начинаем создание транзистора...")
 
             # Проверяем входные параметры
             if not hasattr(self, 'cell_size'):
-                print("Ошибка: отсутствует cell_size")
+                log_ui.error("Ошибка: отсутствует cell_size")
                 return None
 
             if not hasattr(self, 'scene'):
-                print("Ошибка: отсутствует scene")
+                log_ui.error("Ошибка: отсутствует scene")
                 return None
 
             # Создаем транзистор с длиной линии по умолчанию в 2 шага (40 пикселей)
@@ -2929,40 +3876,29 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
                 direction="NORTH"  # Направление по умолчанию
             )
 
-            print("TransistorItem создан")
 
             # Устанавливаем позицию
             snapped_pos = self.snap_to_grid(position)
             t.setPos(snapped_pos)
-            print(f"Позиция установлена: {snapped_pos}")
 
             # Устанавливаем высокий zValue для транзистора
             t.setZValue(10)
 
             # Устанавливаем данные
             t.setData(0, "transistor")
-            print("Данные установлены")
 
             # Добавляем на сцену
             self.scene.addItem(t)
-            print("Элемент добавлен на сцену")
-
-            # Обновляем ячейки и виртуальные линии
-            if hasattr(self, 'cell_manager'):
-                self.cell_manager.assign_elements_to_cells()
-                print("Элементы распределены по ячейкам")
+            self.notify_model_change("add", [t])
 
-            if hasattr(self, 'update_virtual_lines_on_element_change'):
-                self.update_virtual_lines_on_element_change()
-                print("Виртуальные линии обновлены")
+            # Обновляем ячейки и виртуальные линии (в фоне)
+            self.schedule_recompute()
 
-            print("Транзистор успешно создан")
+            log_ui.debug("Транзистор создан в (%s, %s)", snapped_pos.x(), snapped_pos.y())
             return t
 
         except Exception as e:
-            print(f"Ошибка при создании транзистора: {e}")
-            import traceback
-            traceback.print_exc()
+            log_ui.exception("Ошибка при создании транзистора: %s", e)
             return None
 
     def handle_transistor_creation(self, event):
@@ -2971,11 +3907,10 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
             scene_pos = self.snap_to_grid(self.view.mapToScene(event.pos()))
             transistor = self.create_transistor(scene_pos)
             if transistor is None:
-                print("Не удалось создать транзистор")
+                log_ui.warning("Не удалось создать транзистор")
             return True
         except Exception as e:
-            print(f"Ошибка в обработчике создания транзистора: {e}")
-            traceback.print_exc()
+            log_ui.exception("Ошибка в обработчике создания транзистора: %s", e)
             return True
 
     def create_comment(self, position):
@@ -2983,15 +3918,63 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
         text_item = CommentTextItem()
         text_item.setPos(position)
         self.scene.addItem(text_item)
+        self.notify_model_change("add", [text_item])
 
     def snap_to_grid(self, pos):
-        """Модифицированный метод с учетом границ"""
-        x = max(self.min_x, min(self.max_x,
-                                round(pos.x() / self.cell_size) * self.cell_size))
-        y = max(self.min_y, min(self.max_y,
-                                round(pos.y() / self.cell_size) * self.cell_size))
+        """Привязка к сетке; холст не ограничен, сцена при необходимости расширяется"""
+        x = round(pos.x() / self.cell_size) * self.cell_size
+        y = round(pos.y() / self.cell_size) * self.cell_size
         return QtCore.QPointF(x, y)
 
+    # --- Расширение сцены ---
+
+    SCENE_CHUNK = 2000      # шаг расширения сцены и размер листа BSP-индекса
+    SCENE_MARGIN = 1000     # запас вокруг содержимого и видимой области
+
+    @classmethod
+    def bsp_depth_for(cls, rect):
+        """
+        Глубина BSP-дерева, при которой лист покрывает примерно SCENE_CHUNK×SCENE_CHUNK:
+        индекс делится на куски по площади сцены, а не по числу элементов,
+        поэтому рост сцены не укрупняет листья.
+        """
+        chunks = max(1.0, (rect.width() / cls.SCENE_CHUNK) * (rect.height() / cls.SCENE_CHUNK))
+        return max(4, min(18, math.ceil(math.log2(chunks)) + 1))
+
+    def ensure_scene_covers(self, rect):
+        """Расширяет сцену кусками SCENE_CHUNK так, чтобы она содержала rect с запасом"""
+        current = self.scene.sceneRect()
+        if rect.isNull() or current.contains(rect):
+            return
+        m, chunk = self.SCENE_MARGIN, self.SCENE_CHUNK
+        target = current.united(rect.adjusted(-m, -m, m, m))
+        left = math.floor(target.left() / chunk) * chunk
+        top = math.floor(target.top() / chunk) * chunk
+        right = math.ceil(target.right() / chunk) * chunk
+        bottom = math.ceil(target.bottom() / chunk) * chunk
+        grown = QtCore.QRectF(left, top, right - left, bottom - top)
+        self.scene.setSceneRect(grown)
+        if self._bulk_depth == 0:
+            self.scene.setBspTreeDepth(self.bsp_depth_for(grown))
+        log_ui.debug("Сцена расширена до (%.0f, %.0f, %.0f×%.0f)",
+                     left, top, grown.width(), grown.height())
+
+    def _grow_scene_for_change(self, op, items):
+        if op in ("add", "update"):
+            rect = QtCore.QRectF()
+            for item in items:
+                if item is not None and item.scene() is self.scene:
+                    rect = rect.united(item.sceneBoundingRect())
+            self.ensure_scene_covers(rect)
+        elif op == "reset":
+            self.ensure_scene_covers(self.scene.itemsBoundingRect())
+
+    def _cover_viewport(self):
+        """Не даёт прокрутке упереться в край сцены: расширяет её вокруг видимой области"""
+        visible = self.view.mapToScene(self.view.viewport().rect()).boundingRect()
+        m = self.SCENE_MARGIN
+        self.ensure_scene_covers(visible.adjusted(-m, -m, m, m))
+
     def handle_middle_mouse_pan(self, event):
         if event.type() == QtCore.QEvent.Type.MouseButtonPress and event.button() == QtCore.Qt.MouseButton.MiddleButton:
             self.view.setCursor(QtCore.Qt.CursorShape.ClosedHandCursor)
@@ -3043,24 +4026,22 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
         contact.setPos(position)
 
         # Устанавливаем свойства из материала
-        material = self.CONTACT_MATERIALS[default_material]
-        contact.setBrush(QtGui.QBrush(QtGui.QColor(material["color"])))
-        contact.setZValue(material["z"])  # Z-значение выше чем у линий
+        contact.setBrush(STYLES.contact_brush(default_material))
+        contact.setZValue(self.CONTACT_MATERIALS[default_material]["z"])  # Z-значение выше чем у линий
 
         # Сохраняем параметры в данных
         contact.setData(0, "contact")
         contact.setData(1, default_material)  # Тип материала
         contact.setData(2, contact_size)  # Размер
 
-        pen = QtGui.QPen(QtGui.QColor("black"))
-        pen.setWidth(1)
-        contact.setPen(pen)
+        contact.setPen(STYLES.outline_pen())
 
         contact.setFlag(QtWidgets.QGraphicsItem.GraphicsItemFlag.ItemIsSelectable, True)
         contact.setFlag(QtWidgets.QGraphicsItem.GraphicsItemFlag.ItemIsMovable, True)
 
 
         self.scene.addItem(contact)
+        self.notify_model_change("add", [contact])
 
         if hasattr(self, 'cell_manager'):
             self.cell_manager.assign_elements_to_cells()
@@ -3147,8 +4128,7 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
                 self.selected_item = new_contact_item
 
             # Обновить ячейки и виртуальные линии
-            self.cell_manager.assign_elements_to_cells()
-            self.update_virtual_lines_on_element_change()
+            self.schedule_recompute()
 
             # Обновляем отображение свойств для нового элемента
             self.show_contact_properties(new_contact_item)
@@ -3161,13 +4141,12 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
             — создаём новый (одиночный или двухточечный)
             """
             try:
-                print(f"DEBUG: change_two_mode вызван, checked={checked}, is_two={is_two}")
+                log_ui.debug("change_two_mode: checked=%s, is_two=%s", checked, is_two)
 
                 # Сохраняем параметры:
                 old_pos = contact_item.scenePos()
                 old_size = size_spin.value()
 
-                print(f"DEBUG: old_pos={old_pos}, old_size={old_size}")
 
                 if not is_two:
                     # Был одиночный
@@ -3181,11 +4160,11 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
                     else:
                         old_mat1, old_mat2 = pair, pair
 
-                print(f"DEBUG: materials: {old_mat1}, {old_mat2}")
+                log_ui.debug("change_two_mode: размер %s, материалы %s, %s", old_size, old_mat1, old_mat2)
 
                 # Удаляем старый из сцены
+                self.notify_model_change("remove", [contact_item])
                 self.scene.removeItem(contact_item)
-                print("DEBUG: Старый контакт удален")
 
                 # Создаём новый:
                 if not checked:
@@ -3195,25 +4174,20 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
                         cell_size=self.cell_size
                     )
                     new_contact.setPos(old_pos)
-                    params = self.CONTACT_MATERIALS.get(old_mat1, {"color": "#ff0000", "z": 5})
-                    new_contact.setBrush(QtGui.QBrush(QtGui.QColor(params["color"])))
+                    params = STYLES.contact_params(old_mat1, "#ff0000")
+                    new_contact.setBrush(STYLES.brush(params["color"]))
                     new_contact.setZValue(params["z"])
                     new_contact.setData(0, "contact")
                     new_contact.setData(1, old_mat1)
                     new_contact.setData(2, old_size)
-
-                    pen = QtGui.QPen(QtGui.QColor("black"))
-                    pen.setWidth(1)
-                    new_contact.setPen(pen)
+                    new_contact.setPen(STYLES.outline_pen())
                     new_contact.setFlag(QtWidgets.QGraphicsItem.GraphicsItemFlag.ItemIsSelectable, True)
                     new_contact.setFlag(QtWidgets.QGraphicsItem.GraphicsItemFlag.ItemIsMovable, True)
 
                     self.scene.addItem(new_contact)
-                    print("DEBUG: Создан одиночный контакт")
 
                 else:
                     # Нужен двухточечный
-                    print("DEBUG: Создаем двухточечный контакт...")
                     new_contact = TwoPointContactGroup(
                         center_pos=old_pos,
                         size=old_size,
@@ -3226,16 +4200,13 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
                     new_contact.setData(1, f"{old_mat1},{old_mat2}")
                     new_contact.setData(2, old_size)
                     self.scene.addItem(new_contact)
-                    print("DEBUG: Двухточечный контакт создан и добавлен в сцену")
 
                 # Обновляем всё
+                self.notify_model_change("add", [new_contact])
                 recreate_contact(new_contact)
-                print("DEBUG: recreate_contact выполнен")
 
             except Exception as e:
-                print(f"DEBUG: Ошибка в change_two_mode: {e}")
-                import traceback
-                traceback.print_exc()
+                log_ui.exception("Ошибка в change_two_mode: %s", e)
 
         # Исправляем подключение сигнала
         two_checkbox.stateChanged.connect(lambda state: change_two_mode(state == 2))  # 2 = Checked
@@ -3248,6 +4219,7 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
                 # Одиночный эллипс - просто меняем размер
                 contact_item.setRect(-new_size / 2, -new_size / 2, new_size, new_size)
                 contact_item.setData(2, new_size)
+                self.notify_model_change("update", [contact_item])
             else:
                 # Двухточечный: надо перестроить всю группу
                 old_mat_pair = contact_item.data(1) or "CPA,CPA"
@@ -3257,6 +4229,7 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
                     m1, m2 = old_mat_pair, old_mat_pair
 
                 # Удаляем старую группу
+                self.notify_model_change("remove", [contact_item])
                 self.scene.removeItem(contact_item)
 
                 # Создаём новую с обновлённым size:
@@ -3272,6 +4245,7 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
                 new_tp.setData(1, f"{m1},{m2}")
                 new_tp.setData(2, new_size)
                 self.scene.addItem(new_tp)
+                self.notify_model_change("add", [new_tp])
 
                 recreate_contact(new_tp)
 
@@ -3285,13 +4259,15 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
 
             if not is_two:
                 # Просто перекрашиваем одиночный
-                params = self.CONTACT_MATERIALS.get(m1, {"color": "#ff0000", "z": 5})
-                contact_item.setBrush(QtGui.QBrush(QtGui.QColor(params["color"])))
+                params = STYLES.contact_params(m1, "#ff0000")
+                contact_item.setBrush(STYLES.brush(params["color"]))
                 contact_item.setZValue(params["z"])
                 contact_item.setData(1, m1)
+                self.notify_model_change("update", [contact_item])
             else:
                 # Для двухточечного: нужно заменить оба эллипса
                 # Удаляем старую группу
+                self.notify_model_change("remove", [contact_item])
                 self.scene.removeItem(contact_item)
 
                 # Создаём новую группу с новыми материалами
@@ -3315,6 +4291,7 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
                 new_tp.setData(1, f"{m1},{m2}")
                 new_tp.setData(2, current_size)
                 self.scene.addItem(new_tp)
+                self.notify_model_change("add", [new_tp])
 
                 recreate_contact(new_tp)
 
@@ -3331,35 +4308,40 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
         # Ставим отступ внизу
         self.properties_layout.addStretch()
 
-    def create_column(self, scene_pos):
+    def create_column(self, scene_pos, redraw=True):
+        """
+        Добавляет столбец и рисует его линию; возвращает группу элементов столбца.
+        redraw=False — пакетный режим: ячейки, границы, буферы и уведомление
+        об изменении обновляет вызывающий.
+        """
         start_point = self.snap_to_grid(scene_pos)
 
         # Добавляем в менеджер ячеек
         if not hasattr(self, 'cell_manager'):
             self.cell_manager = CellManager(self.scene)
-        self.cell_manager.add_column(start_point.x())
+        self.cell_manager.add_column(start_point.x(), update=redraw)
 
         # Оригинальный код отрисовки
         bottom_y = self.scene.sceneRect().top()
         line = QtWidgets.QGraphicsLineItem(
             start_point.x(), start_point.y(), start_point.x(), bottom_y
         )
-        pen = QtGui.QPen(QtGui.QColor("blue"))
-        pen.setStyle(QtCore.Qt.PenStyle.DashLine)
-        pen.setWidth(2)
-        line.setPen(pen)
+        line.setPen(STYLES.pen("blue", 2, QtCore.Qt.PenStyle.DashLine))
 
         dot = QtWidgets.QGraphicsEllipseItem(
             start_point.x() - 3, start_point.y() - 3, 6, 6
         )
-        dot.setBrush(QtGui.QBrush(QtGui.QColor("blue")))
-        dot.setPen(QtGui.QPen(QtCore.Qt.PenStyle.NoPen))
+        dot.setBrush(STYLES.brush("blue"))
+        dot.setPen(STYLES.no_pen())
 
         self.scene.addItem(line)
         self.scene.addItem(dot)
 
         column_group = self.scene.createItemGroup([line, dot])
         column_group.setData(0, "column")
+        if not redraw:
+            return column_group
+        self.notify_model_change("grid")
 
         # Обновляем визуализацию ячеек
         self.cell_manager.draw_cell_borders()
@@ -3368,13 +4350,15 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
             self.cell_manager.columns,
             self.cell_manager.rows
         )
+        return column_group
 
-    def create_row(self, scene_pos):
+    def create_row(self, scene_pos, redraw=True):
+        """Добавляет строку и рисует её линию; redraw — как в create_column"""
         start_point = self.snap_to_grid(scene_pos)
 
         if not hasattr(self, 'cell_manager'):
             self.cell_manager = CellManager(self.scene)
-        self.cell_manager.add_row(start_point.y())
+        self.cell_manager.add_row(start_point.y(), update=redraw)
 
         left_x = self.scene.sceneRect().left()
 
@@ -3382,16 +4366,13 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
         line = QtWidgets.QGraphicsLineItem(
             start_point.x(), start_point.y(), left_x, start_point.y()
         )
-        pen = QtGui.QPen(QtGui.QColor("red"))
-        pen.setStyle(QtCore.Qt.PenStyle.DashLine)
-        pen.setWidth(2)
-        line.setPen(pen)
+        line.setPen(STYLES.pen("red", 2, QtCore.Qt.PenStyle.DashLine))
 
         dot = QtWidgets.QGraphicsEllipseItem(
             start_point.x() - 3, start_point.y() - 3, 6, 6
         )
-        dot.setBrush(QtGui.QBrush(QtGui.QColor("red")))
-        dot.setPen(QtGui.QPen(QtCore.Qt.PenStyle.NoPen))
+        dot.setBrush(STYLES.brush("red"))
+        dot.setPen(STYLES.no_pen())
 
         # Добавляем элементы на сцену
         self.scene.addItem(line)
@@ -3400,6 +4381,9 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
         # Группируем их через сцену
         row_group = self.scene.createItemGroup([line, dot])
         row_group.setData(0, "row")  # для дальнейшей идентификации
+        if not redraw:
+            return row_group
+        self.notify_model_change("grid")
 
         self.cell_manager.draw_cell_borders()
 
@@ -3407,12 +4391,15 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
             self.cell_manager.columns,
             self.cell_manager.rows
         )
+        return row_group
 
     def handle_delete(self):
         self.save_state_for_undo()
-        for item in self.scene.selectedItems():
-            if item.data(0) not in ["grid", "axis", "axis_mark", "axis_label"]:
-                self.scene.removeItem(item)
+        removed = [item for item in self.scene.selectedItems()
+                   if item.data(0) not in ["grid", "axis", "axis_mark", "axis_label"]]
+        self.notify_model_change("remove", removed)
+        for item in removed:
+            self.scene.removeItem(item)
 
     def create_toolbar(self):
         """Создает QToolBar и добавляет в него наш виджет"""
@@ -3424,7 +4411,7 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
     def set_current_tool(self, tool_id):
         """Обработчик изменения инструмента"""
         self.current_tool = tool_id
-        print(f"Активирован инструмент: {tool_id}")
+        log_ui.debug("Активирован инструмент: %s", tool_id)
 
         # Настройка поведения View в зависимости от инструмента
         if tool_id == "select":
@@ -3448,6 +4435,221 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
         else:
             print("Менеджер ячеек не инициализирован")
 
+    def item_to_record(self, item):
+        """
+        Описание элемента модели в виде словаря (журнал автосохранения, восстановление).
+        Для служебных элементов (сетка, границы ячеек, буферы, vline) возвращает None.
+        """
+        if isinstance(item.parentItem(), TwoPointContactGroup):
+            return None
+
+        kind = item.data(0)
+        if isinstance(item, TwoPointContactGroup):
+            pos = item.scenePos()
+            return {
+                "kind": "contact2", "uid": element_uid(item),
+                "material": item.data(1), "size": item.data(2),
+                "x": pos.x(), "y": pos.y()
+            }
+
+        if kind == "wire" and isinstance(item, QtWidgets.QGraphicsLineItem):
+            ln = item.line()
+            pos = item.scenePos()
+            return {
+                "kind": "wire", "uid": element_uid(item),
+                "material": item.data(1), "width": item.data(2),
+                "x1": ln.x1() + pos.x(), "y1": ln.y1() + pos.y(),
+                "x2": ln.x2() + pos.x(), "y2": ln.y2() + pos.y(),
+                "dots": isinstance(item, GridSnapLineItemWithDots)
+            }
+
+        if kind == "contact" and isinstance(item, QtWidgets.QGraphicsEllipseItem):
+            pos = item.scenePos()
+            return {
+                "kind": "contact", "uid": element_uid(item),
+                "material": item.data(1), "size": item.data(2),
+                "x": pos.x(), "y": pos.y()
+            }
+
+        if kind == "transistor" and isinstance(item, TransistorItem):
+            pos = item.pos()
+            return {
+                "kind": "transistor", "uid": element_uid(item),
+                "ttype": item.ttype, "direction": item.direction,
+                "line_length": item.line_length,
+                "x": pos.x(), "y": pos.y()
+            }
+
+        if isinstance(item, CommentTextItem):
+            pos = item.pos()
+            text = "" if item.is_placeholder_visible else item.toPlainText()
+            return {
+                "kind": "comment", "uid": element_uid(item),
+                "text": text, "x": pos.x(), "y": pos.y()
+            }
+
+        return None
+
+    def create_wire_item(self, x1, y1, x2, y2, material="M2", width=-3, dots=True):
+        """Создаёт провод (без добавления на сцену)"""
+        cls = GridSnapLineItemWithDots if dots else GridSnapLineItem
+        wire = cls(x1, y1, x2, y2, cell_size=self.cell_size)
+        wire.setData(0, "wire")
+        wire.setData(1, material)
+        wire.setData(2, width)
+        if material in self.LINE_MATERIALS:
+            self.set_line_style(wire, material, width)
+        else:
+            wire.setPen(STYLES.line_pen(material, max(1, abs(width))))
+        return wire
+
+    def create_contact_item(self, position, material="CPA", size=10):
+        """Создаёт одиночный контакт (без добавления на сцену)"""
+        contact = GridSnapEllipseItem(-size / 2, -size / 2, size, size, cell_size=self.cell_size)
+        contact.setPos(position)
+
+        contact.setBrush(STYLES.contact_brush(material))
+        contact.setZValue(STYLES.contact_params(material)["z"])
+
+        contact.setData(0, "contact")
+        contact.setData(1, material)
+        contact.setData(2, size)
+        contact.setPen(STYLES.outline_pen())
+        return contact
+
+    def create_two_point_contact_item(self, position, size, material1, material2):
+        """Создаёт двухточечный контакт так же, как это делает панель свойств"""
+        if material1 in self.TWO_POINT_CONTACT_TYPES:
+            colors = self.TWO_POINT_CONTACT_TYPES[material1]["colors"]
+            contact = TwoPointContactGroup(
+                center_pos=position,
+                size=size,
+                material1=material1,
+                material2=material1,
+                cell_size=self.cell_size,
+                contact_materials={
+                    material1: {"color": colors[0], "z": 5},
+                    f"{material1}_r": {"color": colors[1], "z": 5}
+                }
+            )
+        else:
+            contact = TwoPointContactGroup(
+                center_pos=position,
+                size=size,
+                material1=material1,
+                material2=material2,
+                cell_size=self.cell_size,
+                contact_materials=self.CONTACT_MATERIALS
+            )
+        contact.setData(0, "contact")
+        contact.setData(1, f"{material1},{material2}")
+        contact.setData(2, size)
+        return contact
+
+    def create_transistor_item(self, position, ttype="TP", direction="NORTH", line_length=None):
+        """Создаёт транзистор (без добавления на сцену)"""
+        if line_length is None:
+            line_length = self.cell_size * 2
+        t = TransistorItem(
+            cell_size=self.cell_size,
+            line_length=line_length,
+            ttype=ttype,
+            direction=direction
+        )
+        t.setPos(position)
+        t.setZValue(10)
+        t.setData(0, "transistor")
+        return t
+
+    def add_item_from_record(self, rec):
+        """Создаёт элемент по описанию из item_to_record и добавляет его на сцену"""
+        kind = rec.get("kind")
+        if kind == "wire":
+            item = self.create_wire_item(
+                rec["x1"], rec["y1"], rec["x2"], rec["y2"],
+                rec.get("material") or "M2", rec.get("width", -3),
+                dots=rec.get("dots", True)
+            )
+        elif kind == "contact":
+            item = self.create_contact_item(
+                QtCore.QPointF(rec["x"], rec["y"]),
+                rec.get("material") or "CPA", rec.get("size") or 10
+            )
+        elif kind == "contact2":
+            pair = rec.get("material") or "CPA,CPA"
+            m1, m2 = pair.split(",", 1) if "," in pair else (pair, pair)
+            item = self.create_two_point_contact_item(
+                QtCore.QPointF(rec["x"], rec["y"]), rec.get("size") or 10, m1, m2
+            )
+        elif kind == "transistor":
+            item = self.create_transistor_item(
+                QtCore.QPointF(rec["x"], rec["y"]),
+                rec.get("ttype", "TP"), rec.get("direction", "NORTH"),
+                rec.get("line_length")
+            )
+        elif kind == "comment":
+            item = CommentTextItem()
+            if rec.get("text"):
+                item.setPlainText(rec["text"])
+            item.setPos(QtCore.QPointF(rec["x"], rec["y"]))
+        else:
+            return None
+
+        uid = rec.get("uid")
+        if uid is not None:
+            item.setData(ELEMENT_UID, uid)
+            reserve_element_uid(uid)
+        self.scene.addItem(item)
+        return item
+
+    def capture_layout(self):
+        """Снимок модели: элементы, столбцы/строки и имена ячеек"""
+        elements = []
+        for item in self.scene.items(QtCore.Qt.SortOrder.AscendingOrder):
+            rec = self.item_to_record(item)
+            if rec is not None:
+                elements.append(rec)
+        elements.extend(self.virtualizer.parked_records())
+
+        cell_names = {
+            f"{cell.x1:g},{cell.y1:g}": cell.name for cell in self.cell_manager.cells
+        }
+        return {
+            "elements": elements,
+            "columns": list(self.cell_manager.columns),
+            "rows": list(self.cell_manager.rows),
+            "cell_names": cell_names
+        }
+
+    def restore_layout(self, elements, columns, rows, cell_names=None):
+        """Восстанавливает холст из снимка capture_layout (используется журналом)"""
+        for x in columns:
+            self.create_column(QtCore.QPointF(x, 0), redraw=False)
+        for y in rows:
+            self.create_row(QtCore.QPointF(0, y), redraw=False)
+        self.cell_manager.update_cells()
+
+        if cell_names:
+            for cell in self.cell_manager.cells:
+                name = cell_names.get(f"{cell.x1:g},{cell.y1:g}")
+                if name:
+                    cell.name = name
+
+        with self.bulk_insert():
+            for rec in elements:
+                try:
+                    self.add_item_from_record(rec)
+                except (KeyError, TypeError, ValueError) as e:
+                    log_autosave.warning("Пропущена повреждённая запись %s: %s", rec, e)
+
+        self.cell_manager.assign_elements_to_cells()
+        self.auto_create_virtual_lines()
+        self.cell_manager.draw_cell_borders()
+        self.cell_comment_manager.update_comments(
+            self.cell_manager.columns,
+            self.cell_manager.rows
+        )
+
     def keyPressEvent(self, event):
         if event.key() == QtCore.Qt.Key.Key_Delete:
             self.handle_delete()
@@ -3460,155 +4662,457 @@ class InfiniteCanvas(QtWidgets.QMainWindow):
         self.save_state_for_undo()
         scene_pos = self.view.mapToScene(event.pos())
 
-        # Поиск элементов в маленьком прямоугольнике вокруг клика
-        items = self.scene.items(QtCore.QRectF(scene_pos.x() - 5, scene_pos.y() - 5, 10, 10))
+        # Поиск элементов в маленьком прямоугольнике вокруг клика
+        items = self.scene.items(QtCore.QRectF(scene_pos.x() - 5, scene_pos.y() - 5, 10, 10))
+
+        for item in items:
+            if item.data(0) in ["grid", "axis", "axis_mark", "axis_label"]:
+                continue
+
+            # Если элемент входит в группу — удаляем всю группу
+            group = item.group()
+            if group:
+                self.notify_model_change("remove", [group])
+                self.scene.removeItem(group)
+            else:
+                self.notify_model_change("remove", [item])
+                self.scene.removeItem(item)
+
+            # После первого найденного и удалённого элемента — выход
+            break
+
+
+class GridSnapEllipseItem(QtWidgets.QGraphicsEllipseItem):
+    def __init__(self, x, y, w, h, cell_size=20):
+        super().__init__(x, y, w, h)
+        self.cell_size = cell_size
+        # Критически важные флаги:
+        self.setFlag(QtWidgets.QGraphicsItem.GraphicsItemFlag.ItemIsMovable, True)
+        self.setFlag(QtWidgets.QGraphicsItem.GraphicsItemFlag.ItemIsSelectable, True)
+        self.setFlag(QtWidgets.QGraphicsItem.GraphicsItemFlag.ItemSendsGeometryChanges, True)
+
+    def itemChange(self, change, value):
+        #   print(f"Ellipse change: {change}, value: {value}")  # Отладочный вывод
+        if change == QtWidgets.QGraphicsItem.GraphicsItemChange.ItemPositionChange:
+            grid_size = self.cell_size
+            x = round(value.x() / self.cell_size) * self.cell_size
+            y = round(value.y() / self.cell_size) * self.cell_size
+            #   print(f"Snapping to: {x}, {y}")  # Отладочный вывод
+            return QtCore.QPointF(x, y)
+        return super().itemChange(change, value)
+
+    def paint(self, painter, option, widget=None):
+        # В режиме пакетной отрисовки контакт рисует LayerBatchItem своего материала
+        if LAYER_BATCH.covers(self):
+            return
+        lod = LOD.of(painter)
+        if LOD.hides(self, lod):
+            return
+        if LOD.enabled and lod < LOD.DETAIL and not self.isSelected():
+            # Мелкий контакт — квадрат без обводки
+            painter.setPen(STYLES.no_pen())
+            painter.setBrush(self.brush())
+            painter.drawRect(self.rect())
+            return
+        super().paint(painter, option, widget)
+
+class GridSnapLineItem(QtWidgets.QGraphicsLineItem):
+    def __init__(self, x1=0, y1=0, x2=0, y2=0, cell_size=20):
+        super().__init__(x1, y1, x2, y2)
+        self.cell_size = cell_size
+        # Критически важные флаги:
+        self.setFlag(QtWidgets.QGraphicsItem.GraphicsItemFlag.ItemIsMovable, True)
+        self.setFlag(QtWidgets.QGraphicsItem.GraphicsItemFlag.ItemIsSelectable, True)
+        self.setFlag(QtWidgets.QGraphicsItem.GraphicsItemFlag.ItemSendsGeometryChanges, True)
+
+    def itemChange(self, change, value):
+        #   print(f"Line change: {change}, value: {value}")  # Отладочный вывод
+        if change == QtWidgets.QGraphicsItem.GraphicsItemChange.ItemPositionChange:
+            x = round(value.x() / self.cell_size) * self.cell_size
+            y = round(value.y() / self.cell_size) * self.cell_size
+            #   print(f"Snapping to: {x}, {y}")  # Отладочный вывод
+            return QtCore.QPointF(x, y)
+        return super().itemChange(change, value)
+
+    def paint(self, painter, option, widget=None):
+        # В режиме пакетной отрисовки провод рисует LayerBatchItem своего материала
+        if LAYER_BATCH.covers(self):
+            return
+        lod = LOD.of(painter)
+        if LOD.hides(self, lod):
+            return
+        if LOD.enabled and lod < LOD.DETAIL and self.data(0) == "vline" and not self.isSelected():
+            # Пунктир при отдалении не различим — тонкая сплошная линия
+            painter.setPen(STYLES.pen(self.pen().color().name(QtGui.QColor.NameFormat.HexArgb), 0))
+            painter.drawLine(self.line())
+            return
+        super().paint(painter, option, widget)
+
+class EndpointDotsMixin:
+    """
+    Точки на концах линии, рисуемые в paint() самой линии, а не дочерними
+    эллипсами: провод остаётся одним элементом сцены. boundingRect/shape
+    расширены на DOT_RADIUS вокруг концов; цвет точек берётся из пера линии.
+    """
+    DOT_RADIUS = 3
+
+    def _set_dot_style(self, pen):
+        color = pen.color().name(QtGui.QColor.NameFormat.HexArgb)
+        self._dot_brush = STYLES.brush(color)
+        self._dot_pen = STYLES.pen(color)
+
+    def setPen(self, pen):
+        """Устанавливает перо для линии и цвет для точек"""
+        super().setPen(pen)
+        self._set_dot_style(pen)
+
+    def boundingRect(self):
+        r = self.DOT_RADIUS + 1  # с обводкой точки
+        line = self.line()
+        dots = QtCore.QRectF(line.p1(), line.p2()).normalized().adjusted(-r, -r, r, r)
+        return super().boundingRect().united(dots)
+
+    def shape(self):
+        line = self.line()
+        path = super().shape()
+        path.setFillRule(QtCore.Qt.FillRule.WindingFill)
+        path.addEllipse(line.p1(), self.DOT_RADIUS, self.DOT_RADIUS)
+        path.addEllipse(line.p2(), self.DOT_RADIUS, self.DOT_RADIUS)
+        return path
+
+    def paint(self, painter, option, widget=None):
+        if LAYER_BATCH.covers(self):
+            return
+        lod = LOD.of(painter)
+        if LOD.hides(self, lod):
+            return
+        super().paint(painter, option, widget)
+        if LOD.enabled and lod < LOD.DETAIL:
+            return
+        line = self.line()
+        painter.setPen(self._dot_pen)
+        painter.setBrush(self._dot_brush)
+        painter.drawEllipse(line.p1(), self.DOT_RADIUS, self.DOT_RADIUS)
+        painter.drawEllipse(line.p2(), self.DOT_RADIUS, self.DOT_RADIUS)
+
+
+class LineWithDotsItem(EndpointDotsMixin, QtWidgets.QGraphicsLineItem):
+    """Линия с точками на концах"""
+    DOT_RADIUS = 10
+
+    def __init__(self, x1, y1, x2, y2, cell_size=20, parent=None):
+        super().__init__(x1, y1, x2, y2, parent)
+        self.cell_size = cell_size
+        self._set_dot_style(self.pen())
+
+
+class GridSnapLineItemWithDots(EndpointDotsMixin, GridSnapLineItem):
+    """GridSnapLineItem с точками на концах"""
+    DOT_RADIUS = 3
+
+    def __init__(self, x1, y1, x2, y2, cell_size=20):
+        super().__init__(x1, y1, x2, y2, cell_size)
+        self._set_dot_style(self.pen())
+
+class LayerBatchRenderer:
+    """
+    Режим пакетной отрисовки по материалам. Для каждого материала проводов
+    и контактов на сцену добавляется LayerBatchItem с Z материала; провода
+    и контакты этих материалов сами себя не рисуют (covers), их рисует
+    слой — одной настройкой пера на все элементы материала в
+    перерисовываемой области. Элементы остаются на сцене, так что выбор и
+    выделение по-прежнему идут через индекс сцены; выделенные, скрытые и
+    полупрозрачные элементы рисуются как обычно.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.batches = {}   # (kind, material) -> LayerBatchItem
+        self.scene = None
+        # Номер кадра вида (PerfGraphicsView.paintEvent): выборка элементов
+        # области делается один раз на кадр и делится между слоями
+        self.frame = 0
+        self._visible_key = None
+        self._visible = {}
+
+    def enable(self, scene, line_materials, contact_materials):
+        if self.enabled:
+            self.disable()
+        self.scene = scene
+        for kind, materials in (("wire", line_materials), ("contact", contact_materials)):
+            for material, params in materials.items():
+                batch = LayerBatchItem(kind, material, params["z"])
+                scene.addItem(batch)
+                self.batches[(kind, material)] = batch
+        scene.sceneRectChanged.connect(self._on_scene_rect_changed)
+        self.enabled = True
+        scene.update()
+
+    def disable(self):
+        if not self.enabled:
+            return
+        self.scene.sceneRectChanged.disconnect(self._on_scene_rect_changed)
+        for batch in self.batches.values():
+            if batch.scene() is not None:
+                batch.scene().removeItem(batch)
+        self.batches.clear()
+        self._visible_key = None
+        self._visible = {}
+        self.enabled = False
+        self.scene.update()
+        self.scene = None
+
+    def _on_scene_rect_changed(self, rect):
+        for batch in self.batches.values():
+            batch.prepareGeometryChange()
+
+    def covers(self, item):
+        """Рисует ли элемент слой его материала (тогда сам элемент не рисуется)"""
+        if not self.enabled or item.isSelected() or item.opacity() < 1.0:
+            return False
+        batch = self.batches.get((item.data(0), item.data(1)))
+        return batch is not None and batch.scene() is item.scene()
+
+    def visible(self, rect):
+        """Элементы области rect, которые рисуют слои: {(kind, material): [items]}"""
+        key = (self.frame, rect.x(), rect.y(), rect.width(), rect.height())
+        if key != self._visible_key:
+            groups = {}
+            for item in self.scene.items(rect, QtCore.Qt.ItemSelectionMode.IntersectsItemBoundingRect,
+                                         QtCore.Qt.SortOrder.AscendingOrder):
+                if item.isVisible() and self.covers(item):
+                    groups.setdefault((item.data(0), item.data(1)), []).append(item)
+            self._visible_key = key
+            self._visible = groups
+        return self._visible
+
+
+class LayerBatchItem(QtWidgets.QGraphicsItem):
+    """
+    Слой одного материала для LayerBatchRenderer. Провода рисуются одним
+    drawLines на каждую толщину пера (точки концов — одним drawPoints
+    круглым пером), контакты — серией drawEllipse с общими пером и кистью.
+    Форма пустая: слой не перехватывает выбор мышью.
+    """
+
+    def __init__(self, kind, material, z):
+        super().__init__()
+        self.kind = kind
+        self.material = material
+        self.setZValue(z)
+        self.setData(0, "layer_batch")
+        self.setData(1, material)
+        self.setAcceptedMouseButtons(QtCore.Qt.MouseButton.NoButton)
+        self.setFlag(QtWidgets.QGraphicsItem.GraphicsItemFlag.ItemUsesExtendedStyleOption, True)
+
+    def boundingRect(self):
+        scene = self.scene()
+        return scene.sceneRect() if scene is not None else QtCore.QRectF()
+
+    def shape(self):
+        return QtGui.QPainterPath()
+
+    def paint(self, painter, option, widget=None):
+        items = LAYER_BATCH.visible(option.exposedRect).get((self.kind, self.material))
+        if not items:
+            return
+        lod = LOD.of(painter)
+        if LOD.enabled and lod < LOD.DENSITY:
+            items = [item for item in items if not LOD.hides(item, lod)]
+        if self.kind == "wire":
+            self._paint_wires(painter, items, lod)
+        else:
+            self._paint_contacts(painter, items)
+
+    def _paint_wires(self, painter, items, lod):
+        by_width = {}
+        dots = {}
+        with_dots = not LOD.enabled or lod >= LOD.DETAIL
+        for item in items:
+            pen = item.pen()
+            line = item.sceneTransform().map(item.line())
+            group = by_width.get(pen.width())
+            if group is None:
+                group = by_width[pen.width()] = (pen, [])
+            group[1].append(line)
+            if with_dots and isinstance(item, EndpointDotsMixin):
+                color = pen.color().rgba()
+                dots.setdefault((color, item.DOT_RADIUS), []).extend((line.p1(), line.p2()))
+
+        for pen, lines in by_width.values():
+            painter.setPen(pen)
+            painter.drawLines(lines)
+
+        for (color, radius), points in dots.items():
+            painter.setPen(STYLES.pen(QtGui.QColor.fromRgba(color).getRgb(), radius * 2 + 1,
+                                      cap=QtCore.Qt.PenCapStyle.RoundCap))
+            painter.drawPoints(points)
+
+    def _paint_contacts(self, painter, items):
+        by_style = {}
+        for item in items:
+            brush = item.brush()
+            key = (brush.color().rgba(), item.pen().width())
+            group = by_style.get(key)
+            if group is None:
+                group = by_style[key] = (brush, item.pen(), [])
+            group[2].append(item.sceneTransform().mapRect(item.rect()))
+
+        for brush, pen, rects in by_style.values():
+            painter.setPen(pen)
+            painter.setBrush(brush)
+            for rect in rects:
+                painter.drawEllipse(rect)
+
+
+# Общий переключатель пакетной отрисовки (меню «Вид»)
+LAYER_BATCH = LayerBatchRenderer()
+
+
+class LevelOfDetail:
+    """
+    Пороги детализации по масштабу вида (lod — levelOfDetailFromTransform:
+    1.0 — единица сцены в пиксель, минимальный масштаб колесом около 0.25).
+    Ниже DETAIL не рисуются точки концов, мелкой сетки и пунктира vline,
+    контакты становятся квадратами; ниже DENSITY провода, контакты и vline
+    внутри таблицы ячеек не рисуются — ячейки заливаются по числу элементов
+    (CellBorderItem). Текст мельче MIN_TEXT_PX пикселей скрывается.
+    """
+    DETAIL = 0.5
+    DENSITY = 0.35
+    MIN_TEXT_PX = 6
+
+    def __init__(self):
+        self.enabled = True
+        self.table_rects = {}   # сцена -> прямоугольник таблицы ячеек (draw_cell_borders)
+
+    @staticmethod
+    def of(painter):
+        return QtWidgets.QStyleOptionGraphicsItem.levelOfDetailFromTransform(painter.worldTransform())
+
+    def hides(self, item, lod):
+        """Заменяется ли элемент заливкой плотности своей ячейки"""
+        if not self.enabled or lod >= self.DENSITY or item.isSelected():
+            return False
+        rect = self.table_rects.get(item.scene())
+        return rect is not None and rect.contains(item.sceneBoundingRect())
+
+    def text_hidden(self, font, lod):
+        if not self.enabled:
+            return False
+        size = font.pointSizeF() * 4 / 3 if font.pointSizeF() > 0 else font.pixelSize()
+        return size * lod < self.MIN_TEXT_PX
+
 
-        for item in items:
-            if item.data(0) in ["grid", "axis", "axis_mark", "axis_label"]:
-                continue
+# Общие пороги детализации (меню «Вид»)
+LOD = LevelOfDetail()
 
-            # Если элемент входит в группу — удаляем всю группу
-            group = item.group()
-            if group:
-                self.scene.removeItem(group)
-            else:
-                self.scene.removeItem(item)
 
-            # После первого найденного и удалённого элемента — выход
-            break
+class LodTextMixin:
+    """Подпись, которая не рисуется, когда её текст мельче LOD.MIN_TEXT_PX"""
 
+    def paint(self, painter, option, widget=None):
+        if LOD.text_hidden(self.font(), LOD.of(painter)):
+            return
+        super().paint(painter, option, widget)
 
-class GridSnapEllipseItem(QtWidgets.QGraphicsEllipseItem):
-    def __init__(self, x, y, w, h, cell_size=20):
-        super().__init__(x, y, w, h)
-        self.cell_size = cell_size
-        # Критически важные флаги:
-        self.setFlag(QtWidgets.QGraphicsItem.GraphicsItemFlag.ItemIsMovable, True)
-        self.setFlag(QtWidgets.QGraphicsItem.GraphicsItemFlag.ItemIsSelectable, True)
-        self.setFlag(QtWidgets.QGraphicsItem.GraphicsItemFlag.ItemSendsGeometryChanges, True)
 
-    def itemChange(self, change, value):
-        #   print(f"Ellipse change: {change}, value: {value}")  # Отладочный вывод
-        if change == QtWidgets.QGraphicsItem.GraphicsItemChange.ItemPositionChange:
-            grid_size = self.cell_size
-            x = round(value.x() / self.cell_size) * self.cell_size
-            y = round(value.y() / self.cell_size) * self.cell_size
-            #   print(f"Snapping to: {x}, {y}")  # Отладочный вывод
-            return QtCore.QPointF(x, y)
-        return super().itemChange(change, value)
+class LodTextItem(LodTextMixin, QtWidgets.QGraphicsTextItem):
+    pass
 
-class GridSnapLineItem(QtWidgets.QGraphicsLineItem):
-    def __init__(self, x1=0, y1=0, x2=0, y2=0, cell_size=20):
-        super().__init__(x1, y1, x2, y2)
-        self.cell_size = cell_size
-        # Критически важные флаги:
-        self.setFlag(QtWidgets.QGraphicsItem.GraphicsItemFlag.ItemIsMovable, True)
-        self.setFlag(QtWidgets.QGraphicsItem.GraphicsItemFlag.ItemIsSelectable, True)
-        self.setFlag(QtWidgets.QGraphicsItem.GraphicsItemFlag.ItemSendsGeometryChanges, True)
 
-    def itemChange(self, change, value):
-        #   print(f"Line change: {change}, value: {value}")  # Отладочный вывод
-        if change == QtWidgets.QGraphicsItem.GraphicsItemChange.ItemPositionChange:
-            x = round(value.x() / self.cell_size) * self.cell_size
-            y = round(value.y() / self.cell_size) * self.cell_size
-            #   print(f"Snapping to: {x}, {y}")  # Отладочный вывод
-            return QtCore.QPointF(x, y)
-        return super().itemChange(change, value)
+class LodSimpleTextItem(LodTextMixin, QtWidgets.QGraphicsSimpleTextItem):
+    pass
 
-class LineWithDotsItem(QtWidgets.QGraphicsLineItem):
-    """Линия с точками на концах"""
 
-    def __init__(self, x1, y1, x2, y2, cell_size=20, parent=None):
-        super().__init__(x1, y1, x2, y2, parent)
-        self.cell_size = cell_size
+class DrcMarkerItem(QtWidgets.QGraphicsRectItem):
+    """Отметка нарушения DRC: красная рамка вокруг области нарушения с подсказкой"""
+    MIN_SIZE = 8
 
-        # Создаем точки как дочерние элементы
-        dot_radius = 10
-        self.start_dot = QtWidgets.QGraphicsEllipseItem(-dot_radius, -dot_radius,
-                                                        dot_radius * 2, dot_radius * 2, self)
-        self.end_dot = QtWidgets.QGraphicsEllipseItem(-dot_radius, -dot_radius,
-                                                      dot_radius * 2, dot_radius * 2, self)
+    def __init__(self, violation):
+        x1, y1, x2, y2 = violation.bbox
+        cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
+        w, h = max(x2 - x1, self.MIN_SIZE), max(y2 - y1, self.MIN_SIZE)
+        super().__init__(cx - w / 2, cy - h / 2, w, h)
+        self.violation = violation
+        pen = QtGui.QPen(QtGui.QColor("red"), 2)
+        pen.setCosmetic(True)
+        self.setPen(pen)
+        self.setBrush(STYLES.brush((255, 0, 0, 40)))
+        self.setZValue(100)
+        self.setData(0, "drc_marker")
+        self.setToolTip(violation.message())
 
-        # Обновляем позиции точек
-        self._update_dots_position()
 
-    def setLine(self, *args):
-        """Переопределяем setLine для обновления позиций точек"""
-        super().setLine(*args)
-        self._update_dots_position()
+class NetHighlightItem(QtWidgets.QGraphicsItem):
+    """
+    Подсветка цепи: провода и контакты цепи (фигуры nets.NetIndex) одним
+    элементом поверх раскладки. Форма пустая — щелчки и itemAt проходят насквозь.
+    """
+    MARGIN = 3
+    COLOR = (255, 190, 0, 150)
 
-    def _update_dots_position(self):
-        """Обновляет позиции точек согласно концам линии"""
-        line = self.line()
-        self.start_dot.setPos(line.x1(), line.y1())
-        self.end_dot.setPos(line.x2(), line.y2())
+    def __init__(self, net, shapes):
+        super().__init__()
+        self.net = net
+        self.shapes = shapes
+        boxes = [shape.bbox(self.MARGIN) for shape in shapes] or [(0, 0, 0, 0)]
+        x1, y1 = min(b[0] for b in boxes), min(b[1] for b in boxes)
+        x2, y2 = max(b[2] for b in boxes), max(b[3] for b in boxes)
+        self._rect = QtCore.QRectF(x1, y1, x2 - x1, y2 - y1)
+        # Перья проводов по полуширине — создаются один раз, а не при каждой отрисовке
+        color = QtGui.QColor(*self.COLOR)
+        self._pens = {}
+        for shape in shapes:
+            if shape.kind == "wire" and shape.half not in self._pens:
+                pen = QtGui.QPen(color)
+                pen.setWidthF(2 * (shape.half + self.MARGIN))
+                pen.setCapStyle(QtCore.Qt.PenCapStyle.RoundCap)
+                self._pens[shape.half] = pen
+        self.setZValue(90)
+        self.setData(0, "net_highlight")
+        self.setAcceptedMouseButtons(QtCore.Qt.MouseButton.NoButton)
+
+    def boundingRect(self):
+        return self._rect
 
-    def setPen(self, pen):
-        """Устанавливает перо для линии и цвет для точек"""
-        super().setPen(pen)
-        # Создаем кисть того же цвета для точек
-        brush = QtGui.QBrush(pen.color())
-        self.start_dot.setBrush(brush)
-        self.end_dot.setBrush(brush)
-        # Устанавливаем обводку для точек
-        dot_pen = QtGui.QPen(pen.color())
-        dot_pen.setWidth(1)
-        self.start_dot.setPen(dot_pen)
-        self.end_dot.setPen(dot_pen)
-
-    def setZValue(self, z):
-        """Устанавливает Z-порядок"""
-        super().setZValue(z)
-        # Точки должны быть немного выше линии
-        self.start_dot.setZValue(z + 0.1)
-        self.end_dot.setZValue(z + 0.1)
-
-class GridSnapLineItemWithDots(GridSnapLineItem):
-    """GridSnapLineItem с точками на концах"""
+    def shape(self):
+        return QtGui.QPainterPath()
 
-    def __init__(self, x1, y1, x2, y2, cell_size=20):
-        super().__init__(x1, y1, x2, y2, cell_size)
+    def paint(self, painter, option, widget=None):
+        painter.setBrush(STYLES.brush(self.COLOR))
+        for shape in self.shapes:
+            x1, y1, x2, y2 = shape.segment
+            if shape.kind == "wire":
+                painter.setPen(self._pens[shape.half])
+                painter.drawLine(QtCore.QLineF(x1, y1, x2, y2))
+            else:
+                r = shape.half + self.MARGIN
+                painter.setPen(STYLES.no_pen())
+                painter.drawEllipse(QtCore.QPointF(x1, y1), r, r)
 
-        # Создаем точки как дочерние элементы
-        dot_radius = 3
-        self.start_dot = QtWidgets.QGraphicsEllipseItem(-dot_radius, -dot_radius,
-                                                        dot_radius * 2, dot_radius * 2, self)
-        self.end_dot = QtWidgets.QGraphicsEllipseItem(-dot_radius, -dot_radius,
-                                                      dot_radius * 2, dot_radius * 2, self)
 
-        # Обновляем позиции точек
-        self._update_dots_position()
+class CellBorderItem(QtWidgets.QGraphicsRectItem):
+    """Рамка ячейки; при сильном отдалении (LOD.DENSITY) — блок плотности элементов"""
+    DENSITY_FULL = 40   # элементов в ячейке для самой тёмной заливки
 
-    def setLine(self, *args):
-        """Переопределяем setLine для обновления позиций точек"""
-        super().setLine(*args)
-        self._update_dots_position()
+    def __init__(self, cell):
+        super().__init__(cell.x1, cell.y1, cell.x2 - cell.x1, cell.y2 - cell.y1)
+        self.cell = cell
 
-    def _update_dots_position(self):
-        """Обновляет позиции точек согласно концам линии"""
-        line = self.line()
-        self.start_dot.setPos(line.x1(), line.y1())
-        self.end_dot.setPos(line.x2(), line.y2())
+    def paint(self, painter, option, widget=None):
+        if not LOD.enabled or LOD.of(painter) >= LOD.DENSITY or self.isSelected():
+            super().paint(painter, option, widget)
+            return
+        count = len(self.cell.elements)
+        painter.setPen(STYLES.pen("gray", 0))
+        if count:
+            alpha = min(220, 40 + 180 * count // self.DENSITY_FULL)
+            painter.setBrush(STYLES.brush((60, 60, 120, alpha)))
+        else:
+            painter.setBrush(self.brush())
+        painter.drawRect(self.rect())
 
-    def setPen(self, pen):
-        """Устанавливает перо для линии и цвет для точек"""
-        super().setPen(pen)
-        # Создаем кисть того же цвета для точек
-        brush = QtGui.QBrush(pen.color())
-        self.start_dot.setBrush(brush)
-        self.end_dot.setBrush(brush)
-        # Устанавливаем обводку для точек
-        dot_pen = QtGui.QPen(pen.color())
-        dot_pen.setWidth(1)
-        self.start_dot.setPen(dot_pen)
-        self.end_dot.setPen(dot_pen)
-
-    def setZValue(self, z):
-        """Устанавливает Z-порядок"""
-        super().setZValue(z)
-        # Точки должны быть немного выше линии
-        self.start_dot.setZValue(z + 0.1)
-        self.end_dot.setZValue(z + 0.1)
 
 class TwoPointContactGroup(QtWidgets.QGraphicsItemGroup):
     """
@@ -3633,11 +5137,9 @@ class TwoPointContactGroup(QtWidgets.QGraphicsItemGroup):
         # Первый эллипс (левый)
         ellipse1 = GridSnapEllipseItem(-r/2 - half_step, -r/2, r, r, cell_size=cell_size)
         params1 = contact_materials.get(material1, {"color":"black","z":5})
-        ellipse1.setBrush(QtGui.QBrush(QtGui.QColor(params1["color"])))
+        ellipse1.setBrush(STYLES.brush(params1["color"]))
         ellipse1.setZValue(params1["z"])
-        pen1 = QtGui.QPen(QtGui.QColor("black"))
-        pen1.setWidth(1)
-        ellipse1.setPen(pen1)
+        ellipse1.setPen(STYLES.outline_pen())
         ellipse1.setData(0, "contact")            # чтобы всё ещё считалось «контактом»
         ellipse1.setData(1, material1)            # материал
         ellipse1.setData(2, size)                 # размер
@@ -3645,11 +5147,9 @@ class TwoPointContactGroup(QtWidgets.QGraphicsItemGroup):
         # Второй эллипс (правый)
         ellipse2 = GridSnapEllipseItem(-r/2 + half_step, -r/2, r, r, cell_size=cell_size)
         params2 = contact_materials.get(material2, {"color":"black","z":5})
-        ellipse2.setBrush(QtGui.QBrush(QtGui.QColor(params2["color"])))
+        ellipse2.setBrush(STYLES.brush(params2["color"]))
         ellipse2.setZValue(params2["z"])
-        pen2 = QtGui.QPen(QtGui.QColor("black"))
-        pen2.setWidth(1)
-        ellipse2.setPen(pen2)
+        ellipse2.setPen(STYLES.outline_pen())
         ellipse2.setData(0, "contact")
         ellipse2.setData(1, material2)
         ellipse2.setData(2, size)
@@ -3657,9 +5157,7 @@ class TwoPointContactGroup(QtWidgets.QGraphicsItemGroup):
         # 2) Линия, соединяющая центры двух эллипсов:
         #    Левая точка: (-half_step, 0), правая: (+half_step, 0)
         line = GridSnapLineItem(-half_step, 0, +half_step, 0, cell_size=cell_size)
-        pen_line = QtGui.QPen(QtGui.QColor("black"))
-        pen_line.setWidth(1)
-        line.setPen(pen_line)
+        line.setPen(STYLES.outline_pen())
         line.setData(0, "contact_line")  # просто «служебный» тип, чтобы не путать с vline
         line.setFlag(QtWidgets.QGraphicsItem.GraphicsItemFlag.ItemIsSelectable, False)
         line.setFlag(QtWidgets.QGraphicsItem.GraphicsItemFlag.ItemIsMovable, False)
@@ -3738,6 +5236,11 @@ class CommentTextItem(QtWidgets.QGraphicsTextItem):
             self.is_placeholder_visible = False
 
 class TransistorItem(QtWidgets.QGraphicsItem):
+    # Общие для всех экземпляров: геометрия по (step, line_length, direction)
+    # и подготовленные надписи по типу
+    _geometry_cache = {}
+    _label_cache = {}
+
     def __init__(self, cell_size=20, line_length=40, ttype="TP", direction="NORTH"):
         super().__init__()
         self.cell_size = cell_size
@@ -3760,30 +5263,80 @@ class TransistorItem(QtWidgets.QGraphicsItem):
         # Применяем scale(1, -1) для исправления отображения
         self.setTransform(QtGui.QTransform().scale(1, -1))
 
-    def boundingRect(self) -> QtCore.QRectF:
-        """Bounding rect учитывает квадрат и линию в зависимости от направления"""
+        # Готовое изображение в координатах устройства: при панорамировании
+        # транзистор не перерисовывается, кэш сбрасывается при update() и масштабе
+        self.setCacheMode(QtWidgets.QGraphicsItem.CacheMode.DeviceCoordinateCache)
+
+    def _geometry(self):
+        """
+        Геометрия для текущих (line_length, direction): рамка, квадрат, линия
+        вывода и форма выделения. Общая для всех транзисторов с теми же
+        параметрами, поэтому атрибуты можно менять напрямую — после
+        prepareGeometryChange() берётся запись для новых значений.
+        """
+        key = (self.step, self.line_length, self.direction)
+        geometry = TransistorItem._geometry_cache.get(key)
+        if geometry is None:
+            geometry = TransistorItem._geometry_cache[key] = self._build_geometry()
+        return geometry
+
+    def _build_geometry(self):
         half = self.step / 2
         margin = 5
+        square = QtCore.QRectF(-half, 0, self.step, self.step)
 
-        # Линия может выходить за пределы квадрата
+        # Рамка учитывает квадрат и линию в зависимости от направления;
+        # линия может выходить за пределы квадрата
         line_extension = max(0, self.line_length - self.step)
-
         if self.direction in ["NORTH", "SOUTH"]:
-            # Вертикальная линия
-            return QtCore.QRectF(
-                -half - margin,
-                -line_extension - margin,
-                self.step + 2 * margin,
-                self.step + line_extension + 2 * margin
-            )
+            bounding = QtCore.QRectF(-half - margin, -line_extension - margin,
+                                     self.step + 2 * margin, self.step + line_extension + 2 * margin)
         else:  # EAST, WEST
-            # Горизонтальная линия
-            return QtCore.QRectF(
-                -line_extension - margin,
-                -half - margin,
-                self.step + line_extension + 2 * margin,
-                self.step + 2 * margin
-            )
+            bounding = QtCore.QRectF(-line_extension - margin, -half - margin,
+                                     self.step + line_extension + 2 * margin, self.step + 2 * margin)
+
+        # Линия вывода (только если длина > 0) и область вокруг неё для выделения
+        line = None
+        shape = QtGui.QPainterPath()
+        shape.addRect(square)
+        if self.line_length > 0:
+            line_width = 6
+            y_center = self.step / 2  # Центр квадрата по Y
+            if self.direction == "NORTH":
+                # Вверх от центра верхней границы квадрата
+                line = QtCore.QLineF(0, 0, 0, -self.line_length)
+                line_rect = QtCore.QRectF(-line_width / 2, self.step, line_width, self.line_length)
+            elif self.direction == "SOUTH":
+                # Вниз от центра нижней границы квадрата
+                line = QtCore.QLineF(0, self.step, 0, self.step + self.line_length)
+                line_rect = QtCore.QRectF(-line_width / 2, -self.line_length, line_width, self.line_length)
+            elif self.direction == "EAST":
+                # Вправо от центра правой границы квадрата
+                line = QtCore.QLineF(half, y_center, half + self.line_length, y_center)
+                line_rect = QtCore.QRectF(half, y_center - line_width / 2, self.line_length, line_width)
+            else:  # WEST
+                # Влево от центра левой границы квадрата
+                line = QtCore.QLineF(-half, y_center, -half - self.line_length, y_center)
+                line_rect = QtCore.QRectF(-half - self.line_length, y_center - line_width / 2,
+                                          self.line_length, line_width)
+            shape.addRect(line_rect)
+
+        return bounding, square, line, shape
+
+    @staticmethod
+    def _label(ttype, font):
+        """Подготовленная надпись TP/TN (QStaticText), общая для всех транзисторов"""
+        text = TransistorItem._label_cache.get(ttype)
+        if text is None:
+            text = QtGui.QStaticText(str(ttype))
+            text.setTextFormat(QtCore.Qt.TextFormat.PlainText)
+            text.prepare(QtGui.QTransform(), font)
+            TransistorItem._label_cache[ttype] = text
+        return text
+
+    def boundingRect(self) -> QtCore.QRectF:
+        """Bounding rect учитывает квадрат и линию в зависимости от направления"""
+        return self._geometry()[0]
 
     def paint(
             self,
@@ -3795,71 +5348,40 @@ class TransistorItem(QtWidgets.QGraphicsItem):
         try:
             painter.save()
 
-            # Определяем цвета
-            if self.ttype == "TN":
-                border_color = QtGui.QColor("red")
-            else:  # TP
-                border_color = QtGui.QColor("blue")
+            lod = LOD.of(painter)
+            border_color = "red" if self.ttype == "TN" else "blue"
+            _, square, line, _ = self._geometry()
 
-            line_color = QtGui.QColor("green")
+            if LOD.enabled and lod < LOD.DETAIL and not self.isSelected():
+                # При отдалении — только квадрат цвета типа
+                painter.setPen(STYLES.no_pen())
+                painter.setBrush(STYLES.brush(border_color))
+                painter.drawRect(square)
+                return
 
-            # 1) Рисуем квадрат 40×40 с цветными границами
-            pen = QtGui.QPen(border_color)
-            pen.setWidth(1)
-            painter.setPen(pen)
-            painter.setBrush(QtGui.QBrush(QtGui.QColor("white")))
-
-            half = self.step / 2
-            rect = QtCore.QRectF(-half, 0, self.step, self.step)
-            painter.drawRect(rect)
-
-            # 2) Рисуем линию в зависимости от направления (только если длина > 0)
-            if self.line_length > 0:
-                line_pen = QtGui.QPen(line_color, 3)
-                painter.setPen(line_pen)
-
-                if self.direction == "NORTH":
-                    # Линия вверх от центра верхней границы квадрата
-                    y_start = 0  # Верхняя граница квадрата
-                    y_end = y_start - self.line_length  # Линия идет вверх
-                    line = QtCore.QLineF(0, y_start, 0, y_end)
-
-                elif self.direction == "SOUTH":
-                    # Линия вниз от центра нижней границы квадрата
-                    y_start = self.step  # Нижняя граница квадрата
-                    y_end = y_start + self.line_length  # Линия идет вниз
-                    line = QtCore.QLineF(0, y_start, 0, y_end)
-
-                elif self.direction == "EAST":
-                    # Линия вправо от центра правой границы квадрата
-                    x_start = half  # Правая граница квадрата
-                    x_end = x_start + self.line_length  # Линия идет вправо
-                    y_center = self.step / 2  # Центр квадрата по Y
-                    line = QtCore.QLineF(x_start, y_center, x_end, y_center)
-
-                elif self.direction == "WEST":
-                    # Линия влево от центра левой границы квадрата
-                    x_start = -half  # Левая граница квадрата
-                    x_end = x_start - self.line_length  # Линия идет влево
-                    y_center = self.step / 2  # Центр квадрата по Y
-                    line = QtCore.QLineF(x_start, y_center, x_end, y_center)
+            # 1) Рисуем квадрат 40×40 с цветными границами (красные у TN, синие у TP)
+            painter.setPen(STYLES.pen(border_color))
+            painter.setBrush(STYLES.brush("white"))
+            painter.drawRect(square)
 
+            # 2) Линия в зависимости от направления
+            if line is not None:
+                painter.setPen(STYLES.pen("green", 3))
                 painter.drawLine(line)
 
-            # 3) Текст TP/TN внутри квадрата
-            text_pen = QtGui.QPen(QtGui.QColor("black"))
-            painter.setPen(text_pen)
-
-            font = QtGui.QFont()
-            font.setPointSize(8)
+            # 3) Текст TP/TN в центре квадрата
+            font = STYLES.font(8)
+            if LOD.text_hidden(font, lod):
+                return
+            label = self._label(self.ttype, font)
+            size = label.size()
+            painter.setPen(STYLES.pen("black"))
             painter.setFont(font)
-
-            # Текст в центре квадрата
-            text_rect = QtCore.QRectF(-half, 0, self.step, self.step)
-            painter.drawText(text_rect, QtCore.Qt.AlignmentFlag.AlignCenter, str(self.ttype))
+            painter.drawStaticText(QtCore.QPointF(square.center().x() - size.width() / 2,
+                                                  square.center().y() - size.height() / 2), label)
 
         except Exception as e:
-            print(f"Ошибка в paint() TransistorItem: {e}")
+            log_ui.error("Ошибка в paint() TransistorItem: %s", e)
         finally:
             painter.restore()
 
@@ -3873,37 +5395,13 @@ class TransistorItem(QtWidgets.QGraphicsItem):
                     y = round(new_pos.y() / self.cell_size) * self.cell_size
                     return QtCore.QPointF(x, y)
         except Exception as e:
-            print(f"Ошибка в itemChange() TransistorItem: {e}")
+            log_ui.error("Ошибка в itemChange() TransistorItem: %s", e)
 
         return super().itemChange(change, value)
 
     def shape(self):
         """Область для выделения включает квадрат и линию"""
-        path = QtGui.QPainterPath()
-
-        # Добавляем квадрат
-        half = self.step / 2
-        path.addRect(-half, 0, self.step, self.step)
-
-        # Добавляем область вокруг линии для удобства выделения (только если линия есть)
-        if self.line_length > 0:
-            line_width = 6
-
-            if self.direction == "NORTH":
-                line_rect = QtCore.QRectF(-line_width / 2, self.step, line_width, self.line_length)
-                path.addRect(line_rect)
-            elif self.direction == "SOUTH":
-                line_rect = QtCore.QRectF(-line_width / 2, -self.line_length, line_width, self.line_length)
-                path.addRect(line_rect)
-            elif self.direction == "EAST":
-                line_rect = QtCore.QRectF(half, self.step / 2 - line_width / 2, self.line_length, line_width)
-                path.addRect(line_rect)
-            elif self.direction == "WEST":
-                line_rect = QtCore.QRectF(-half - self.line_length, self.step / 2 - line_width / 2, self.line_length,
-                                          line_width)
-                path.addRect(line_rect)
-
-        return path
+        return self._geometry()[3]
 
 class ToolBarWidget(QtWidgets.QWidget):
     def __init__(self, parent=None):
@@ -4007,20 +5505,24 @@ class ToolBarWidget(QtWidgets.QWidget):
         for item in items:
             if hasattr(item, 'data'):
                 item_type = item.data(0)
-                if item_type not in ["grid", "axis", "axis_mark", "axis_label"]:
+                if item_type not in ["grid", "axis", "axis_mark", "axis_label", "layer_batch"]:
                     items_to_remove.append(item)
             elif not isinstance(item, (QtWidgets.QGraphicsLineItem, QtWidgets.QGraphicsTextItem)):
                 items_to_remove.append(item)
 
         for item in items_to_remove:
             scene.removeItem(item)
+        if hasattr(self.parent, 'virtualizer'):
+            self.parent.virtualizer.clear()
 
         if hasattr(self.parent, 'cell_manager'):
             self.parent.cell_manager.columns.clear()
             self.parent.cell_manager.rows.clear()
             self.parent.cell_manager.cells.clear()
 
-        print("Все элементы удалены, кроме сетки и осей")
+        if hasattr(self.parent, 'notify_model_change'):
+            self.parent.notify_model_change("reset")
+        log_ui.info("Все элементы удалены, кроме сетки и осей")
 
     def on_tool_changed(self, checked, tool_id):
         if checked:
@@ -4029,14 +5531,14 @@ class ToolBarWidget(QtWidgets.QWidget):
     def on_layer_selected(self, layer_number, button):
         if self.active_layer_button == button:
             #  Повторное нажатие — отключить фильтр
-            print("Слой отключен. Переход в общий режим.")
+            log_ui.debug("Слой отключен. Переход в общий режим.")
             self.active_layer_button = None
             button.setChecked(False)
             self.parent.active_layer = 0  # 0 — общий слой
             self.update_layer_locking(0)
         else:
             #  Новый слой выбран
-            print(f"Активирован слой {layer_number}")
+            log_ui.debug("Активирован слой %s", layer_number)
             if self.active_layer_button:
                 self.active_layer_button.setChecked(False)
             button.setChecked(True)
@@ -4080,6 +5582,9 @@ class ToolBarWidget(QtWidgets.QWidget):
             item.setFlag(QtWidgets.QGraphicsItem.GraphicsItemFlag.ItemIsMovable, is_active)
 
 class CellManager:
+    # Заливка ячеек по очереди (r, g, b, a)
+    BORDER_COLORS = ((200, 200, 255, 50), (255, 200, 200, 50), (200, 255, 200, 50))
+
     def __init__(self, scene: QtWidgets.QGraphicsScene):
         self.scene = scene
         self.columns: List[float] = []
@@ -4087,20 +5592,27 @@ class CellManager:
         self.cells: List['Cell'] = []
         self.cell_graphics_items: List[QtWidgets.QGraphicsItem] = []
         self.virtual_lines: List[Dict[str, object]] = []
-
-    def add_column(self, x_pos: float):
-        """Добавляет вертикальный столбец по x-координате"""
+        # Растёт при каждом применении распределения (и выгрузке/возврате ячеек
+        # CellVirtualizer) — по нему отбрасываются устаревшие фоновые расчёты
+        self.revision = 0
+        self.virtualizer = None
+        self._cell_grid = None  # (ключ, CellGrid) для cell_grid
+
+    def add_column(self, x_pos: float, update: bool = True):
+        """Добавляет вертикальный столбец по x-координате (update=False — без пересчёта ячеек)"""
         if x_pos not in self.columns:
             self.columns.append(x_pos)
             self.columns.sort()
-            self.update_cells()
+            if update:
+                self.update_cells()
 
-    def add_row(self, y_pos: float):
-        """Добавляет горизонтальную строку по y-координате"""
+    def add_row(self, y_pos: float, update: bool = True):
+        """Добавляет горизонтальную строку по y-координате (update=False — без пересчёта ячеек)"""
         if y_pos not in self.rows:
             self.rows.append(y_pos)
             self.rows.sort()
-            self.update_cells()
+            if update:
+                self.update_cells()
 
     def update_cells(self):
         """Пересчитывает ячейки на основе текущих строк и столбцов"""
@@ -4126,6 +5638,7 @@ class CellManager:
                 return cell
         return None
 
+    @timed("draw_cell_borders")
     def draw_cell_borders(self):
         """Рисует границы и подписи ячеек"""
         for item in self.cell_graphics_items:
@@ -4134,21 +5647,13 @@ class CellManager:
 
         step = getattr(self.scene.parent(), "step", 40)
 
-        for cell in self.cells:
-            rect = QtWidgets.QGraphicsRectItem(cell.x1, cell.y1,
-                                               cell.x2 - cell.x1, cell.y2 - cell.y1)
-
-            color_index = self.cells.index(cell) % 3
-            colors = [
-                QtGui.QColor(200, 200, 255, 50),
-                QtGui.QColor(255, 200, 200, 50),
-                QtGui.QColor(200, 255, 200, 50)
-            ]
+        table = QtCore.QRectF()
+        for index, cell in enumerate(self.cells):
+            rect = CellBorderItem(cell)
+            table = table.united(rect.rect())
 
-            rect.setBrush(QtGui.QBrush(colors[color_index]))
-            pen = QtGui.QPen(QtGui.QColor("black"), 1)
-            pen.setStyle(QtCore.Qt.PenStyle.DashLine)
-            rect.setPen(pen)
+            rect.setBrush(STYLES.brush(self.BORDER_COLORS[index % 3]))
+            rect.setPen(STYLES.pen("black", 1, QtCore.Qt.PenStyle.DashLine))
 
             rect.setZValue(1)
             rect.setFlag(QtWidgets.QGraphicsItem.GraphicsItemFlag.ItemIsSelectable, True)
@@ -4158,17 +5663,22 @@ class CellManager:
             self.scene.addItem(rect)
             self.cell_graphics_items.append(rect)
 
-            label = QtWidgets.QGraphicsSimpleTextItem(cell.name)
+            label = LodSimpleTextItem(cell.name)
             label.setPos(cell.x1 + 15, cell.y1 + 20)
-            label.setBrush(QtGui.QBrush(QtGui.QColor("gray")))
+            label.setBrush(STYLES.brush("gray"))
             label.setTransform(QtGui.QTransform().scale(1, -1))
             label.setZValue(2)
             self.scene.addItem(label)
             self.cell_graphics_items.append(label)
 
+        if self.cells:
+            LOD.table_rects[self.scene] = table
+        else:
+            LOD.table_rects.pop(self.scene, None)
+
     def remove_cell(self, cell: 'Cell'):
         """Удаляет ячейку и связанные с ней элементы"""
-        print(f"Удаление ячейки {cell.name}")
+        log_cells.debug("Удаление ячейки %s", cell.name)
         try:
             # Удаляем графические элементы ячейки
             items_to_remove = []
@@ -4206,31 +5716,30 @@ class CellManager:
             # Удаляем ячейку из списка
             if cell in self.cells:
                 self.cells.remove(cell)
-                print(f"Ячейка {cell.name} удалена из CellManager.cells")
+                log_cells.debug("Ячейка %s удалена из CellManager.cells", cell.name)
 
         except Exception as e:
-            print(f"Ошибка при удалении ячейки {cell.name}: {e}")
-            traceback.print_exc()
+            log_cells.exception("Ошибка при удалении ячейки %s: %s", cell.name, e)
 
     def add_cell(self, cell: 'Cell'):
         """Добавляет ячейку в список"""
         if cell not in self.cells:
             self.cells.append(cell)
-            print(f"Ячейка {cell.name} добавлена в CellManager.cells")
+            log_cells.debug("Ячейка %s добавлена в CellManager.cells", cell.name)
 
     def register_vline_intersections(self, line_item: QtWidgets.QGraphicsLineItem):
         """Регистрирует виртуальную линию в ячейках"""
         try:
             line_name = line_item.data(1)
-            print(f"\n=== Регистрация vline: {line_name} ===")
+            debug = log_cells.isEnabledFor(logging.DEBUG)
 
+            removed = 0
             for cell in self.cells:
                 old_count = len(cell.virtual_lines)
                 cell.virtual_lines = [
                     vl for vl in cell.virtual_lines if vl.get("name") != line_name
                 ]
-                if old_count != len(cell.virtual_lines):
-                    print(f"  У ячейки {cell.name} убрано {old_count - len(cell.virtual_lines)} старых записей")
+                removed += old_count - len(cell.virtual_lines)
 
             ln: QtCore.QLineF = line_item.line()
             p1_scene = line_item.mapToScene(ln.p1())
@@ -4238,14 +5747,12 @@ class CellManager:
             x1, y1 = p1_scene.x(), p1_scene.y()
             x2, y2 = p2_scene.x(), p2_scene.y()
 
-            print(f"  Сценные координаты линии: ({x1:.1f}, {y1:.1f}) – ({x2:.1f}, {y2:.1f})")
             eps = 0.1
             registrations = 0
 
             if abs(x1 - x2) < eps:
                 x_const = x1
                 y_min, y_max = min(y1, y2), max(y1, y2)
-                print(f"  Это вертикальная линия x={x_const:.1f}, y∈[{y_min:.1f}, {y_max:.1f}]")
 
                 for cell in self.cells:
                     if abs(x_const - cell.x1) < eps and not (y_max < cell.y1 or y_min > cell.y2):
@@ -4254,21 +5761,22 @@ class CellManager:
                             "relation": "lft",
                             "value": x_const
                         })
-                        print(f"      ✓ Совпало с левой гранью (lft) ячейки {cell.name}")
                         registrations += 1
+                        if debug:
+                            log_cells.debug("vline %s: левая грань (lft) ячейки %s", line_name, cell.name)
                     if abs(x_const - cell.x2) < eps and not (y_max < cell.y1 or y_min > cell.y2):
                         cell.virtual_lines.append({
                             "name": line_name,
                             "relation": "rht",
                             "value": x_const
                         })
-                        print(f"      ✓ Совпало с правой гранью (rht) ячейки {cell.name}")
                         registrations += 1
+                        if debug:
+                            log_cells.debug("vline %s: правая грань (rht) ячейки %s", line_name, cell.name)
 
             elif abs(y1 - y2) < eps:
                 y_const = y1
                 x_min, x_max = min(x1, x2), max(x1, x2)
-                print(f"  Это горизонтальная линия y={y_const:.1f}, x∈[{x_min:.1f}, {x_max:.1f}]")
 
                 for cell in self.cells:
                     if abs(y_const - cell.y1) < eps and not (x_max < cell.x1 or x_min > cell.x2):
@@ -4277,88 +5785,100 @@ class CellManager:
                             "relation": "btm",
                             "value": y_const
                         })
-                        print(f"      ✓ Совпало с нижней гранью (btm) ячейки {cell.name}")
                         registrations += 1
+                        if debug:
+                            log_cells.debug("vline %s: нижняя грань (btm) ячейки %s", line_name, cell.name)
                     if abs(y_const - cell.y2) < eps and not (x_max < cell.x1 or x_min > cell.x2):
                         cell.virtual_lines.append({
                             "name": line_name,
                             "relation": "top",
                             "value": y_const
                         })
-                        print(f"      ✓ Совпало с верхней гранью (top) ячейки {cell.name}")
                         registrations += 1
+                        if debug:
+                            log_cells.debug("vline %s: верхняя грань (top) ячейки %s", line_name, cell.name)
 
-            print(f"  Всего регистраций для {line_name}: {registrations}")
+            log_cells.debug("vline %s (%.1f, %.1f) – (%.1f, %.1f): регистраций %d, убрано старых %d",
+                            line_name, x1, y1, x2, y2, registrations, removed)
 
         except Exception as e:
-            print(f"Ошибка в register_vline_intersections: {e}")
-            traceback.print_exc()
+            log_cells.exception("Ошибка в register_vline_intersections: %s", e)
 
-    def assign_elements_to_cells(self):
-        """Перераспределяет элементы по ячейкам"""
-        print("Перераспределение элементов по ячейкам...")
-        for cell in self.cells:
+    def take_snapshot(self):
+        """
+        Неизменяемый снимок ячеек, проводов и контактов для расчётов layout_model.
+        Возвращает (snapshot, items), где items[i] — элемент сцены для snapshot.elements[i].
+        """
+        cells = tuple(CellBounds(c.x1, c.y1, c.x2, c.y2, c.name) for c in self.cells)
+        elements = []
+        items = []
+
+        for item in self.scene.items():
+            record = self.element_record(item)
+            if record is not None:
+                elements.append(record)
+                items.append(item)
+
+        # Выгруженные CellVirtualizer элементы участвуют в расчётах без элемента сцены
+        if self.virtualizer is not None:
+            for rec in self.virtualizer.element_records():
+                elements.append(rec)
+                items.append(None)
+
+        return LayoutSnapshot(cells, tuple(elements)), items
+
+    def cell_grid(self):
+        """CellGrid layout_model по текущим ячейкам; пересобирается при смене revision"""
+        if self._cell_grid is None or self._cell_grid[0] != (self.revision, len(self.cells)):
+            cells = tuple(CellBounds(c.x1, c.y1, c.x2, c.y2, c.name) for c in self.cells)
+            self._cell_grid = ((self.revision, len(self.cells)), CellGrid(cells))
+        return self._cell_grid[1]
+
+    @staticmethod
+    def element_record(item):
+        """ElementRecord провода или контакта сцены (None для прочих элементов)"""
+        item_type = item.data(0)
+        if item_type == "wire" and isinstance(item, QtWidgets.QGraphicsLineItem):
+            line = item.line()
+            pos = item.scenePos()
+            return ElementRecord(
+                "wire", item.data(1),
+                line.x1() + pos.x(), line.y1() + pos.y(),
+                line.x2() + pos.x(), line.y2() + pos.y(),
+                item.data(2), item.pen().width()
+            )
+        if item_type == "contact" and isinstance(item, QtWidgets.QGraphicsEllipseItem):
+            # Центр эллипса, а не позиция: у эллипсов TwoPointContactGroup
+            # scenePos — центр группы, сами они смещены на ±cell_size/2
+            center = item.sceneBoundingRect().center()
+            return ElementRecord(
+                "contact", item.data(1),
+                center.x(), center.y(), center.x(), center.y(),
+                item.data(2), 0
+            )
+        return None
+
+    def apply_assignment(self, assignment, items):
+        """Записывает результат compute_cell_assignment в ячейки (только GUI-поток)"""
+        for cell, (indices, layers) in zip(self.cells, assignment):
             cell.clear_elements()
+            cell.elements.extend(items[i] for i in indices if items[i] is not None)
             cell.cif_layers.clear()
+            cell.cif_layers.update(layers)
             cell.virtual_lines.clear()
+        self.revision += 1
 
-        for item in self.scene.items():
-            if not hasattr(item, 'data'):
-                bounds = item.mapToScene(item.boundingRect()).boundingRect()
-                center = bounds.center()
-                cell = self.get_cell_at(center)
-                if cell:
-                    cell.add_element(item)
-                continue
-
-            item_type = item.data(0)
-            if item_type in ["grid", "axis", "axis_mark", "axis_label", "column", "row", "cell", "vline"]:
-                continue
+    def apply_vline_registrations(self, registrations):
+        """Заменяет cell.virtual_lines списками из collect_vline_registrations"""
+        for cell, entries in zip(self.cells, registrations):
+            cell.virtual_lines = list(entries)
 
-            if item_type == "wire" and isinstance(item, QtWidgets.QGraphicsLineItem):
-                line = item.line()
-                pos = item.scenePos()
-                p1 = QtCore.QPointF(line.x1() + pos.x(), line.y1() + pos.y())
-                p2 = QtCore.QPointF(line.x2() + pos.x(), line.y2() + pos.y())
-
-                cells_for_line = set()
-                cell1 = self.get_cell_at(p1)
-                if cell1:
-                    cells_for_line.add(cell1)
-                cell2 = self.get_cell_at(p2)
-                if cell2:
-                    cells_for_line.add(cell2)
-
-                for cell in cells_for_line:
-                    cell.add_element(item)
-                    elem_data = {
-                        'type': 'wire',
-                        'layer': item.data(1),
-                        'x1': p1.x(),
-                        'y1': p1.y(),
-                        'x2': p2.x(),
-                        'y2': p2.y(),
-                        'width': item.pen().width()
-                    }
-                    if elem_data['layer'] not in cell.cif_layers:
-                        cell.cif_layers[elem_data['layer']] = []
-                    cell.cif_layers[elem_data['layer']].append(elem_data)
-
-            elif item_type == "contact" and isinstance(item, QtWidgets.QGraphicsEllipseItem):
-                pos = item.scenePos()
-                cell = self.get_cell_at(pos)
-                if cell:
-                    cell.add_element(item)
-                    elem_data = {
-                        'type': 'contact',
-                        'layer': item.data(1),
-                        'x': pos.x(),
-                        'y': pos.y(),
-                        'diameter': item.data(2)
-                    }
-                    if elem_data['layer'] not in cell.cif_layers:
-                        cell.cif_layers[elem_data['layer']] = []
-                    cell.cif_layers[elem_data['layer']].append(elem_data)
+    @timed("assign_elements_to_cells")
+    def assign_elements_to_cells(self):
+        """Перераспределяет элементы по ячейкам"""
+        snapshot, items = self.take_snapshot()
+        self.apply_assignment(compute_cell_assignment(snapshot), items)
+        log_cells.debug("Перераспределено элементов: %d по %d ячейкам", len(items), len(self.cells))
 
 class Cell:
     def __init__(self, x1: float, y1: float, x2: float, y2: float, name: str = ""):
@@ -4372,17 +5892,27 @@ class Cell:
         self.labelItem = None
         self.virtual_lines: List[Dict[str, object]] = []
 
-    def to_cif(self) -> str:
-        """Генерация CIF-описания ячейки"""
+    def to_cif(self, clip: bool = False) -> str:
+        """Генерация CIF-описания ячейки; clip — провода обрезаются границей ячейки"""
         cif_lines = [f"DS {int(self.x1)} {int(self.y1)} {int(self.x2)} {int(self.y2)};"]
+        rect = (self.x1, self.y1, self.x2, self.y2)
         for layer_name, elements in self.cif_layers.items():
             cif_lines.append(f"L {layer_name};")
+            wires = [e for e in elements if e['type'] == 'wire']
+            segments = [(e['x1'], e['y1'], e['x2'], e['y2']) for e in wires]
+            if clip:
+                segments = clip_segments(segments, rect)
+            wire_segments = {id(e): seg for e, seg in zip(wires, segments)}
             for elem in elements:
                 if elem['type'] == 'wire':
+                    segment = wire_segments[id(elem)]
+                    if segment is None:
+                        continue
+                    x1, y1, x2, y2 = segment
                     cif_lines.append(
                         f"W {elem['layer']} {elem['width']} "
-                        f"({elem['x1']} {elem['y1']}) "
-                        f"({elem['x2']} {elem['y2']});"
+                        f"({x1} {y1}) "
+                        f"({x2} {y2});"
                     )
                 elif elem['type'] == 'contact':
                     cif_lines.append(
@@ -4404,10 +5934,10 @@ class Cell:
     def draw_border(self, scene: QtWidgets.QGraphicsScene):
         rect = QtWidgets.QGraphicsRectItem(self.x1, self.y1,
                                            self.x2 - self.x1, self.y2 - self.y1)
-        pen = QtGui.QPen(QtGui.QColor("black"), 1, QtCore.Qt.PenStyle.DashLine)
-        rect.setPen(pen)
+        rect.setPen(STYLES.pen("black", 1, QtCore.Qt.PenStyle.DashLine))
         rect.setZValue(-1)
         scene.addItem(rect)
+        return rect
 
 class CellCommentManager:
     def __init__(self, scene: QtWidgets.QGraphicsScene, canvas: InfiniteCanvas):
@@ -4423,6 +5953,7 @@ class CellCommentManager:
             except:
                 pass
 
+    @timed("update_comments")
     def update_comments(self, columns, rows):
         self.clear_comments()
         if not self.scene:
@@ -4470,17 +6001,13 @@ class CellCommentManager:
                                            abs(x2 - x1), abs(y2 - y1))
         rect.setFlag(QtWidgets.QGraphicsItem.GraphicsItemFlag.ItemIsSelectable, True)
 
-        pen = QtGui.QPen(QtGui.QColor(150, 150, 200))
-        pen.setStyle(QtCore.Qt.PenStyle.DashLine)
-        pen.setWidth(1)
-        rect.setPen(pen)
-
-        rect.setBrush(QtGui.QBrush(QtGui.QColor(230, 230, 250, 120)))
+        rect.setPen(STYLES.pen((150, 150, 200), 1, QtCore.Qt.PenStyle.DashLine))
+        rect.setBrush(STYLES.brush((230, 230, 250, 120)))
         rect.setZValue(-5)
         rect.setData(0, comment_type)  # "column_comment" или "row_comment"
 
         # 2) Создаем и позиционируем текст внутри этого прямоугольника
-        text_item = QtWidgets.QGraphicsSimpleTextItem(text, rect)
+        text_item = LodSimpleTextItem(text, rect)
         # Визуально «переворачиваем» по Y, чтобы текст в итоге отображался нормально:
         text_item.setTransform(QtGui.QTransform().scale(1, -1))
 
@@ -4554,14 +6081,12 @@ class CellComment:
         )
 
         # Настраиваем стиль
-        rect.setBrush(QtGui.QBrush(QtGui.QColor(240, 240, 240, 150)))  # Светло-серый с прозрачностью
-        pen = QtGui.QPen(QtGui.QColor(200, 200, 200), 1)
-        pen.setStyle(QtCore.Qt.PenStyle.DashLine)
-        rect.setPen(pen)
+        rect.setBrush(STYLES.brush((240, 240, 240, 150)))  # Светло-серый с прозрачностью
+        rect.setPen(STYLES.pen((200, 200, 200), 1, QtCore.Qt.PenStyle.DashLine))
         rect.setZValue(-2)  # Чтобы был под основными элементами
 
         # Добавляем текст
-        text_item = QtWidgets.QGraphicsTextItem(self.text)
+        text_item = LodTextItem(self.text)
         text_item.setDefaultTextColor(QtGui.QColor(100, 100, 100))
         text_item.setPos(min(self.x1, self.x2) + 5, min(self.y1, self.y2) + 5)
         text_item.setZValue(-1)
@@ -4597,7 +6122,703 @@ class CellComment:
 
 
 
+class CellVirtualizer:
+    """
+    Ленивая материализация ячеек. Одиночные провода и контакты ячеек, не
+    пересекающих видимую область (с запасом MARGIN_PX пикселей), снимаются
+    со сцены и хранятся описаниями item_to_record; когда ячейка снова
+    приближается к экрану, элементы создаются заново с теми же uid.
+    Модель при этом не меняется: cif_layers ячеек остаются прежними,
+    take_snapshot и capture_layout учитывают выгруженные описания, а
+    операции над всей раскладкой (экспорт, спецификации, матрицирование)
+    выполняются внутри all_materialized() (декоратор materialized).
+    Выделенные, перемещаемые и составные элементы не выгружаются.
+    """
+    MARGIN_PX = 300
+    REFRESH_MS = 100
+
+    def __init__(self, canvas):
+        self.canvas = canvas
+        self.enabled = False
+        self.parked = {}    # (x1, y1) ячейки -> [описание элемента]
+        self._hold = 0
+        self._timer = QtCore.QTimer(canvas)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(self.REFRESH_MS)
+        self._timer.timeout.connect(self.refresh)
+        canvas.view.horizontalScrollBar().valueChanged.connect(self.schedule)
+        canvas.view.verticalScrollBar().valueChanged.connect(self.schedule)
+
+    def set_enabled(self, enabled):
+        self.enabled = enabled
+        if enabled:
+            self.refresh()
+        else:
+            self.materialize_all()
+
+    def schedule(self, *args):
+        if self.enabled:
+            self._timer.start()
+
+    def hold(self):
+        """Приостанавливает выгрузку до парного release"""
+        self._hold += 1
+
+    def release(self):
+        """Снимает hold; когда удержаний не осталось, выгрузка догоняет вид"""
+        self._hold -= 1
+        self.schedule()
+
+    @contextlib.contextmanager
+    def all_materialized(self):
+        """Вся раскладка на сцене на время блока; выгрузка приостановлена"""
+        # Без условия на _hold: удержание порционной операцией не значит,
+        # что выгруженного не осталось (materialize_all без него ничего не делает)
+        self.materialize_all()
+        self.hold()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def visible_rect(self):
+        view = self.canvas.view
+        m = self.MARGIN_PX
+        return view.mapToScene(view.viewport().rect().adjusted(-m, -m, m, m)).boundingRect()
+
+    def refresh(self):
+        canvas = self.canvas
+        if not self.enabled or self._hold or canvas.active_task is not None:
+            return
+        visible = self.visible_rect()
+        parked_before = sum(len(v) for v in self.parked.values())
+        for cell in canvas.cell_manager.cells:
+            rect = QtCore.QRectF(cell.x1, cell.y1, cell.x2 - cell.x1, cell.y2 - cell.y1)
+            if rect.intersects(visible):
+                self.materialize(cell)
+            else:
+                self.park(cell, rect)
+        log_cells.debug("Выгружено элементов: %d (было %d)",
+                        sum(len(v) for v in self.parked.values()), parked_before)
+
+    def park(self, cell, rect):
+        canvas = self.canvas
+        keep = (canvas.temp_line, canvas.moving_item)
+        items = [
+            item for item in canvas.scene.items(rect, QtCore.Qt.ItemSelectionMode.ContainsItemBoundingRect)
+            if item.data(0) in ("wire", "contact") and item.parentItem() is None
+            and isinstance(item, (GridSnapLineItem, GridSnapEllipseItem))
+            and not item.isSelected() and not any(item is k for k in keep)
+        ]
+        if not items:
+            return
+
+        records = self.parked.setdefault((cell.x1, cell.y1), [])
+        gone = set()
+        for item in items:
+            rec = canvas.item_to_record(item)
+            if rec is None:
+                continue
+            if rec["kind"] == "wire":
+                rec["pen_width"] = item.pen().width()
+            records.append(rec)
+            gone.add(id(item))
+            canvas.scene.removeItem(item)
+        cell.elements[:] = [e for e in cell.elements if id(e) not in gone]
+        canvas.cell_manager.revision += 1
+        canvas.invalidate_spatial_index()
+        canvas.invalidate_net_index()
+
+    def materialize(self, cell):
+        records = self.parked.pop((cell.x1, cell.y1), None)
+        if not records:
+            return
+        for rec in records:
+            item = self.canvas.add_item_from_record(rec)
+            if item is not None:
+                cell.elements.append(item)
+        self.canvas.cell_manager.revision += 1
+        self.canvas.invalidate_spatial_index()
+        self.canvas.invalidate_net_index()
+
+    def materialize_all(self):
+        if not self.parked:
+            return
+        cells = {(cell.x1, cell.y1): cell for cell in self.canvas.cell_manager.cells}
+        with self.canvas.bulk_insert():
+            for key in list(self.parked):
+                cell = cells.get(key)
+                if cell is not None:
+                    self.materialize(cell)
+                else:
+                    for rec in self.parked.pop(key):
+                        self.canvas.add_item_from_record(rec)
+
+    def parked_records(self):
+        """Описания выгруженных элементов в формате item_to_record"""
+        for records in self.parked.values():
+            for rec in records:
+                yield {k: v for k, v in rec.items() if k != "pen_width"}
+
+    def element_records(self):
+        """Выгруженные элементы как ElementRecord для снимка layout_model"""
+        for records in self.parked.values():
+            for rec in records:
+                if rec["kind"] == "wire":
+                    yield ElementRecord("wire", rec["material"], rec["x1"], rec["y1"], rec["x2"], rec["y2"],
+                                        rec["width"], rec["pen_width"])
+                else:
+                    yield ElementRecord("contact", rec["material"], rec["x"], rec["y"], rec["x"], rec["y"],
+                                        rec["size"], 0)
+
+    def save_state(self):
+        return {key: list(records) for key, records in self.parked.items()}
+
+    def restore_state(self, state):
+        self.parked = {key: list(records) for key, records in state.items()}
+        self.schedule()
+
+    def clear(self):
+        self.parked.clear()
+
+
+class LayoutJournal:
+    """
+    Автосохранение: журнал операций (journal.log, одна JSON-строка на правку)
+    плюс периодический сжатый снимок (checkpoint.json), после записи которого
+    журнал обнуляется. Запись на диск идёт в фоновом потоке пачками,
+    fsync — по таймеру, поэтому рисование не ждёт диска.
+    """
+
+    FSYNC_INTERVAL = 1.0             # секунды
+    CHECKPOINT_INTERVAL_MS = 60000   # период сжатия журнала
+    RESET_DELAY_MS = 500             # массовые правки сливаем в один снимок
+
+    def __init__(self, canvas, directory):
+        self.canvas = canvas
+        self.directory = directory
+        self.journal_path = os.path.join(directory, "journal.log")
+        self.checkpoint_path = os.path.join(directory, "checkpoint.json")
+
+        self._queue = queue.Queue()
+        self._thread = None
+        self._seq = 0
+        self._dirty = False
+        self._replaying = False
+
+        self.timer = QtCore.QTimer(canvas)
+        self.timer.timeout.connect(self.checkpoint_if_dirty)
+
+        self._reset_timer = QtCore.QTimer(canvas)
+        self._reset_timer.setSingleShot(True)
+        self._reset_timer.setInterval(self.RESET_DELAY_MS)
+        self._reset_timer.timeout.connect(self.checkpoint)
+
+    # --- Жизненный цикл ---
+
+    def start(self):
+        """Предлагает восстановить прошлый сеанс и запускает фоновую запись"""
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+        except OSError as e:
+            log_autosave.warning("Автосохранение отключено: %s", e)
+            return
+
+        state = self.load_state()
+        if state is not None and (state["elements"] or state["columns"] or state["rows"]):
+            reason = "Предыдущий сеанс завершился аварийно." if not state["clean"] \
+                else "Найден сохранённый предыдущий сеанс."
+            answer = QtWidgets.QMessageBox.question(
+                self.canvas, "Восстановление",
+                f"{reason}\nВосстановить элементов: {len(state['elements'])}?"
+            )
+            if answer == QtWidgets.QMessageBox.StandardButton.Yes:
+                self._replaying = True
+                try:
+                    self.canvas.restore_layout(
+                        state["elements"], state["columns"], state["rows"], state["cell_names"]
+                    )
+                finally:
+                    self._replaying = False
+
+        self._thread = threading.Thread(target=self._writer_loop, name="layout-journal", daemon=True)
+        self._thread.start()
+
+        # Новый сеанс начинаем с актуального снимка и пустого журнала
+        self.checkpoint()
+        self.timer.start(self.CHECKPOINT_INTERVAL_MS)
+
+    def close(self):
+        """Финальный снимок, сброс буферов и остановка потока"""
+        if self._thread is None:
+            return
+        self.timer.stop()
+        self._reset_timer.stop()
+        self.checkpoint(clean=True)
+        self._queue.put(("stop", None))
+        self._thread.join(timeout=5)
+        self._thread = None
+
+    # --- Приём правок (главный поток) ---
+
+    def on_model_change(self, op, items):
+        if op in ("add", "update"):
+            for item in items:
+                rec = self.canvas.item_to_record(item)
+                if rec is not None:
+                    self._append({"op": op, "rec": rec})
+        elif op == "remove":
+            for item in items:
+                uid = item.data(ELEMENT_UID)
+                if uid is not None:
+                    self._append({"op": "remove", "uid": uid})
+        elif op == "grid":
+            cm = self.canvas.cell_manager
+            self._append({"op": "grid", "columns": list(cm.columns), "rows": list(cm.rows)})
+        elif op == "reset":
+            self._dirty = True
+            self._reset_timer.start()
+
+    def _append(self, entry):
+        if self._replaying:
+            return
+        self._seq += 1
+        entry["seq"] = self._seq
+        self._dirty = True
+        self._queue.put(("op", entry))
+
+    def checkpoint(self, clean=False):
+        """Ставит в очередь полный снимок модели; журнал после него обнуляется"""
+        if self._replaying:
+            return
+        data = self.canvas.capture_layout()
+        data["seq"] = self._seq
+        data["clean"] = clean
+        data["saved_at"] = time.time()
+        self._dirty = False
+        self._queue.put(("checkpoint", data))
+
+    def checkpoint_if_dirty(self):
+        # Во время порционной операции модель в промежуточном состоянии
+        if self._dirty and getattr(self.canvas, "active_task", None) is None:
+            self.checkpoint()
+
+    # --- Фоновый поток ---
+
+    def _writer_loop(self):
+        journal = open(self.journal_path, "a", encoding="utf-8")
+        last_sync = time.monotonic()
+        pending = False
+        running = True
+
+        while running:
+            try:
+                batch = [self._queue.get(timeout=self.FSYNC_INTERVAL)]
+            except queue.Empty:
+                batch = []
+            # Забираем всё накопившееся, чтобы писать пачкой
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            for kind, payload in batch:
+                try:
+                    if kind == "op":
+                        journal.write(json.dumps(payload, ensure_ascii=False))
+                        journal.write("\n")
+                        pending = True
+                    elif kind == "checkpoint":
+                        self._write_checkpoint(payload)
+                        journal.close()
+                        journal = open(self.journal_path, "w", encoding="utf-8")
+                        pending = False
+                    elif kind == "stop":
+                        running = False
+                except (OSError, TypeError, ValueError) as e:
+                    log_autosave.error("Ошибка записи журнала: %s", e)
+
+            if pending and (not running or time.monotonic() - last_sync >= self.FSYNC_INTERVAL):
+                try:
+                    journal.flush()
+                    os.fsync(journal.fileno())
+                except OSError as e:
+                    log_autosave.error("Ошибка fsync журнала: %s", e)
+                last_sync = time.monotonic()
+                pending = False
+
+        journal.close()
+
+    def _write_checkpoint(self, data):
+        tmp_path = self.checkpoint_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.checkpoint_path)
+
+    # --- Восстановление ---
+
+    def load_state(self):
+        """
+        Читает снимок и дописанные после него операции.
+        Возвращает dict(elements, columns, rows, cell_names, clean) или None.
+        """
+        records = {}
+        columns, rows, cell_names = [], [], {}
+        seq = 0
+        clean = False
+        found = False
+
+        if os.path.exists(self.checkpoint_path):
+            try:
+                with open(self.checkpoint_path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError) as e:
+                log_autosave.warning("Не удалось прочитать снимок автосохранения: %s", e)
+            else:
+                found = True
+                seq = data.get("seq", 0)
+                clean = data.get("clean", False)
+                records = {rec["uid"]: rec for rec in data.get("elements", []) if "uid" in rec}
+                columns = data.get("columns", [])
+                rows = data.get("rows", [])
+                cell_names = data.get("cell_names", {})
+
+        if os.path.exists(self.journal_path):
+            try:
+                with open(self.journal_path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        try:
+                            entry = json.loads(line)
+                        except ValueError:
+                            break  # оборванная при сбое последняя запись
+                        if entry.get("seq", 0) <= seq:
+                            continue
+                        found = True
+                        clean = False
+                        op = entry.get("op")
+                        if op in ("add", "update"):
+                            rec = entry["rec"]
+                            records[rec["uid"]] = rec
+                        elif op == "remove":
+                            records.pop(entry["uid"], None)
+                        elif op == "grid":
+                            columns = entry.get("columns", [])
+                            rows = entry.get("rows", [])
+            except OSError as e:
+                log_autosave.warning("Не удалось прочитать журнал автосохранения: %s", e)
+
+        if not found:
+            return None
+        return {
+            "elements": list(records.values()),
+            "columns": columns,
+            "rows": rows,
+            "cell_names": cell_names,
+            "clean": clean
+        }
+
+
+class RecomputeSignals(QtCore.QObject):
+    """Сигналы RecomputeTask; объект живёт в GUI-потоке, поэтому доставка — через очередь"""
+    finished = QtCore.pyqtSignal(int, object)
+
+
+class RecomputeTask(QtCore.QRunnable):
+    """Пересчёт распределения и виртуальных линий над снимком в QThreadPool"""
+
+    def __init__(self, generation, snapshot, signals):
+        super().__init__()
+        self.generation = generation
+        self.snapshot = snapshot
+        self.signals = signals
+        self.setAutoDelete(True)
+
+    def run(self):
+        try:
+            start = time.perf_counter()
+            result = recompute_layout(self.snapshot)
+            PERF.record("recompute_layout", time.perf_counter() - start)
+        except Exception as e:
+            log_cells.exception("Ошибка фонового пересчёта: %s", e)
+            result = None
+        self.signals.finished.emit(self.generation, result)
+
+
+class PerfGraphicsView(QtWidgets.QGraphicsView):
+    """
+    QGraphicsView, учитывающий время отрисовки кадра в PERF (операция «paint»).
+    Сетка и оси рисуются в фоне только в пределах видимой области,
+    поэтому не зависят от размеров сцены.
+    """
+    AXIS_LABEL_EVERY = 5    # подпись оси — каждые 5 логических шагов
+
+    def __init__(self, scene, parent=None):
+        super().__init__(scene, parent)
+        self.grid_size = 0
+        self.grid_step = 0
+        self.light_pen = STYLES.pen("#e8eaed", 0)
+        self.dark_pen = STYLES.pen("lightgray", 0)
+        self.axis_pen = STYLES.pen("#697c85", 2)
+        self.axis_font = QtGui.QFont("Arial", 8)
+        self.axis_text_color = QtGui.QColor("#2d3538")
+
+    def set_grid(self, grid_size, grid_step):
+        """grid_size — шаг мелкой сетки, grid_step — логический шаг (тёмные линии и оси)"""
+        self.grid_size = grid_size
+        self.grid_step = grid_step
+        self.viewport().update()
+
+    def paintEvent(self, event):
+        LAYER_BATCH.frame += 1
+        start = time.perf_counter()
+        super().paintEvent(event)
+        PERF.record("paint", time.perf_counter() - start)
+
+    def drawBackground(self, painter, rect):
+        super().drawBackground(painter, rect)
+        if not self.grid_size:
+            return
+        lod = LOD.of(painter)
+        self._draw_grid(painter, rect, lod)
+        self._draw_axes(painter, rect, lod)
+
+    def _draw_grid(self, painter, rect, lod):
+        # Мелкая сетка при отдалении (LOD.DETAIL) не рисуется
+        size = self.grid_step if LOD.enabled and lod < LOD.DETAIL else self.grid_size
+        if size * lod < 2:
+            return
+        left = math.floor(rect.left() / size) * size
+        top = math.floor(rect.top() / size) * size
+        light, dark = [], []
+        x = left
+        while x <= rect.right():
+            line = QtCore.QLineF(x, rect.top(), x, rect.bottom())
+            (light if x % self.grid_step else dark).append(line)
+            x += size
+        y = top
+        while y <= rect.bottom():
+            line = QtCore.QLineF(rect.left(), y, rect.right(), y)
+            (light if y % self.grid_step else dark).append(line)
+            y += size
+        if light:
+            painter.setPen(self.light_pen)
+            painter.drawLines(light)
+        if dark:
+            painter.setPen(self.dark_pen)
+            painter.drawLines(dark)
+
+    def _draw_axes(self, painter, rect, lod):
+        painter.setPen(self.axis_pen)
+        painter.drawLine(QtCore.QLineF(rect.left(), 0, rect.right(), 0))
+        painter.drawLine(QtCore.QLineF(0, rect.top(), 0, rect.bottom()))
+
+        tick = self.grid_step * self.AXIS_LABEL_EVERY
+        if tick * lod < 10:
+            return
+        xs = range(math.floor(rect.left() / tick) * tick, math.ceil(rect.right()) + 1, tick)
+        ys = range(math.floor(rect.top() / tick) * tick, math.ceil(rect.bottom()) + 1, tick)
+        painter.drawLines([QtCore.QLineF(x, -5, x, 5) for x in xs] +
+                          [QtCore.QLineF(-5, y, 5, y) for y in ys])
+
+        if LOD.text_hidden(self.axis_font, lod):
+            return
+        painter.setFont(self.axis_font)
+        painter.setPen(self.axis_text_color)
+        labels = [(x - 10, -10, x) for x in xs if x] + [(-30, y - 8, y) for y in ys if y]
+        for px, py, value in labels:
+            # Вид отражён по Y (scale(1, -1)), подпись отражаем обратно
+            painter.save()
+            painter.translate(px, py)
+            painter.scale(1, -1)
+            painter.drawText(QtCore.QRectF(0, 0, 60, 20),
+                             QtCore.Qt.AlignmentFlag.AlignLeft | QtCore.Qt.AlignmentFlag.AlignVCenter,
+                             str(value // self.grid_step))
+            painter.restore()
+
+
+class InputRecorder(QtCore.QObject):
+    """
+    Записывает поток событий мыши и клавиатуры холста в JSONL.
+    Первая строка — заголовок: снимок раскладки (capture_layout), матрица вида,
+    размер viewport, инструмент и слой; далее по строке на событие с временем
+    от начала записи и координатами сцены. Воспроизведение — benchmark.py --replay.
+    """
+    MOUSE_TYPES = {
+        QtCore.QEvent.Type.MouseButtonPress: "press",
+        QtCore.QEvent.Type.MouseButtonRelease: "release",
+        QtCore.QEvent.Type.MouseButtonDblClick: "dblclick",
+        QtCore.QEvent.Type.MouseMove: "move",
+    }
+
+    def __init__(self, canvas, path):
+        super().__init__(canvas)
+        self.canvas = canvas
+        self.path = path
+        self.file = None
+        self.started = None
+        self.count = 0
+
+    def start(self):
+        canvas = self.canvas
+        viewport = canvas.view.viewport()
+        t = canvas.view.transform()
+        self.file = open(self.path, "w", encoding="utf-8")
+        self._write({
+            "version": 1,
+            "layout": canvas.capture_layout(),
+            "transform": [t.m11(), t.m12(), t.m21(), t.m22()],
+            "viewport": [viewport.width(), viewport.height()],
+            "center": self._scene_xy(viewport.rect().center()),
+            "tool": canvas.current_tool,
+            "active_layer": canvas.active_layer,
+        })
+        self.started = time.perf_counter()
+        self.count = 0
+        viewport.installEventFilter(self)
+        canvas.installEventFilter(self)
+        log_ui.info("Запись ввода в %s", self.path)
+
+    def stop(self):
+        self.canvas.view.viewport().removeEventFilter(self)
+        self.canvas.removeEventFilter(self)
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        log_ui.info("Запись ввода остановлена: %d событий в %s", self.count, self.path)
+
+    def _write(self, record):
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def _scene_xy(self, pos):
+        p = self.canvas.view.mapToScene(pos)
+        return [p.x(), p.y()]
+
+    def eventFilter(self, obj, event):
+        etype = event.type()
+        record = None
+        if obj is self.canvas.view.viewport():
+            if etype in self.MOUSE_TYPES:
+                record = {
+                    "type": self.MOUSE_TYPES[etype],
+                    "scene": self._scene_xy(event.position().toPoint()),
+                    "button": event.button().value,
+                    "buttons": event.buttons().value,
+                    "modifiers": event.modifiers().value,
+                }
+            elif etype == QtCore.QEvent.Type.Wheel:
+                record = {
+                    "type": "wheel",
+                    "scene": self._scene_xy(event.position().toPoint()),
+                    "delta": event.angleDelta().y(),
+                    "modifiers": event.modifiers().value,
+                }
+        elif obj is self.canvas and etype == QtCore.QEvent.Type.KeyPress:
+            record = {
+                "type": "key",
+                "key": event.key(),
+                "text": event.text(),
+                "modifiers": event.modifiers().value,
+            }
+
+        if record is not None and self.file is not None:
+            record["t"] = round((time.perf_counter() - self.started) * 1e3, 3)
+            record["tool"] = self.canvas.current_tool
+            self._write(record)
+            self.count += 1
+        return False
+
+
+class ChunkedTaskRunner(QtCore.QObject):
+    """
+    Выполняет длинную операцию в GUI-потоке порциями через цикл событий.
+
+    work — генератор, выдающий (done, total) после каждой единицы работы.
+    Порция длится не дольше SLICE_MS, между порциями окно перерисовывается
+    и обрабатывает кнопку «Отмена» модального QProgressDialog. При отмене или
+    исключении вызывается rollback, при успешном завершении — on_done.
+    """
+    SLICE_MS = 20
+    SHOW_DELAY_MS = 400
+
+    finished = QtCore.pyqtSignal(bool)
+
+    def __init__(self, parent, title, work, on_done=None, rollback=None, perf_name=None):
+        super().__init__(parent)
+        self.title = title
+        self.perf_name = perf_name or title
+        self.started = None
+        self.work = work
+        self.on_done = on_done
+        self.rollback = rollback
+        self.result = None  # None — выполняется, True/False — завершена/отменена
+
+        self.dialog = QtWidgets.QProgressDialog(title, "Отмена", 0, 0, parent)
+        self.dialog.setWindowTitle(title)
+        self.dialog.setWindowModality(QtCore.Qt.WindowModality.WindowModal)
+        self.dialog.setMinimumDuration(self.SHOW_DELAY_MS)
+        self.dialog.setAutoClose(False)
+        self.dialog.setAutoReset(False)
+        self.dialog.canceled.connect(self.cancel)
+
+        self.timer = QtCore.QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(0)
+        self.timer.timeout.connect(self._step)
+
+    def start(self):
+        self.started = time.perf_counter()
+        self.dialog.setValue(0)
+        self.timer.start()
+
+    def cancel(self):
+        if self.result is None:
+            self.timer.stop()
+            self.work.close()
+            self._finish(False)
+
+    def _step(self):
+        deadline = time.perf_counter() + self.SLICE_MS / 1000.0
+        done = total = 0
+        try:
+            while time.perf_counter() < deadline:
+                done, total = next(self.work)
+        except StopIteration:
+            self._finish(True)
+            return
+        except Exception as e:
+            log_tasks.exception("Ошибка при выполнении операции «%s»: %s", self.title, e)
+            self._finish(False)
+            return
+
+        self.dialog.setMaximum(total)
+        # setValue модального диалога обрабатывает события — «Отмена» могла сработать здесь
+        self.dialog.setValue(done)
+        if self.result is None:
+            self.timer.start()
+
+    def _finish(self, ok):
+        self.result = ok
+        self.dialog.canceled.disconnect(self.cancel)
+        self.dialog.close()
+        self.dialog.deleteLater()
+
+        callback = self.on_done if ok else self.rollback
+        if callback is not None:
+            try:
+                callback()
+            except Exception as e:
+                log_tasks.exception("Ошибка при завершении операции «%s»: %s", self.title, e)
+        if ok:
+            # Полное время операции, включая паузы между порциями
+            PERF.record(self.perf_name, time.perf_counter() - self.started)
+        self.finished.emit(ok)
+
+
 if __name__ == "__main__":
+    configure_logging()
     app = QtWidgets.QApplication(sys.argv)
     window = InfiniteCanvas(start_x=290, start_y=-375)
     window.show()
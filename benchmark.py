@@ -0,0 +1,339 @@
+"""
+Замеры производительности редактора на синтетических раскладках.
+
+Раскладка строится через публичный API InfiniteCanvas (create_column/create_row,
+add_item_from_record) без участия пользователя, на offscreen-платформе Qt.
+Результаты пишутся в JSON, чтобы сравнивать кривые масштабирования между версиями.
+
+Сессию, записанную в редакторе (Вид → Запись ввода), можно воспроизвести
+с замером задержки обработчика на каждое событие (--replay).
+
+Примеры:
+    python benchmark.py --cells 10x10 --wires 4 --contacts 2 --transistors 1
+    python benchmark.py --sweep 2x2,5x5,10x10,20x20 --repeat 5 --out scaling.json
+    python benchmark.py --cells 40x40 --drc-workers 8
+    python benchmark.py --replay session.jsonl --out replay.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt6 import QtWidgets, QtGui, QtCore  # noqa: E402
+
+import Curse  # noqa: E402
+import drc  # noqa: E402
+
+# Размер ячейки синтетической таблицы в логических шагах (как по умолчанию в table_creation)
+CELL_STEPS_X = 15
+CELL_STEPS_Y = 12
+
+
+def parse_grid(text):
+    """'10x5' → (10, 5)"""
+    cols, _, rows = text.lower().partition("x")
+    return int(cols), int(rows or cols)
+
+
+def synthetic_records(cm, wires, contacts, transistors, step, grid, seed):
+    """
+    Записи элементов (формат item_to_record) для каждой ячейки cm.cells:
+    первый провод каждой ячейки начинается на её левой грани, чтобы
+    появлялись виртуальные линии, остальные элементы — в случайных узлах сетки.
+    """
+    rng = random.Random(seed)
+    materials = ["M1", "M2", "SI", "PA", "NA"]
+    contact_materials = ["CPA", "CPK", "CNA", "CM1"]
+    records = []
+
+    def node(lo, hi):
+        return lo + grid * rng.randint(1, max(1, int((hi - lo) // grid) - 1))
+
+    for cell in cm.cells:
+        for i in range(wires):
+            y = node(cell.y1, cell.y2)
+            x1 = cell.x1 if i == 0 else node(cell.x1, cell.x2)
+            if rng.random() < 0.5 or i == 0:
+                x2 = node(cell.x1, cell.x2)
+                y2 = y
+            else:
+                x2 = x1
+                y2 = node(cell.y1, cell.y2)
+            records.append({"kind": "wire", "x1": x1, "y1": y, "x2": x2, "y2": y2,
+                            "material": rng.choice(materials), "width": -3, "dots": True})
+        for _ in range(contacts):
+            records.append({"kind": "contact", "x": node(cell.x1, cell.x2), "y": node(cell.y1, cell.y2),
+                            "material": rng.choice(contact_materials), "size": 10})
+        for _ in range(transistors):
+            records.append({"kind": "transistor", "x": node(cell.x1, cell.x2 - step),
+                            "y": node(cell.y1, cell.y2 - step),
+                            "ttype": rng.choice(["TP", "TN"]), "direction": "NORTH",
+                            "line_length": 2 * grid})
+    return records
+
+
+def build_layout(canvas, cols, rows, wires, contacts, transistors, seed):
+    """Таблица cols×rows ячеек и элементы в каждой ячейке; возвращает число элементов"""
+    cm = canvas.cell_manager
+    for i in range(cols + 1):
+        canvas.create_column(QtCore.QPointF(i * CELL_STEPS_X * canvas.step, 0), redraw=False)
+    for j in range(rows + 1):
+        canvas.create_row(QtCore.QPointF(0, j * CELL_STEPS_Y * canvas.step), redraw=False)
+    cm.update_cells()
+    cm.draw_cell_borders()
+    canvas.cell_comment_manager.update_comments(cm.columns, cm.rows)
+
+    records = synthetic_records(cm, wires, contacts, transistors, canvas.step, canvas.cell_size, seed)
+    with canvas.bulk_insert():
+        for rec in records:
+            canvas.add_item_from_record(rec)
+    return len(records)
+
+
+def measure(func, repeat):
+    """Время вызова func (в мс) за repeat повторов: min, median, max"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1e3)
+    return {"min_ms": round(min(samples), 3),
+            "median_ms": round(statistics.median(samples), 3),
+            "max_ms": round(max(samples), 3),
+            "repeat": repeat}
+
+
+def run_case(cols, rows, wires, contacts, transistors, repeat, seed, matrix_factor, drc_workers=1):
+    canvas = Curse.InfiniteCanvas(autosave_dir=None)
+    canvas.time_slicing = False
+    canvas.drc_workers = 1
+    cm = canvas.cell_manager
+
+    start = time.perf_counter()
+    element_count = build_layout(canvas, cols, rows, wires, contacts, transistors, seed)
+    build_ms = (time.perf_counter() - start) * 1e3
+
+    timings = {}
+    timings["CellManager.update_cells"] = measure(cm.update_cells, repeat)
+    timings["assign_elements_to_cells"] = measure(cm.assign_elements_to_cells, repeat)
+    timings["auto_create_virtual_lines"] = measure(canvas.auto_create_virtual_lines, repeat)
+
+    vlines = [item for item in canvas.scene.items()
+              if isinstance(item, QtWidgets.QGraphicsLineItem) and item.data(0) == "vline"]
+
+    def register_all():
+        for item in vlines:
+            cm.register_vline_intersections(item)
+
+    timings["register_vline_intersections"] = measure(register_all, repeat)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "cells.cif")
+        timings["export_to_cif"] = measure(lambda: canvas.write_cells_cif(path), repeat)
+
+    def build_all_specs():
+        for cell in cm.cells:
+            canvas.build_cell_spec(cell)
+
+    timings["build_cell_spec"] = measure(build_all_specs, repeat)
+    timings["drc"] = measure(canvas.check_drc, repeat)
+    if drc_workers > 1:
+        records = [record for _, record in canvas.keyed_records()]
+        timings[f"drc_parallel_{drc_workers}"] = measure(
+            lambda: drc.check_layout_parallel(records, canvas.drc_deck, cm.columns, cm.rows, drc_workers), repeat)
+
+    # Матрицирование меняет раскладку, поэтому выполняется последним и один раз
+    column_comment = next((item.data(1) for item in canvas.cell_comment_manager.comment_items
+                           if item.data(0) == "column_comment"), None)
+    if column_comment is not None and matrix_factor > 1:
+        timings["matrix_buffer"] = measure(lambda: canvas.matrix_buffer(column_comment, matrix_factor), 1)
+
+    result = {
+        "config": {"cells": f"{cols}x{rows}", "wires_per_cell": wires, "contacts_per_cell": contacts,
+                   "transistors_per_cell": transistors, "seed": seed, "matrix_factor": matrix_factor,
+                   "drc_workers": drc_workers},
+        "cell_count": cols * rows,
+        "element_count": element_count,
+        "vline_count": len(vlines),
+        "drc_violations": len(canvas.drc_violations),
+        "scene_items": len(canvas.scene.items()),
+        "build_ms": round(build_ms, 3),
+        "timings": timings,
+        "memory": canvas.memory_report(),
+    }
+    canvas.close()
+    canvas.deleteLater()
+    return result
+
+
+REPLAY_MOUSE_TYPES = {
+    "press": QtCore.QEvent.Type.MouseButtonPress,
+    "release": QtCore.QEvent.Type.MouseButtonRelease,
+    "dblclick": QtCore.QEvent.Type.MouseButtonDblClick,
+    "move": QtCore.QEvent.Type.MouseMove,
+}
+
+
+def make_input_event(canvas, ev):
+    """QEvent и его получатель по записи InputRecorder"""
+    modifiers = QtCore.Qt.KeyboardModifier(ev.get("modifiers", 0))
+    if ev["type"] == "key":
+        event = QtGui.QKeyEvent(QtCore.QEvent.Type.KeyPress, ev["key"], modifiers, ev.get("text", ""))
+        return event, canvas
+
+    view = canvas.view
+    pos = QtCore.QPointF(view.mapFromScene(QtCore.QPointF(*ev["scene"])))
+    global_pos = QtCore.QPointF(view.viewport().mapToGlobal(pos.toPoint()))
+    if ev["type"] == "wheel":
+        event = QtGui.QWheelEvent(pos, global_pos, QtCore.QPoint(), QtCore.QPoint(0, ev["delta"]),
+                                  QtCore.Qt.MouseButton.NoButton, modifiers,
+                                  QtCore.Qt.ScrollPhase.NoScrollPhase, False)
+    else:
+        event = QtGui.QMouseEvent(REPLAY_MOUSE_TYPES[ev["type"]], pos, global_pos,
+                                  QtCore.Qt.MouseButton(ev.get("button", 0)),
+                                  QtCore.Qt.MouseButton(ev.get("buttons", 0)), modifiers)
+    return event, view.viewport()
+
+
+def replay_session(path, settle=True):
+    """
+    Воспроизводит запись InputRecorder на offscreen-холсте и возвращает
+    задержки обработчиков, сгруппированные по типу события и инструменту.
+    settle — обрабатывать очередь событий Qt между событиями записи (вне замера).
+    """
+    with open(path, encoding="utf-8") as f:
+        header = json.loads(f.readline())
+        events = [json.loads(line) for line in f if line.strip()]
+
+    app = QtWidgets.QApplication.instance()
+    canvas = Curse.InfiniteCanvas(autosave_dir=None)
+    canvas.time_slicing = False
+    width, height = header.get("viewport", [1000, 800])
+    canvas.view.setFixedSize(width, height)
+    canvas.show()
+
+    layout = header.get("layout") or {}
+    canvas.restore_layout(layout.get("elements", []), layout.get("columns", []),
+                          layout.get("rows", []), layout.get("cell_names"))
+    m11, m12, m21, m22 = header.get("transform", [1, 0, 0, -1])
+    canvas.view.setTransform(QtGui.QTransform(m11, m12, m21, m22, 0, 0))
+    if header.get("center"):
+        canvas.view.centerOn(*header["center"])
+    canvas.active_layer = header.get("active_layer", canvas.active_layer)
+    if header.get("tool") is not None:
+        canvas.set_tool(header["tool"])
+    app.processEvents()
+
+    groups = {}
+    total = 0.0
+    for ev in events:
+        tool = ev.get("tool")
+        if tool != canvas.current_tool:
+            canvas.set_tool(tool)
+        event, target = make_input_event(canvas, ev)
+
+        start = time.perf_counter()
+        app.sendEvent(target, event)
+        elapsed = (time.perf_counter() - start) * 1e3
+
+        total += elapsed
+        groups.setdefault(f"{ev['type']}:{tool}", []).append(elapsed)
+        if settle:
+            app.processEvents()
+
+    QtCore.QThreadPool.globalInstance().waitForDone()
+    app.processEvents()
+
+    latencies = {}
+    for key, samples in sorted(groups.items()):
+        samples.sort()
+        latencies[key] = {
+            "count": len(samples),
+            "mean_ms": round(sum(samples) / len(samples), 3),
+            "p95_ms": round(samples[min(len(samples) - 1, int(0.95 * len(samples)))], 3),
+            "max_ms": round(samples[-1], 3),
+        }
+
+    result = {
+        "session": os.path.basename(path),
+        "events": len(events),
+        "total_ms": round(total, 3),
+        "scene_items": len(canvas.scene.items()),
+        "latency": latencies,
+    }
+    canvas.close()
+    canvas.deleteLater()
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Замеры основных операций редактора на синтетических раскладках")
+    parser.add_argument("--cells", default="5x5", help="размер таблицы, например 10x10")
+    parser.add_argument("--sweep", help="список размеров через запятую (вместо --cells), например 2x2,5x5,10x10")
+    parser.add_argument("--wires", type=int, default=4, help="проводов на ячейку")
+    parser.add_argument("--contacts", type=int, default=2, help="контактов на ячейку")
+    parser.add_argument("--transistors", type=int, default=1, help="транзисторов на ячейку")
+    parser.add_argument("--repeat", type=int, default=3, help="повторов каждого замера")
+    parser.add_argument("--matrix-factor", type=int, default=2, help="коэффициент матрирования (1 — не замерять)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--drc-workers", type=int, default=1,
+                        help="дополнительно замерить параллельную DRC на этом числе процессов")
+    parser.add_argument("--replay", metavar="SESSION", help="воспроизвести запись ввода (JSONL) вместо синтетических замеров")
+    parser.add_argument("--no-settle", action="store_true",
+                        help="при воспроизведении не обрабатывать очередь Qt между событиями")
+    parser.add_argument("--out", default="benchmark.json", help="файл результатов (JSON)")
+    args = parser.parse_args(argv)
+
+    Curse.configure_logging()
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication(sys.argv[:1])
+
+    if args.replay:
+        replay = replay_session(args.replay, settle=not args.no_settle)
+        for key, stats in replay["latency"].items():
+            print(f"{key}: {stats['count']} событий, среднее {stats['mean_ms']:.2f} мс, p95 {stats['p95_ms']:.2f} мс")
+        report = {
+            "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "python": sys.version.split()[0],
+            "qt": QtCore.QT_VERSION_STR,
+            "platform": platform.platform(),
+            "replay": replay,
+            "perf": Curse.PERF.report(),
+        }
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Результаты записаны в {args.out}")
+        return 0
+
+    grids = [parse_grid(g) for g in (args.sweep.split(",") if args.sweep else [args.cells])]
+    runs = []
+    for cols, rows in grids:
+        run = run_case(cols, rows, args.wires, args.contacts, args.transistors,
+                       args.repeat, args.seed, args.matrix_factor, args.drc_workers)
+        runs.append(run)
+        summary = ", ".join(f"{name} {t['median_ms']:.1f}" for name, t in run["timings"].items())
+        print(f"{cols}x{rows}: элементов {run['element_count']}, мс (медиана): {summary}")
+        app.processEvents()
+
+    report = {
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": sys.version.split()[0],
+        "qt": QtCore.QT_VERSION_STR,
+        "platform": platform.platform(),
+        "runs": runs,
+        "perf": Curse.PERF.report(),
+    }
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Результаты записаны в {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
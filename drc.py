@@ -0,0 +1,423 @@
+"""
+Проверка топологических правил (DRC) без обращения к Qt.
+
+Правила задаются по материалам (RuleDeck): минимальная толщина, минимальный
+зазор между фигурами одного слоя и перекрытие контакта проводом слоя-подложки.
+Элементы — пары (ключ, ElementRecord) из layout_model; ключ возвращается в
+нарушениях как есть (индекс снимка, элемент сцены). Соседей для проверки
+зазоров даёт пространственный хеш, поэтому проверка всей схемы линейна по
+числу элементов при ограниченной плотности.
+"""
+import bisect
+import json
+import math
+import os
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+from multiprocessing import shared_memory
+from typing import NamedTuple, Tuple, Dict
+
+
+class LayerRule(NamedTuple):
+    min_width: float = 0.0      # провод — толщина пера, контакт — диаметр
+    min_spacing: float = 0.0    # наименьший зазор между несоприкасающимися фигурами слоя
+    enclosure: float = 0.0      # запас провода-подложки вокруг центра контакта
+    enclosed_by: Tuple[str, ...] = ()   # слои, на которых должен стоять контакт
+
+
+class Violation(NamedTuple):
+    rule: str           # "width", "spacing", "duplicate", "enclosure"
+    layer: str
+    bbox: Tuple[float, float, float, float]     # область отметки
+    keys: tuple         # ключи нарушающих элементов
+    value: float        # измеренное значение
+    limit: float        # требование правила
+
+    def message(self):
+        names = {
+            "width": "толщина меньше допустимой",
+            "spacing": "зазор меньше допустимого",
+            "duplicate": "дублирующиеся контакты",
+            "enclosure": "контакт не перекрыт слоем",
+        }
+        text = f"{self.layer}: {names.get(self.rule, self.rule)}"
+        if self.rule in ("width", "spacing"):
+            text += f" ({self.value:g} < {self.limit:g})"
+        return text
+
+
+class RuleDeck:
+    """Правила DRC по материалам"""
+
+    DEFAULT_WIRE = LayerRule(min_width=3, min_spacing=4)
+    DEFAULT_CONTACT = LayerRule(min_width=6, min_spacing=4)
+
+    def __init__(self, rules=None):
+        self.rules: Dict[str, LayerRule] = dict(rules or {})
+
+    @classmethod
+    def from_materials(cls, line_materials, contact_materials):
+        """
+        Правила по умолчанию для материалов редактора. Контакт C<слой>
+        (CM1, CSI, CPA, ...) должен стоять на проводе слоя <слой>, если такой есть.
+        """
+        rules = {name: cls.DEFAULT_WIRE for name in line_materials}
+        for name in contact_materials:
+            base = name[1:]
+            enclosed_by = (base,) if base in line_materials else ()
+            rules[name] = cls.DEFAULT_CONTACT._replace(enclosed_by=enclosed_by)
+        return cls(rules)
+
+    def rule(self, layer):
+        return self.rules.get(layer)
+
+    def max_spacing(self):
+        return max((r.min_spacing for r in self.rules.values()), default=0.0)
+
+    def update_from_json(self, path):
+        """
+        Переопределяет правила из JSON: {"M1": {"min_spacing": 6}, ...}.
+        Неизвестные материалы добавляются.
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        for layer, values in data.items():
+            rule = self.rules.get(layer, LayerRule())
+            values = dict(values)
+            if "enclosed_by" in values:
+                values["enclosed_by"] = tuple(values["enclosed_by"])
+            self.rules[layer] = rule._replace(**values)
+
+    def to_dict(self):
+        return {layer: {**rule._asdict(), "enclosed_by": list(rule.enclosed_by)}
+                for layer, rule in sorted(self.rules.items())}
+
+
+# --- Геометрия ---
+
+def _point_segment_distance(px, py, x1, y1, x2, y2):
+    dx, dy = x2 - x1, y2 - y1
+    length2 = dx * dx + dy * dy
+    if length2 == 0:
+        return math.hypot(px - x1, py - y1)
+    t = max(0.0, min(1.0, ((px - x1) * dx + (py - y1) * dy) / length2))
+    return math.hypot(px - (x1 + t * dx), py - (y1 + t * dy))
+
+
+def _closest_on_segment(px, py, x1, y1, x2, y2):
+    dx, dy = x2 - x1, y2 - y1
+    length2 = dx * dx + dy * dy
+    t = 0.0 if length2 == 0 else max(0.0, min(1.0, ((px - x1) * dx + (py - y1) * dy) / length2))
+    return x1 + t * dx, y1 + t * dy
+
+
+def closest_midpoint(a, b):
+    """Середина между ближайшими точками непересекающихся отрезков a и b"""
+    best = None
+    for (px, py), seg in (((a[0], a[1]), b), ((a[2], a[3]), b), ((b[0], b[1]), a), ((b[2], b[3]), a)):
+        qx, qy = _closest_on_segment(px, py, *seg)
+        d = math.hypot(px - qx, py - qy)
+        if best is None or d < best[0]:
+            best = (d, (px + qx) / 2, (py + qy) / 2)
+    return best[1], best[2]
+
+
+def _orient(ax, ay, bx, by, cx, cy):
+    return (bx - ax) * (cy - ay) - (by - ay) * (cx - ax)
+
+
+def segment_distance(a, b):
+    """Наименьшее расстояние между отрезками a и b вида (x1, y1, x2, y2)"""
+    ax1, ay1, ax2, ay2 = a
+    bx1, by1, bx2, by2 = b
+    d1 = _orient(ax1, ay1, ax2, ay2, bx1, by1)
+    d2 = _orient(ax1, ay1, ax2, ay2, bx2, by2)
+    d3 = _orient(bx1, by1, bx2, by2, ax1, ay1)
+    d4 = _orient(bx1, by1, bx2, by2, ax2, ay2)
+    if ((d1 > 0 > d2) or (d1 < 0 < d2)) and ((d3 > 0 > d4) or (d3 < 0 < d4)):
+        return 0.0
+    return min(_point_segment_distance(ax1, ay1, bx1, by1, bx2, by2),
+               _point_segment_distance(ax2, ay2, bx1, by1, bx2, by2),
+               _point_segment_distance(bx1, by1, ax1, ay1, ax2, ay2),
+               _point_segment_distance(bx2, by2, ax1, ay1, ax2, ay2))
+
+
+class Shape(NamedTuple):
+    key: object
+    kind: str
+    layer: str
+    segment: Tuple[float, float, float, float]  # контакт — отрезок нулевой длины
+    half: float                                 # половина толщины / радиус
+
+    @property
+    def size(self):
+        return self.half * 2
+
+    def bbox(self, grow=0.0):
+        x1, y1, x2, y2 = self.segment
+        r = self.half + grow
+        return (min(x1, x2) - r, min(y1, y2) - r, max(x1, x2) + r, max(y1, y2) + r)
+
+
+def element_shape(key, elem):
+    """Фигура DRC для ElementRecord: провод — отрезок с толщиной пера, контакт — круг"""
+    if elem.kind == "wire":
+        return Shape(key, "wire", elem.layer, (elem.x1, elem.y1, elem.x2, elem.y2),
+                     (elem.pen_width or 0) / 2)
+    if elem.kind == "contact":
+        size = elem.width if isinstance(elem.width, (int, float)) else 0
+        return Shape(key, "contact", elem.layer, (elem.x1, elem.y1, elem.x1, elem.y1), size / 2)
+    return None
+
+
+class SpatialHash:
+    """Равномерная сетка корзин: фигура попадает во все корзины своего габарита"""
+
+    def __init__(self, size):
+        self.size = size
+        self.buckets = {}
+
+    def _range(self, bbox):
+        s = self.size
+        return (range(math.floor(bbox[0] / s), math.floor(bbox[2] / s) + 1),
+                range(math.floor(bbox[1] / s), math.floor(bbox[3] / s) + 1))
+
+    def insert(self, index, bbox):
+        xs, ys = self._range(bbox)
+        for i in xs:
+            for j in ys:
+                self.buckets.setdefault((i, j), []).append(index)
+
+    def remove(self, index, bbox):
+        xs, ys = self._range(bbox)
+        for i in xs:
+            for j in ys:
+                bucket = self.buckets.get((i, j))
+                if bucket is not None and index in bucket:
+                    bucket.remove(index)
+                    if not bucket:
+                        del self.buckets[(i, j)]
+
+    def candidates(self, bbox):
+        xs, ys = self._range(bbox)
+        found = set()
+        for i in xs:
+            for j in ys:
+                found.update(self.buckets.get((i, j), ()))
+        return found
+
+
+# --- Проверка ---
+
+def _merge_bbox(a, b):
+    return (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+
+
+def check_shapes(shapes, deck, subjects=None, bucket=None, owner=None):
+    """
+    Нарушения правил deck для списка Shape.
+    subjects — множество ключей: ищутся только нарушения с их участием
+    (None — все). owner — полуоткрытый прямоугольник тайла (x1, y1, x2, y2):
+    берутся только нарушения, чья опорная точка (конец провода, центр контакта,
+    середина зазора) лежит в нём, — так соседние тайлы не дублируют друг друга.
+    Результат отсортирован по области отметки.
+    """
+    bucket = bucket or max(40.0, 2 * deck.max_spacing())
+    by_layer = {}
+    for i, shape in enumerate(shapes):
+        rule = deck.rule(shape.layer)
+        if rule is None:
+            continue
+        grid = by_layer.get(shape.layer)
+        if grid is None:
+            grid = by_layer[shape.layer] = SpatialHash(bucket)
+        grid.insert(i, shape.bbox())
+
+    def wanted(shape):
+        return subjects is None or shape.key in subjects
+
+    def owned(x, y):
+        return owner is None or (owner[0] <= x < owner[2] and owner[1] <= y < owner[3])
+
+    violations = []
+    for i, shape in enumerate(shapes):
+        rule = deck.rule(shape.layer)
+        if rule is None:
+            continue
+        own = wanted(shape)
+        anchored = owned(shape.segment[0], shape.segment[1])
+
+        # Толщина
+        if own and anchored and rule.min_width and shape.size < rule.min_width:
+            violations.append(Violation("width", shape.layer, shape.bbox(), (shape.key,),
+                                        shape.size, rule.min_width))
+
+        # Зазоры и дубликаты в своём слое: пара (i, j) проверяется один раз, при i < j
+        if rule.min_spacing or shape.kind == "contact":
+            for j in by_layer[shape.layer].candidates(shape.bbox(rule.min_spacing)):
+                if j <= i:
+                    continue
+                other = shapes[j]
+                if not (own or wanted(other)):
+                    continue
+                distance = segment_distance(shape.segment, other.segment)
+                gap = distance - shape.half - other.half
+                if owner is not None and (gap < rule.min_spacing or distance < 1e-6):
+                    if not owned(*closest_midpoint(shape.segment, other.segment)):
+                        continue
+                if shape.kind == "contact" and other.kind == "contact" and distance < 1e-6:
+                    violations.append(Violation("duplicate", shape.layer,
+                                                _merge_bbox(shape.bbox(), other.bbox()),
+                                                (shape.key, other.key), 0.0, 0.0))
+                elif gap < rule.min_spacing and (gap > 0 or
+                                                 (shape.kind == "contact" and other.kind == "contact")):
+                    # Соприкасающиеся провода — одно соединение, а не нарушение зазора
+                    violations.append(Violation("spacing", shape.layer,
+                                                _merge_bbox(shape.bbox(), other.bbox()),
+                                                (shape.key, other.key), round(gap, 6), rule.min_spacing))
+
+        # Перекрытие контакта слоем-подложкой
+        if own and anchored and shape.kind == "contact" and rule.enclosed_by:
+            cx, cy = shape.segment[0], shape.segment[1]
+            enclosed = False
+            for layer in rule.enclosed_by:
+                grid = by_layer.get(layer)
+                if grid is None:
+                    continue
+                for j in grid.candidates((cx, cy, cx, cy)):
+                    wire = shapes[j]
+                    if wire.kind == "wire" and _point_segment_distance(
+                            cx, cy, *wire.segment) + rule.enclosure <= wire.half:
+                        enclosed = True
+                        break
+                if enclosed:
+                    break
+            if not enclosed:
+                violations.append(Violation("enclosure", shape.layer, shape.bbox(), (shape.key,),
+                                            0.0, rule.enclosure))
+
+    violations.sort(key=violation_sort_key)
+    return violations
+
+
+def violation_sort_key(v):
+    return (v.bbox, v.rule, v.layer)
+
+
+def check_layout(pairs, deck, subjects=None):
+    """Нарушения для элементов [(ключ, ElementRecord)] (см. check_shapes)"""
+    shapes = [s for s in (element_shape(key, elem) for key, elem in pairs) if s is not None]
+    return check_shapes(shapes, deck, subjects)
+
+
+# --- Параллельная проверка по тайлам ---
+#
+# Геометрия передаётся процессам через multiprocessing.shared_memory:
+# блок float64 по FIELDS чисел на элемент и блок int64 с номерами элементов
+# тайлов подряд. Процесс получает только имена блоков и свой диапазон.
+
+FIELDS = 6      # x1, y1, x2, y2, половина толщины, код слоя * 2 + (1 — контакт)
+
+
+def tile_bounds(boundaries, parts):
+    """
+    Границы тайлов по одной оси: не больше parts - 1 внутренних границ,
+    выбранных равномерно из boundaries (столбцов или строк), плюс ±inf.
+    """
+    inner = sorted(set(boundaries))
+    if parts > 1 and len(inner) > parts - 1:
+        step = len(inner) / parts
+        inner = [inner[int(step * k)] for k in range(1, parts)]
+    elif parts <= 1:
+        inner = []
+    return [-math.inf] + inner + [math.inf]
+
+
+def _tile_ranges(bounds, lo, hi):
+    """Номера тайлов оси, чей интервал [bounds[i], bounds[i+1]) пересекает [lo, hi]"""
+    first = max(bisect.bisect_right(bounds, lo) - 1, 0)
+    last = min(bisect.bisect_right(bounds, hi) - 1, len(bounds) - 2)
+    return range(first, last + 1)
+
+
+def _check_tile(job):
+    geometry_name, index_name, start, end, layers, rules, owner = job
+    geometry = shared_memory.SharedMemory(name=geometry_name)
+    indices = shared_memory.SharedMemory(name=index_name)
+    try:
+        # Представления освобождаются до close() и при ошибке: иначе close()
+        # падает с BufferError и скрывает исходное исключение
+        with geometry.buf.cast("d") as values, indices.buf.cast("q") as members:
+            shapes = []
+            for n in range(start, end):
+                i = members[n]
+                base = i * FIELDS
+                x1, y1, x2, y2, half, code = values[base:base + FIELDS].tolist()
+                code = int(code)
+                shapes.append(Shape(i, "contact" if code & 1 else "wire", layers[code >> 1],
+                                    (x1, y1, x2, y2), half))
+    finally:
+        geometry.close()
+        indices.close()
+    return check_shapes(shapes, RuleDeck(rules), owner=owner)
+
+
+def check_layout_parallel(elements, deck, columns=(), rows=(), workers=None, tiles_per_worker=4):
+    """
+    Полная проверка ElementRecord elements пулом процессов. Раскладка делится
+    на тайлы по columns/rows (CellManager) с перекрытием на дальность правил;
+    ключи нарушений — индексы elements. Результат совпадает с check_layout
+    и не зависит от числа процессов.
+    """
+    workers = workers or os.cpu_count() or 1
+    shapes = [element_shape(i, elem) for i, elem in enumerate(elements)]
+    layers = sorted({s.layer for s in shapes if s is not None}, key=str)
+    layer_code = {layer: k for k, layer in enumerate(layers)}
+
+    parts = max(1, math.ceil(math.sqrt(workers * tiles_per_worker)))
+    xb, yb = tile_bounds(columns, parts), tile_bounds(rows, parts)
+    halo = deck.max_spacing() + 2 * max((s.half for s in shapes if s is not None), default=0.0)
+
+    values = array("d", bytes(8 * FIELDS * max(len(shapes), 1)))
+    members = {}
+    for i, shape in enumerate(shapes):
+        if shape is None or deck.rule(shape.layer) is None:
+            continue
+        base = i * FIELDS
+        values[base:base + FIELDS] = array("d", (*shape.segment, shape.half,
+                                                 layer_code[shape.layer] * 2 + (shape.kind == "contact")))
+        x1, y1, x2, y2 = shape.bbox(halo)
+        for tx in _tile_ranges(xb, x1, x2):
+            for ty in _tile_ranges(yb, y1, y2):
+                members.setdefault((tx, ty), []).append(i)
+
+    order = sorted(members)
+    flat = array("q")
+    spans = []
+    for tile in order:
+        spans.append((len(flat), len(flat) + len(members[tile])))
+        flat.extend(members[tile])
+    if not flat:
+        return []
+
+    geometry = shared_memory.SharedMemory(create=True, size=len(values) * 8)
+    indices = shared_memory.SharedMemory(create=True, size=len(flat) * 8)
+    try:
+        geometry.buf[:len(values) * 8] = values.tobytes()
+        indices.buf[:len(flat) * 8] = flat.tobytes()
+        jobs = [(geometry.name, indices.name, start, end, layers, deck.rules,
+                 (xb[tx], yb[ty], xb[tx + 1], yb[ty + 1]))
+                for (tx, ty), (start, end) in zip(order, spans)]
+        # spawn: дочерние процессы не наследуют потоки и состояние Qt вызывающего
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            results = list(pool.map(_check_tile, jobs, chunksize=max(1, len(jobs) // (workers * 4))))
+    finally:
+        geometry.close()
+        geometry.unlink()
+        indices.close()
+        indices.unlink()
+
+    violations = [v for part in results for v in part]
+    violations.sort(key=lambda v: (violation_sort_key(v), v.keys))
+    return violations
@@ -0,0 +1,765 @@
+"""
+Расчёты над снимком модели без обращения к Qt.
+
+Снимок (LayoutSnapshot) — неизменяемые кортежи с геометрией ячеек и
+элементов, поэтому функции этого модуля можно выполнять в рабочем потоке,
+пока GUI продолжает обрабатывать события.
+"""
+import bisect
+import heapq
+import itertools
+import math
+from typing import NamedTuple, Tuple, List, Dict
+
+
+class CellBounds(NamedTuple):
+    x1: float
+    y1: float
+    x2: float
+    y2: float
+    name: str
+
+
+class ElementRecord(NamedTuple):
+    kind: str           # "wire" или "contact"
+    layer: object       # материал, data(1) элемента
+    x1: float           # для контакта (x1, y1) — центр, x2 == x1, y2 == y1
+    y1: float
+    x2: float
+    y2: float
+    width: object       # data(2): логическая толщина провода / диаметр контакта
+    pen_width: int      # толщина пера провода в пикселях
+
+
+class LayoutSnapshot(NamedTuple):
+    cells: Tuple[CellBounds, ...]
+    elements: Tuple[ElementRecord, ...]
+
+
+class RecomputeResult(NamedTuple):
+    assignment: List[Tuple[List[int], Dict[object, List[dict]]]]
+    vlines: List[dict]
+    registrations: List[List[dict]]
+
+
+# --- Распределение элементов по ячейкам ---
+
+def cell_index_at(cells, x, y):
+    """Индекс первой ячейки, содержащей точку (как CellManager.get_cell_at)"""
+    for i, c in enumerate(cells):
+        if c.x1 <= x <= c.x2 and c.y1 <= y <= c.y2:
+            return i
+    return None
+
+
+class CellGrid:
+    """
+    Ячейки, разложенные по сетке из отсортированных границ столбцов и строк:
+    каждое «окно» сетки (ix, iy) знает индексы покрывающих его ячеек.
+    Для таблицы ячеек окно совпадает с ячейкой; перекрывающиеся и
+    произвольные ячейки (add_cell) просто покрывают несколько окон.
+    """
+
+    def __init__(self, cells):
+        self.cells = cells
+        self.xs = sorted({c.x1 for c in cells} | {c.x2 for c in cells})
+        self.ys = sorted({c.y1 for c in cells} | {c.y2 for c in cells})
+        self.slots = {}
+        self.degenerate = []    # ячейки нулевой ширины/высоты — проверяются перебором
+        for ci, c in enumerate(cells):
+            ix1, ix2 = bisect.bisect_left(self.xs, c.x1), bisect.bisect_left(self.xs, c.x2)
+            iy1, iy2 = bisect.bisect_left(self.ys, c.y1), bisect.bisect_left(self.ys, c.y2)
+            if ix1 >= ix2 or iy1 >= iy2:
+                self.degenerate.append(ci)
+                continue
+            for ix in range(ix1, ix2):
+                for iy in range(iy1, iy2):
+                    self.slots.setdefault((ix, iy), []).append(ci)
+
+    def _span(self, bounds, v):
+        """Окна, замкнутый интервал которых содержит v (два — если v на границе)"""
+        hi = bisect.bisect_right(bounds, v)
+        lo = bisect.bisect_left(bounds, v)
+        return range(max(lo - 1, 0), min(hi, len(bounds) - 1))
+
+    def cell_at(self, x, y):
+        """Индекс первой ячейки, содержащей точку (то же, что cell_index_at)"""
+        best = None
+        for ix in self._span(self.xs, x):
+            for iy in self._span(self.ys, y):
+                for ci in self.slots.get((ix, iy), ()):
+                    if best is None or ci < best:
+                        c = self.cells[ci]
+                        if c.x1 <= x <= c.x2 and c.y1 <= y <= c.y2:
+                            best = ci
+        for ci in self.degenerate:
+            if best is not None and ci > best:
+                break
+            c = self.cells[ci]
+            if c.x1 <= x <= c.x2 and c.y1 <= y <= c.y2:
+                best = ci
+                break
+        return best
+
+    def _crossings(self, bounds, a, b):
+        """Параметры t в (0, 1), где отрезок a→b пересекает границы bounds"""
+        if a == b:
+            return []
+        lo, hi = min(a, b), max(a, b)
+        i, j = bisect.bisect_right(bounds, lo), bisect.bisect_left(bounds, hi)
+        return [(bounds[k] - a) / (b - a) for k in range(i, j)]
+
+    def cells_crossed(self, x1, y1, x2, y2):
+        """
+        Индексы ячеек, через внутренность которых проходит отрезок, по порядку
+        обхода. Отрезок делится точками пересечения границ сетки (обход DDA по
+        отсортированным границам), середина каждого куска даёт окно — работа
+        пропорциональна числу пересечённых окон. Отрезок, идущий по границе,
+        внутренность не задевает и ячейкам не приписывается.
+        """
+        ts = sorted(self._crossings(self.xs, x1, x2) + self._crossings(self.ys, y1, y2))
+        result, seen = [], set()
+        prev = 0.0
+        for t in ts + [1.0]:
+            if t > prev:
+                mt = (prev + t) / 2
+                mx, my = x1 + (x2 - x1) * mt, y1 + (y2 - y1) * mt
+                ix = bisect.bisect_right(self.xs, mx) - 1
+                iy = bisect.bisect_right(self.ys, my) - 1
+                if (0 <= ix < len(self.xs) - 1 and 0 <= iy < len(self.ys) - 1 and
+                        self.xs[ix] < mx < self.xs[ix + 1] and self.ys[iy] < my < self.ys[iy + 1]):
+                    for ci in self.slots.get((ix, iy), ()):
+                        if ci not in seen:
+                            c = self.cells[ci]
+                            if c.x1 < mx < c.x2 and c.y1 < my < c.y2:
+                                seen.add(ci)
+                                result.append(ci)
+            prev = t
+        return result
+
+
+def compute_cell_assignment(snapshot):
+    """
+    Для каждой ячейки возвращает (индексы элементов, cif_layers).
+    Провод попадает в ячейки своих концов и во все ячейки, через которые
+    проходит (CellGrid.cells_crossed), контакт — в ячейку центра.
+    """
+    cells = snapshot.cells
+    grid = CellGrid(cells)
+    assignment = [([], {}) for _ in cells]
+
+    for index, elem in enumerate(snapshot.elements):
+        if elem.kind == "wire":
+            cells_for_line = set(grid.cells_crossed(elem.x1, elem.y1, elem.x2, elem.y2))
+            for x, y in ((elem.x1, elem.y1), (elem.x2, elem.y2)):
+                ci = grid.cell_at(x, y)
+                if ci is not None:
+                    cells_for_line.add(ci)
+
+            for ci in sorted(cells_for_line):
+                indices, layers = assignment[ci]
+                indices.append(index)
+                layers.setdefault(elem.layer, []).append({
+                    'type': 'wire',
+                    'layer': elem.layer,
+                    'x1': elem.x1,
+                    'y1': elem.y1,
+                    'x2': elem.x2,
+                    'y2': elem.y2,
+                    'width': elem.pen_width
+                })
+
+        elif elem.kind == "contact":
+            ci = grid.cell_at(elem.x1, elem.y1)
+            if ci is not None:
+                indices, layers = assignment[ci]
+                indices.append(index)
+                layers.setdefault(elem.layer, []).append({
+                    'type': 'contact',
+                    'layer': elem.layer,
+                    'x': elem.x1,
+                    'y': elem.y1,
+                    'diameter': elem.width
+                })
+
+    return assignment
+
+
+# --- Виртуальные линии ---
+
+def vline_exists(start, end, existing, eps=1.0):
+    """Есть ли уже в existing линия с теми же концами (в любом направлении)"""
+    for other in existing:
+        os_, oe = other['start'], other['end']
+        if ((abs(start[0] - os_[0]) < eps and abs(start[1] - os_[1]) < eps and
+             abs(end[0] - oe[0]) < eps and abs(end[1] - oe[1]) < eps) or
+                (abs(start[0] - oe[0]) < eps and abs(start[1] - oe[1]) < eps and
+                 abs(end[0] - os_[0]) < eps and abs(end[1] - os_[1]) < eps)):
+            return True
+    return False
+
+
+class EdgeIndex:
+    """
+    Грани ячеек, отсортированные по координате: вертикальные (lft/rht) — по x,
+    горизонтальные (btm/top) — по y. Грани, на которых с допуском eps лежит
+    точка, находятся двоичным поиском по отсортированным границам вместо
+    проверки четырёх граней каждой ячейки.
+    """
+    EDGE_ORDER = {'lft': 0, 'rht': 1, 'btm': 2, 'top': 3}
+
+    def __init__(self, cells):
+        self.cells = cells
+        vertical = sorted([(c.x1, ci, 'lft') for ci, c in enumerate(cells)] +
+                          [(c.x2, ci, 'rht') for ci, c in enumerate(cells)])
+        horizontal = sorted([(c.y1, ci, 'btm') for ci, c in enumerate(cells)] +
+                            [(c.y2, ci, 'top') for ci, c in enumerate(cells)])
+        self.vertical = vertical
+        self.vertical_keys = [v for v, _, _ in vertical]
+        self.horizontal = horizontal
+        self.horizontal_keys = [v for v, _, _ in horizontal]
+
+    def hits(self, x, y, eps=2.0):
+        """
+        Грани, на которых лежит точка: [(ячейка, edge_type, offset)] по порядку
+        ячеек и граней lft, rht, btm, top; offset — координата точки вдоль грани.
+        """
+        cells = self.cells
+        result = []
+        lo = bisect.bisect_right(self.vertical_keys, x - eps)
+        hi = bisect.bisect_left(self.vertical_keys, x + eps)
+        for _, ci, edge_type in self.vertical[lo:hi]:
+            c = cells[ci]
+            if c.y1 <= y <= c.y2:
+                result.append((ci, edge_type, y))
+        lo = bisect.bisect_right(self.horizontal_keys, y - eps)
+        hi = bisect.bisect_left(self.horizontal_keys, y + eps)
+        for _, ci, edge_type in self.horizontal[lo:hi]:
+            c = cells[ci]
+            if c.x1 <= x <= c.x2:
+                result.append((ci, edge_type, x))
+        result.sort(key=lambda hit: (hit[0], self.EDGE_ORDER[hit[1]]))
+        return result
+
+
+def edge_hits(points, cells, eps=2.0, index=None):
+    """Попадания на грани для всех точек за один проход: список hits по каждой точке"""
+    index = index or EdgeIndex(cells)
+    return [index.hits(x, y, eps) for x, y in points]
+
+
+def _hit_vline(kind, cell, edge_type, offset):
+    """
+    (start, end) виртуальной линии по попаданию на грань: у провода линия идёт
+    от грани попадания к противоположной, у контакта — всегда от lft/btm
+    """
+    if edge_type == 'lft':
+        return (cell.x1, offset), (cell.x2, offset)
+    if edge_type == 'rht':
+        if kind == "wire":
+            return (cell.x2, offset), (cell.x1, offset)
+        return (cell.x1, offset), (cell.x2, offset)
+    if edge_type == 'btm':
+        return (offset, cell.y1), (offset, cell.y2)
+    if kind == "wire":
+        return (offset, cell.y2), (offset, cell.y1)
+    return (offset, cell.y1), (offset, cell.y2)
+
+
+def element_points(elem):
+    """Точки элемента, проверяемые на грани: концы провода или центр контакта"""
+    if elem.kind == "wire":
+        return [(elem.x1, elem.y1), (elem.x2, elem.y2)]
+    if elem.kind == "contact":
+        return [(elem.x1, elem.y1)]
+    return []
+
+
+def vlines_from_hits(elem, cells, point_hits):
+    """
+    Данные виртуальных линий элемента по попаданиям его точек на грани:
+    у провода — первая грань каждой ячейки для каждого конца, у контакта —
+    все грани; повторы отбрасываются.
+    """
+    result = []
+    source = elem.layer or "unknown"
+    for hits in point_hits:
+        last_cell = None
+        for ci, edge_type, offset in hits:
+            if elem.kind == "wire":
+                if ci == last_cell:
+                    continue
+                last_cell = ci
+            start, end = _hit_vline(elem.kind, cells[ci], edge_type, offset)
+            if not vline_exists(start, end, result):
+                result.append({'start': start, 'end': end, 'edge_type': edge_type,
+                               'cell': ci, 'source': source})
+    return result
+
+
+def compute_virtual_lines(snapshot, eps=2.0):
+    """
+    Список виртуальных линий по всем проводам, затем по всем контактам,
+    с именами вида <source>_<cell.name>_<edge_type>(N).
+    Точки всех элементов проверяются на грани одним проходом (edge_hits).
+    """
+    cells = snapshot.cells
+    elements = [elem for kind in ("wire", "contact")
+                for elem in snapshot.elements if elem.kind == kind]
+    points, spans = [], []
+    for elem in elements:
+        elem_points = element_points(elem)
+        spans.append((len(points), len(points) + len(elem_points)))
+        points.extend(elem_points)
+    hits = edge_hits(points, cells, eps)
+
+    all_data = []
+    for elem, (start, end) in zip(elements, spans):
+        all_data.extend(vlines_from_hits(elem, cells, hits[start:end]))
+
+    counters = {}
+    for vline in all_data:
+        key = f"{vline['source']}_{cells[vline['cell']].name}_{vline['edge_type']}"
+        counters[key] = counters.get(key, 0) + 1
+        suffix = "" if counters[key] == 1 else f"({counters[key] - 1})"
+        vline['name'] = f"{key}{suffix}"
+    return all_data
+
+
+def vline_registrations(cells, name, start, end, eps=0.1):
+    """
+    Записи для cell.virtual_lines, которые даёт одна виртуальная линия
+    (как CellManager.register_vline_intersections): [(индекс ячейки, запись)].
+    """
+    (x1, y1), (x2, y2) = start, end
+    found = []
+
+    if abs(x1 - x2) < eps:
+        x_const = x1
+        y_min, y_max = min(y1, y2), max(y1, y2)
+        for ci, cell in enumerate(cells):
+            overlaps = not (y_max < cell.y1 or y_min > cell.y2)
+            if abs(x_const - cell.x1) < eps and overlaps:
+                found.append((ci, {"name": name, "relation": "lft", "value": x_const}))
+            if abs(x_const - cell.x2) < eps and overlaps:
+                found.append((ci, {"name": name, "relation": "rht", "value": x_const}))
+
+    elif abs(y1 - y2) < eps:
+        y_const = y1
+        x_min, x_max = min(x1, x2), max(x1, x2)
+        for ci, cell in enumerate(cells):
+            overlaps = not (x_max < cell.x1 or x_min > cell.x2)
+            if abs(y_const - cell.y1) < eps and overlaps:
+                found.append((ci, {"name": name, "relation": "btm", "value": y_const}))
+            if abs(y_const - cell.y2) < eps and overlaps:
+                found.append((ci, {"name": name, "relation": "top", "value": y_const}))
+
+    return found
+
+
+def collect_vline_registrations(cells, vlines):
+    """Содержимое cell.virtual_lines для каждой ячейки по списку виртуальных линий"""
+    registrations = [[] for _ in cells]
+    for vline in vlines:
+        for ci, entry in vline_registrations(cells, vline['name'], vline['start'], vline['end']):
+            registrations[ci].append(entry)
+    return registrations
+
+
+def recompute_layout(snapshot):
+    """Полный пересчёт: распределение по ячейкам, виртуальные линии и их регистрация"""
+    assignment = compute_cell_assignment(snapshot)
+    vlines = compute_virtual_lines(snapshot)
+    registrations = collect_vline_registrations(snapshot.cells, vlines)
+    return RecomputeResult(assignment, vlines, registrations)
+
+
+# --- Пространственный индекс ---
+#
+# Прямоугольники — кортежи (x1, y1, x2, y2) с x1 <= x2, y1 <= y2.
+
+def _union(a, b):
+    return (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+
+
+def _area(r):
+    return (r[2] - r[0]) * (r[3] - r[1])
+
+
+def _intersects(a, b):
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+def _contains(a, b):
+    return a[0] <= b[0] and a[1] <= b[1] and b[2] <= a[2] and b[3] <= a[3]
+
+
+def _bbox_of(entries):
+    x1, y1, x2, y2 = entries[0][0]
+    for (a, b, c, d), _ in entries:
+        if a < x1:
+            x1 = a
+        if b < y1:
+            y1 = b
+        if c > x2:
+            x2 = c
+        if d > y2:
+            y2 = d
+    return (x1, y1, x2, y2)
+
+
+def _point_dist2(x, y, r):
+    dx = max(r[0] - x, 0.0, x - r[2])
+    dy = max(r[1] - y, 0.0, y - r[3])
+    return dx * dx + dy * dy
+
+
+def clip_segment(x1, y1, x2, y2, rect):
+    """
+    Отсекает отрезок прямоугольником (Лианг — Барски).
+    Возвращает (x1, y1, x2, y2) части отрезка внутри rect или None.
+    """
+    t0, t1 = 0.0, 1.0
+    dx, dy = x2 - x1, y2 - y1
+    for p, q in ((-dx, x1 - rect[0]), (dx, rect[2] - x1),
+                 (-dy, y1 - rect[1]), (dy, rect[3] - y1)):
+        if p == 0:
+            if q < 0:
+                return None
+            continue
+        t = q / p
+        if p < 0:
+            if t > t1:
+                return None
+            t0 = max(t0, t)
+        else:
+            if t < t0:
+                return None
+            t1 = min(t1, t)
+    return (x1 + t0 * dx, y1 + t0 * dy, x1 + t1 * dx, y1 + t1 * dy)
+
+
+def clip_segments(segments, rect):
+    """
+    Отсекает пачку отрезков [(x1, y1, x2, y2)] одним прямоугольником за проход:
+    горизонтальные и вертикальные (почти все провода) обрезаются сравнениями
+    координат, остальные — clip_segment. Возвращает список той же длины:
+    обрезанный отрезок или None, если отрезок не пересекает rect
+    (касание rect в одной точке пересечением не считается).
+    """
+    rx1, ry1, rx2, ry2 = rect
+    result = []
+    for x1, y1, x2, y2 in segments:
+        if x1 == x2 and y1 == y2:
+            inside = rx1 <= x1 <= rx2 and ry1 <= y1 <= ry2
+            result.append((x1, y1, x2, y2) if inside else None)
+        elif y1 == y2:
+            lo, hi = max(min(x1, x2), rx1), min(max(x1, x2), rx2)
+            if not ry1 <= y1 <= ry2 or lo >= hi:
+                result.append(None)
+            elif x1 <= x2:
+                result.append((lo, y1, hi, y2))
+            else:
+                result.append((hi, y1, lo, y2))
+        elif x1 == x2:
+            lo, hi = max(min(y1, y2), ry1), min(max(y1, y2), ry2)
+            if not rx1 <= x1 <= rx2 or lo >= hi:
+                result.append(None)
+            elif y1 <= y2:
+                result.append((x1, lo, x2, hi))
+            else:
+                result.append((x1, hi, x2, lo))
+        else:
+            clipped = clip_segment(x1, y1, x2, y2, rect)
+            if clipped is not None and clipped[0] == clipped[2] and clipped[1] == clipped[3]:
+                clipped = None
+            result.append(clipped)
+    return result
+
+
+class _Node:
+    __slots__ = ("leaf", "entries", "bbox")
+
+    def __init__(self, leaf, entries):
+        self.leaf = leaf
+        self.entries = entries      # [(bbox, значение)] в листе, [(bbox, _Node)] выше
+        self.bbox = _bbox_of(entries) if entries else None
+
+
+class RTree:
+    """
+    R-дерево прямоугольников со значениями. Начальная загрузка — STR
+    (Sort-Tile-Recursive), дальше дерево поддерживается вставкой и удалением.
+    """
+
+    def __init__(self, entries=(), max_entries=16):
+        self.max_entries = max_entries
+        self.min_entries = max(2, max_entries * 2 // 5)
+        entries = [(tuple(bbox), value) for bbox, value in entries]
+        self.size = len(entries)
+        self.root = self._bulk_load(entries)
+
+    def __len__(self):
+        return self.size
+
+    # Загрузка STR
+    def _pack(self, entries, leaf):
+        m = self.max_entries
+        count = len(entries)
+        slices = math.ceil(math.sqrt(math.ceil(count / m)))
+        per_slice = slices * m
+        entries = sorted(entries, key=lambda e: e[0][0] + e[0][2])
+        nodes = []
+        for i in range(0, count, per_slice):
+            part = sorted(entries[i:i + per_slice], key=lambda e: e[0][1] + e[0][3])
+            for j in range(0, len(part), m):
+                nodes.append(_Node(leaf, part[j:j + m]))
+        return nodes
+
+    def _bulk_load(self, entries):
+        if not entries:
+            return _Node(True, [])
+        level = self._pack(entries, True)
+        while len(level) > 1:
+            level = self._pack([(node.bbox, node) for node in level], False)
+        return level[0]
+
+    # Вставка
+    def insert(self, bbox, value):
+        bbox = tuple(bbox)
+        node, path = self.root, []
+        while not node.leaf:
+            path.append(node)
+            node = min(node.entries,
+                       key=lambda e: (_area(_union(e[0], bbox)) - _area(e[0]), _area(e[0])))[1]
+        node.entries.append((bbox, value))
+        self.size += 1
+        self._adjust(node, path)
+
+    def _adjust(self, node, path):
+        """Пересчитывает габариты по пути к корню и делит переполненные узлы"""
+        while True:
+            split = self._split(node) if len(node.entries) > self.max_entries else None
+            node.bbox = _bbox_of(node.entries) if node.entries else None
+            if not path:
+                if split is not None:
+                    self.root = _Node(False, [(node.bbox, node), (split.bbox, split)])
+                return
+            parent = path.pop()
+            for i, (_, child) in enumerate(parent.entries):
+                if child is node:
+                    parent.entries[i] = (node.bbox, node)
+                    break
+            if split is not None:
+                parent.entries.append((split.bbox, split))
+            node = parent
+
+    def _split(self, node):
+        """Делит узел пополам по оси наибольшего разброса центров; возвращает новую половину"""
+        entries = node.entries
+        xs = [e[0][0] + e[0][2] for e in entries]
+        ys = [e[0][1] + e[0][3] for e in entries]
+        axis = 0 if max(xs) - min(xs) >= max(ys) - min(ys) else 1
+        entries.sort(key=lambda e: e[0][axis] + e[0][axis + 2])
+        half = len(entries) // 2
+        node.entries, rest = entries[:half], entries[half:]
+        return _Node(node.leaf, rest)
+
+    # Удаление
+    def remove(self, bbox, value):
+        """Удаляет запись (bbox, value); False, если её нет"""
+        bbox = tuple(bbox)
+        found = self._find_leaf(self.root, bbox, value, [])
+        if found is None:
+            return False
+        leaf, index, path = found
+        del leaf.entries[index]
+        self.size -= 1
+        self._condense(leaf, path)
+        return True
+
+    def _find_leaf(self, node, bbox, value, path):
+        if node.leaf:
+            for i, (b, v) in enumerate(node.entries):
+                if v == value and b == bbox:
+                    return node, i, path
+            return None
+        for b, child in node.entries:
+            if _contains(b, bbox):
+                found = self._find_leaf(child, bbox, value, path + [node])
+                if found is not None:
+                    return found
+        return None
+
+    def _condense(self, node, path):
+        orphans = []
+        while path:
+            parent = path.pop()
+            if len(node.entries) < self.min_entries:
+                parent.entries = [e for e in parent.entries if e[1] is not node]
+                orphans.extend(self._leaf_entries(node))
+            else:
+                node.bbox = _bbox_of(node.entries) if node.entries else None
+                for i, (_, child) in enumerate(parent.entries):
+                    if child is node:
+                        parent.entries[i] = (node.bbox, node)
+                        break
+            node = parent
+        node.bbox = _bbox_of(node.entries) if node.entries else None
+
+        while not self.root.leaf and len(self.root.entries) == 1:
+            self.root = self.root.entries[0][1]
+        if not self.root.leaf and not self.root.entries:
+            self.root = _Node(True, [])
+
+        self.size -= len(orphans)
+        for bbox, value in orphans:
+            self.insert(bbox, value)
+
+    def _leaf_entries(self, node):
+        if node.leaf:
+            return list(node.entries)
+        result = []
+        for _, child in node.entries:
+            result.extend(self._leaf_entries(child))
+        return result
+
+    # Запросы
+    def search(self, rect):
+        """Значения записей, чей прямоугольник пересекает rect"""
+        rect = tuple(rect)
+        if self.root.bbox is None:
+            return []
+        result, stack = [], [self.root]
+        while stack:
+            node = stack.pop()
+            if node.leaf:
+                result.extend(v for b, v in node.entries if _intersects(b, rect))
+            else:
+                stack.extend(child for b, child in node.entries if _intersects(b, rect))
+        return result
+
+    def nearest(self, x, y):
+        """Записи в порядке удаления от точки: генератор (расстояние, bbox, значение)"""
+        if self.root.bbox is None:
+            return
+        counter = itertools.count()
+        heap = [(_point_dist2(x, y, self.root.bbox), next(counter), False, self.root.bbox, self.root)]
+        while heap:
+            d2, _, is_entry, bbox, obj = heapq.heappop(heap)
+            if is_entry:
+                yield math.sqrt(d2), bbox, obj
+                continue
+            for b, child in obj.entries:
+                heapq.heappush(heap, (_point_dist2(x, y, b), next(counter), obj.leaf, b, child))
+
+
+def element_bbox(elem):
+    """Габарит ElementRecord: провод — с половиной толщины пера, контакт — с радиусом"""
+    if elem.kind == "wire":
+        half = (elem.pen_width or 0) / 2
+    else:
+        half = elem.width / 2 if isinstance(elem.width, (int, float)) else 0
+    return (min(elem.x1, elem.x2) - half, min(elem.y1, elem.y2) - half,
+            max(elem.x1, elem.x2) + half, max(elem.y1, elem.y2) + half)
+
+
+def element_endpoints(elem):
+    """Концы провода или центр контакта"""
+    if elem.kind == "wire":
+        return ((elem.x1, elem.y1), (elem.x2, elem.y2))
+    return ((elem.x1, elem.y1),)
+
+
+class LayoutIndex:
+    """
+    Пространственный индекс элементов раскладки по слоям: R-дерево габаритов
+    и R-дерево концов проводов / центров контактов.
+    key — любой хешируемый идентификатор элемента (индекс в снимке,
+    элемент сцены); сам индекс Qt не использует.
+    """
+
+    def __init__(self, pairs=()):
+        self.records = dict(pairs)
+        shapes, points = {}, {}
+        for key, elem in self.records.items():
+            shapes.setdefault(elem.layer, []).append((element_bbox(elem), key))
+            for x, y in element_endpoints(elem):
+                points.setdefault(elem.layer, []).append(((x, y, x, y), (key, x, y)))
+        self.shapes = {layer: RTree(entries) for layer, entries in shapes.items()}
+        self.points = {layer: RTree(entries) for layer, entries in points.items()}
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        """Индекс по снимку; ключи — индексы snapshot.elements"""
+        return cls(enumerate(snapshot.elements))
+
+    def __len__(self):
+        return len(self.records)
+
+    def __contains__(self, key):
+        return key in self.records
+
+    def add(self, key, elem):
+        if key in self.records:
+            self.remove(key)
+        self.records[key] = elem
+        self.shapes.setdefault(elem.layer, RTree()).insert(element_bbox(elem), key)
+        points = self.points.setdefault(elem.layer, RTree())
+        for x, y in element_endpoints(elem):
+            points.insert((x, y, x, y), (key, x, y))
+
+    def remove(self, key):
+        elem = self.records.pop(key, None)
+        if elem is None:
+            return False
+        self.shapes[elem.layer].remove(element_bbox(elem), key)
+        for x, y in element_endpoints(elem):
+            self.points[elem.layer].remove((x, y, x, y), (key, x, y))
+        return True
+
+    def _layers(self, trees, layer):
+        if layer is None:
+            return list(trees.values())
+        return [trees[layer]] if layer in trees else []
+
+    def query(self, rect, layer=None, kind=None):
+        """
+        Ключи элементов слоя layer (None — всех слоёв), пересекающих rect.
+        Провод проверяется точно (отсечением отрезка), а не только по габариту.
+        """
+        result = []
+        for tree in self._layers(self.shapes, layer):
+            for key in tree.search(rect):
+                elem = self.records[key]
+                if kind is not None and elem.kind != kind:
+                    continue
+                if elem.kind == "wire":
+                    half = (elem.pen_width or 0) / 2
+                    grown = (rect[0] - half, rect[1] - half, rect[2] + half, rect[3] + half)
+                    if clip_segment(elem.x1, elem.y1, elem.x2, elem.y2, grown) is None:
+                        continue
+                result.append(key)
+        return result
+
+    def endpoints_in(self, rect, layer=None):
+        """[(key, x, y)] концов проводов и центров контактов внутри rect"""
+        result = []
+        for tree in self._layers(self.points, layer):
+            result.extend(tree.search(rect))
+        return result
+
+    def nearest_endpoint(self, x, y, layer=None, max_dist=None):
+        """
+        Ближайший к точке конец провода или центр контакта:
+        (key, (px, py), расстояние) или None, если ничего нет ближе max_dist.
+        """
+        best = None
+        for tree in self._layers(self.points, layer):
+            for dist, _, (key, px, py) in tree.nearest(x, y):
+                if best is None or dist < best[2]:
+                    best = (key, (px, py), dist)
+                break
+        if best is None or (max_dist is not None and best[2] > max_dist):
+            return None
+        return best
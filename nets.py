@@ -0,0 +1,196 @@
+"""
+Извлечение цепей (связности) раскладки без обращения к Qt.
+
+Элементы — пары (ключ, ElementRecord) из layout_model, как в drc. Соединены:
+- провода одного слоя, фигуры которых касаются или перекрываются
+  (стык концов, Т-образное примыкание, пересечение);
+- контакт и любой провод, перекрывающий его круг;
+- явные связи links — пары ключей (два эллипса TwoPointContactGroup).
+Соседей даёт пространственный хеш drc, полная сборка — система непересекающихся
+множеств. После сборки индекс обновляется по одному элементу: добавление
+сливает цепи соседей, удаление пересобирает только бывшую цепь элемента.
+"""
+import itertools
+
+from drc import SpatialHash, element_shape, segment_distance
+
+TOUCH_EPS = 1e-6
+
+
+class UnionFind:
+    """Система непересекающихся множеств: сжатие путей и объединение по размеру"""
+
+    def __init__(self, keys=()):
+        self.parent = {key: key for key in keys}
+        self.size = dict.fromkeys(self.parent, 1)
+
+    def find(self, key):
+        parent = self.parent
+        while parent[key] != key:
+            parent[key] = parent[parent[key]]
+            key = parent[key]
+        return key
+
+    def union(self, a, b):
+        ra, rb = self.find(a), self.find(b)
+        if ra == rb:
+            return ra
+        if self.size[ra] < self.size[rb]:
+            ra, rb = rb, ra
+        self.parent[rb] = ra
+        self.size[ra] += self.size[rb]
+        return ra
+
+
+def shapes_connected(a, b):
+    """Соединены ли фигуры drc.Shape a и b геометрически"""
+    if a.kind == "contact" and b.kind == "contact":
+        return False
+    if a.kind == "wire" and b.kind == "wire" and a.layer != b.layer:
+        return False
+    return segment_distance(a.segment, b.segment) <= a.half + b.half + TOUCH_EPS
+
+
+class NetIndex:
+    """
+    Цепи раскладки: net(key) — номер цепи элемента, members(net) — её элементы.
+    Номера цепей устойчивы, пока цепь не разрезана или не слита с другой;
+    при слиянии сохраняется номер большей цепи.
+    """
+
+    def __init__(self, pairs=(), links=(), bucket=64.0):
+        self.shapes = {}
+        self.adjacency = {}
+        self.links = {}
+        self.net_of = {}
+        self.nets = {}
+        self.hash = SpatialHash(bucket)
+        self._ids = itertools.count()
+
+        for key, elem in pairs:
+            shape = element_shape(key, elem)
+            if shape is None:
+                continue
+            self.shapes[key] = shape
+            self.adjacency[key] = set()
+            self.hash.insert(key, shape.bbox())
+        for a, b in links:
+            self._link(a, b)
+        for key, shape in self.shapes.items():
+            for other in self._touching(shape):
+                self.adjacency[key].add(other)
+
+        uf = UnionFind(self.shapes)
+        for key, neighbours in self.adjacency.items():
+            for other in neighbours:
+                uf.union(key, other)
+        roots = {}
+        for key in self.shapes:
+            root = uf.find(key)
+            net = roots.get(root)
+            if net is None:
+                net = roots[root] = next(self._ids)
+                self.nets[net] = set()
+            self.nets[net].add(key)
+            self.net_of[key] = net
+
+    def __len__(self):
+        return len(self.shapes)
+
+    def __contains__(self, key):
+        return key in self.shapes
+
+    def net(self, key):
+        """Номер цепи элемента (None — элемента нет в индексе)"""
+        return self.net_of.get(key)
+
+    def members(self, net):
+        """Ключи элементов цепи net (пустое множество для неизвестного номера)"""
+        return self.nets.get(net, set())
+
+    def distance(self, key, x, y):
+        """Расстояние от точки до фигуры элемента (0 внутри неё)"""
+        shape = self.shapes[key]
+        return max(0.0, segment_distance((x, y, x, y), shape.segment) - shape.half)
+
+    def _touching(self, shape):
+        for other in self.hash.candidates(shape.bbox(TOUCH_EPS)):
+            if other != shape.key and shapes_connected(shape, self.shapes[other]):
+                yield other
+
+    def _link(self, a, b):
+        if a not in self.shapes or b not in self.shapes or a == b:
+            return
+        self.links.setdefault(a, set()).add(b)
+        self.links.setdefault(b, set()).add(a)
+        self.adjacency[a].add(b)
+        self.adjacency[b].add(a)
+
+    def add(self, key, elem, links=()):
+        """
+        Добавляет (или обновляет) элемент; links — ключи, с которыми он связан
+        явно. Возвращает номер его цепи или None для элементов без фигуры.
+        """
+        kept = self.links.get(key, set()) if key in self.shapes else set()
+        self.remove(key)
+        shape = element_shape(key, elem)
+        if shape is None:
+            return None
+        self.shapes[key] = shape
+        self.adjacency[key] = set()
+        self.hash.insert(key, shape.bbox())
+        for other in self._touching(shape):
+            self.adjacency[key].add(other)
+            self.adjacency[other].add(key)
+        for other in set(links) | kept:
+            self._link(key, other)
+
+        net = next(self._ids)
+        self.nets[net] = {key}
+        self.net_of[key] = net
+        nets = {net} | {self.net_of[other] for other in self.adjacency[key]}
+        target = max(nets, key=lambda n: (len(self.nets[n]), -n))
+        for other_net in nets - {target}:
+            members = self.nets.pop(other_net)
+            for member in members:
+                self.net_of[member] = target
+            self.nets[target].update(members)
+        return target
+
+    def remove(self, key):
+        """Убирает элемент; его бывшая цепь при необходимости делится на части"""
+        shape = self.shapes.pop(key, None)
+        if shape is None:
+            return False
+        self.hash.remove(key, shape.bbox())
+        for other in self.adjacency.pop(key):
+            self.adjacency[other].discard(key)
+        for other in self.links.pop(key, ()):
+            self.links[other].discard(key)
+            if not self.links[other]:
+                del self.links[other]
+
+        net = self.net_of.pop(key)
+        rest = self.nets.pop(net)
+        rest.discard(key)
+        # Компоненты бывшей цепи обходом в ширину; наибольшая сохраняет номер цепи
+        components = []
+        while rest:
+            start = rest.pop()
+            component = {start}
+            queue = [start]
+            while queue:
+                current = queue.pop()
+                for other in self.adjacency[current]:
+                    if other not in component:
+                        component.add(other)
+                        queue.append(other)
+            rest -= component
+            components.append(component)
+        components.sort(key=len, reverse=True)
+        for n, component in enumerate(components):
+            part = net if n == 0 else next(self._ids)
+            self.nets[part] = component
+            for member in component:
+                self.net_of[member] = part
+        return True
@@ -0,0 +1,165 @@
+import random
+
+import pytest
+
+from drc import LayerRule, RuleDeck, Shape, check_layout, check_layout_parallel, check_shapes, violation_sort_key
+from layout_model import ElementRecord
+
+DECK = RuleDeck({
+    "M1": LayerRule(min_width=3, min_spacing=4),
+    "SI": LayerRule(min_width=3, min_spacing=4),
+    "CM1": LayerRule(min_width=6, min_spacing=4, enclosure=2, enclosed_by=("M1",)),
+})
+
+
+def wire(key, x1, y1, x2, y2, width=4, layer="M1"):
+    return Shape(key, "wire", layer, (x1, y1, x2, y2), width / 2)
+
+
+def contact(key, x, y, size=6, layer="CM1"):
+    return Shape(key, "contact", layer, (x, y, x, y), size / 2)
+
+
+def rules(violations):
+    return sorted(v.rule for v in violations)
+
+
+# --- Правила check_shapes ---
+
+@pytest.mark.parametrize("second", [
+    (10, 0, 20, 0),     # стык концов
+    (5, -10, 5, 0),     # Т-образное примыкание
+    (5, -10, 5, 10),    # пересечение
+    (0, 2, 10, 2),      # перекрытие по толщине
+])
+def test_touching_wires_are_not_spacing_violations(second):
+    shapes = [wire("a", 0, 0, 10, 0), wire("b", *second)]
+    assert check_shapes(shapes, DECK) == []
+
+
+def test_close_wires_violate_spacing():
+    shapes = [wire("a", 0, 0, 10, 0), wire("b", 0, 6, 10, 6)]
+    (violation,) = check_shapes(shapes, DECK)
+    assert violation.rule == "spacing"
+    assert violation.keys == ("a", "b")
+    assert violation.value == pytest.approx(2)
+    assert violation.limit == 4
+
+
+def test_wires_on_different_layers_do_not_interact():
+    shapes = [wire("a", 0, 0, 10, 0), wire("b", 0, 6, 10, 6, layer="SI")]
+    assert check_shapes(shapes, DECK) == []
+
+
+def test_thin_wire_violates_width():
+    (violation,) = check_shapes([wire("a", 0, 0, 10, 0, width=2)], DECK)
+    assert (violation.rule, violation.value, violation.limit) == ("width", 2, 3)
+
+
+def test_contacts_with_same_centre_are_one_duplicate():
+    shapes = [wire("w", -20, 0, 20, 0, width=12), contact("a", 0, 0), contact("b", 0, 0)]
+    (violation,) = check_shapes(shapes, DECK)
+    assert violation.rule == "duplicate"
+    assert set(violation.keys) == {"a", "b"}
+
+
+def test_overlapping_contacts_violate_spacing():
+    shapes = [wire("w", -20, 0, 20, 0, width=12), contact("a", 0, 0), contact("b", 2, 0)]
+    assert rules(check_shapes(shapes, DECK)) == ["spacing"]
+
+
+@pytest.mark.parametrize("width, layer, expected", [
+    (12, "M1", []),                 # край провода в 6 от центра, нужен запас 2
+    (4, "M1", []),                  # край ровно на запасе
+    (2, "M1", ["enclosure", "width"]),    # край в 1 от центра (и провод тоньше нормы)
+    (12, "SI", ["enclosure"]),      # слой не из enclosed_by
+])
+def test_contact_enclosure(width, layer, expected):
+    shapes = [wire("w", -20, 0, 20, 0, width=width, layer=layer), contact("c", 0, 0)]
+    assert rules(check_shapes(shapes, DECK)) == expected
+
+
+def test_enclosure_measured_from_wire_end():
+    # Центр контакта за концом провода: расстояние до отрезка 3 + запас 2 > 4
+    shapes = [wire("w", -20, 0, -3, 0, width=8), contact("c", 0, 0)]
+    assert rules(check_shapes(shapes, DECK)) == ["enclosure"]
+    shapes = [wire("w", -20, 0, -2, 0, width=8), contact("c", 0, 0)]
+    assert rules(check_shapes(shapes, DECK)) == []
+    shapes = [wire("w", -20, 0, -3, 0, width=8), contact("c", 0, 0)]
+    assert rules(check_shapes(shapes, DECK)) == ["enclosure"]
+
+
+def test_subjects_limit_reported_violations():
+    shapes = [
+        wire("a", 0, 0, 10, 0), wire("b", 0, 6, 10, 6),         # зазор a-b
+        wire("c", 100, 0, 110, 0, width=2),                     # толщина c
+        wire("d", 200, 0, 210, 0), wire("e", 200, 6, 210, 6),   # зазор d-e
+    ]
+    assert len(check_shapes(shapes, DECK)) == 3
+    only_b = check_shapes(shapes, DECK, subjects={"b"})
+    assert [(v.rule, v.keys) for v in only_b] == [("spacing", ("a", "b"))]
+    assert rules(check_shapes(shapes, DECK, subjects={"c", "e"})) == ["spacing", "width"]
+    assert check_shapes(shapes, DECK, subjects=set()) == []
+
+
+def test_violations_are_sorted():
+    shapes = [wire("far", 500, 0, 510, 0, width=2), wire("near", 0, 0, 10, 0, width=2)]
+    result = check_shapes(shapes, DECK)
+    assert result == sorted(result, key=violation_sort_key)
+    assert [v.keys for v in result] == [("near",), ("far",)]
+
+
+# --- Параллельная проверка совпадает с последовательной ---
+
+def random_layout(seed, count=1500, extent=1000):
+    rnd = random.Random(seed)
+    elements = []
+    for _ in range(count):
+        x, y = rnd.randrange(0, extent, 5), rnd.randrange(0, extent, 5)
+        if rnd.random() < 0.65:
+            dx, dy = rnd.choice([(0, 20), (20, 0), (40, 0), (0, 0), (15, 15)])
+            elements.append(ElementRecord("wire", rnd.choice(["M1", "M1", "SI"]), x, y, x + dx, y + dy,
+                                          -3, rnd.choice([2, 3, 4, 8])))
+        else:
+            elements.append(ElementRecord("contact", "CM1", x, y, x, y, rnd.choice([4, 6, 10]), 0))
+    return elements
+
+
+def serial(elements):
+    result = check_layout(list(enumerate(elements)), DECK)
+    return sorted(result, key=lambda v: (violation_sort_key(v), v.keys))
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+@pytest.mark.parametrize("workers, tiles_per_worker", [(1, 1), (2, 4), (3, 4), (4, 9)])
+def test_parallel_matches_serial(seed, workers, tiles_per_worker):
+    elements = random_layout(seed)
+    bounds = list(range(0, 1001, 50))
+    parallel = check_layout_parallel(elements, DECK, bounds, bounds, workers=workers,
+                                     tiles_per_worker=tiles_per_worker)
+    assert parallel == serial(elements)
+
+
+def test_parallel_violations_on_tile_border_reported_once():
+    elements = [
+        # Зазор с серединой ровно на границе тайлов x = 100
+        ElementRecord("wire", "M1", 97, 0, 97, 50, -3, 4),
+        ElementRecord("wire", "M1", 103, 0, 103, 50, -3, 4),
+        # Тонкий провод, начинающийся на границе, и провод через границу
+        ElementRecord("wire", "M1", 100, 200, 140, 200, -3, 2),
+        ElementRecord("wire", "M1", 60, 300, 140, 300, -3, 2),
+        # Дубликат контактов и контакт без подложки на углу тайлов
+        ElementRecord("contact", "CM1", 100, 100, 100, 100, 6, 0),
+        ElementRecord("contact", "CM1", 100, 100, 100, 100, 6, 0),
+    ]
+    expected = serial(elements)
+    assert sorted(v.rule for v in expected) == ["duplicate", "enclosure", "enclosure",
+                                                "spacing", "width", "width"]
+    for workers, tiles_per_worker in [(2, 2), (4, 4)]:
+        parallel = check_layout_parallel(elements, DECK, [100], [100], workers=workers,
+                                         tiles_per_worker=tiles_per_worker)
+        assert parallel == expected
+
+
+def test_parallel_empty_layout():
+    assert check_layout_parallel([], DECK, [0, 100], [0, 100], workers=2) == []
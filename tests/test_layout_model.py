@@ -0,0 +1,259 @@
+import math
+import random
+
+import pytest
+
+from layout_model import (ElementRecord, LayoutIndex, RTree, _bbox_of, _intersects, _point_dist2, clip_segment,
+                          clip_segments)
+
+
+def random_box(rnd, extent=1000, size=30):
+    x, y = rnd.uniform(0, extent), rnd.uniform(0, extent)
+    return (x, y, x + rnd.uniform(0, size), y + rnd.uniform(0, size))
+
+
+def check_structure(tree):
+    """
+    Инварианты R-дерева: габариты узлов, заполнение, одна глубина листьев; число записей.
+    Загрузка STR не гарантирует min_entries (последний узел полосы бывает
+    неполным), поэтому снизу проверяется только отсутствие пустых узлов.
+    """
+    leaf_depths, count = set(), 0
+    stack = [(tree.root, 0)]
+    while stack:
+        node, depth = stack.pop()
+        if node is not tree.root:
+            assert 1 <= len(node.entries) <= tree.max_entries
+        if node.entries:
+            assert node.bbox == _bbox_of(node.entries)
+        if node.leaf:
+            leaf_depths.add(depth)
+            count += len(node.entries)
+        else:
+            for bbox, child in node.entries:
+                assert bbox == child.bbox
+                stack.append((child, depth + 1))
+    assert len(leaf_depths) <= 1
+    assert count == tree.size == len(tree)
+
+
+def brute_search(entries, rect):
+    return sorted(value for value, bbox in entries.items() if _intersects(bbox, rect))
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("max_entries", [4, 16])
+def test_rtree_random_insert_remove_matches_brute_force(seed, max_entries):
+    rnd = random.Random(seed)
+    entries = {n: random_box(rnd) for n in range(300)}
+    tree = RTree(((bbox, n) for n, bbox in entries.items()), max_entries=max_entries)
+    check_structure(tree)
+    next_value = len(entries)
+
+    for step in range(1500):
+        if entries and rnd.random() < 0.5:
+            # Удаление опустошает листья и уводит их записи в _condense
+            value = rnd.choice(list(entries))
+            assert tree.remove(entries.pop(value), value)
+        else:
+            entries[next_value] = random_box(rnd)
+            tree.insert(entries[next_value], next_value)
+            next_value += 1
+        if step % 100 == 0:
+            check_structure(tree)
+            for _ in range(5):
+                rect = random_box(rnd, size=200)
+                assert sorted(tree.search(rect)) == brute_search(entries, rect)
+
+    check_structure(tree)
+    assert sorted(tree.search((-1, -1, 2000, 2000))) == sorted(entries)
+
+
+def test_rtree_remove_everything_and_refill():
+    rnd = random.Random(7)
+    entries = {n: random_box(rnd) for n in range(200)}
+    tree = RTree(((bbox, n) for n, bbox in entries.items()), max_entries=4)
+    for value in rnd.sample(list(entries), len(entries)):
+        assert tree.remove(entries[value], value)
+        check_structure(tree)
+    assert len(tree) == 0
+    assert tree.search((-1, -1, 2000, 2000)) == []
+    assert list(tree.nearest(0, 0)) == []
+
+    tree.insert((1, 1, 2, 2), "a")
+    check_structure(tree)
+    assert tree.search((0, 0, 3, 3)) == ["a"]
+
+
+def test_rtree_remove_missing_entry():
+    tree = RTree([((0, 0, 1, 1), "a")])
+    assert not tree.remove((0, 0, 1, 1), "b")
+    assert not tree.remove((5, 5, 6, 6), "a")
+    assert len(tree) == 1
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_rtree_nearest_is_best_first(seed):
+    rnd = random.Random(seed)
+    entries = {n: random_box(rnd) for n in range(400)}
+    tree = RTree(((bbox, n) for n, bbox in entries.items()), max_entries=8)
+    for value in rnd.sample(list(entries), 150):
+        tree.remove(entries.pop(value), value)
+    for n in range(400, 450):
+        entries[n] = random_box(rnd)
+        tree.insert(entries[n], n)
+
+    for _ in range(20):
+        x, y = rnd.uniform(-100, 1100), rnd.uniform(-100, 1100)
+        found = list(tree.nearest(x, y))
+        distances = [d for d, _, _ in found]
+        assert distances == sorted(distances)
+        assert sorted(v for _, _, v in found) == sorted(entries)
+        expected = sorted(math.sqrt(_point_dist2(x, y, bbox)) for bbox in entries.values())
+        assert distances == pytest.approx(expected)
+        for d, bbox, value in found:
+            assert bbox == entries[value]
+
+
+def random_record(rnd):
+    x, y = rnd.randrange(0, 1000, 10), rnd.randrange(0, 1000, 10)
+    if rnd.random() < 0.7:
+        dx, dy = rnd.choice([(0, 40), (60, 0), (20, 20)])
+        return ElementRecord("wire", rnd.choice(["M1", "SI"]), x, y, x + dx, y + dy, -3, 4)
+    return ElementRecord("contact", "CM1", x, y, x, y, 6, 0)
+
+
+def test_layout_index_incremental_matches_rebuild():
+    rnd = random.Random(11)
+    records = {n: random_record(rnd) for n in range(500)}
+    index = LayoutIndex(records.items())
+    next_key = len(records)
+    for _ in range(800):
+        r = rnd.random()
+        if r < 0.35:
+            key = rnd.choice(list(records))
+            del records[key]
+            assert index.remove(key)
+        elif r < 0.7:
+            key = rnd.choice(list(records))
+            records[key] = random_record(rnd)
+            index.add(key, records[key])
+        else:
+            records[next_key] = random_record(rnd)
+            index.add(next_key, records[next_key])
+            next_key += 1
+
+    fresh = LayoutIndex(records.items())
+    assert len(index) == len(records)
+    for _ in range(30):
+        rect = random_box(rnd, size=150)
+        for layer in (None, "M1", "CM1"):
+            assert sorted(index.query(rect, layer)) == sorted(fresh.query(rect, layer))
+            assert sorted(index.endpoints_in(rect, layer)) == sorted(fresh.endpoints_in(rect, layer))
+        x, y = rnd.uniform(0, 1000), rnd.uniform(0, 1000)
+        a, b = index.nearest_endpoint(x, y), fresh.nearest_endpoint(x, y)
+        assert a[2] == pytest.approx(b[2])
+        points = [(px, py) for elem in records.values()
+                  for px, py in ((elem.x1, elem.y1), (elem.x2, elem.y2))]
+        assert a[2] == pytest.approx(min(math.hypot(px - x, py - y) for px, py in points))
+
+
+def test_layout_index_query_tests_wire_exactly():
+    index = LayoutIndex([("diag", ElementRecord("wire", "M1", 0, 0, 100, 100, -3, 2))])
+    assert index.query((40, 40, 60, 60)) == ["diag"]
+    # Угол габарита вдали от диагонали
+    assert index.query((80, 0, 100, 20)) == []
+    assert index.nearest_endpoint(90, 90, max_dist=5) is None
+    assert index.nearest_endpoint(99, 99, max_dist=5)[0] == "diag"
+
+
+# --- Отсечение проводов ячейкой ---
+
+CELL = (0, 0, 100, 80)
+
+
+@pytest.mark.parametrize("segment", [
+    (120, 10, 150, 10),     # горизонтальный справа
+    (10, -30, 10, -5),      # вертикальный снизу
+    (-50, 10, -10, 70),     # косой слева
+    (90, 120, 150, 60),     # косой мимо угла
+    (150, 150, 150, 150),   # точка снаружи
+])
+def test_clip_outside(segment):
+    assert clip_segment(*segment, CELL) is None
+    assert clip_segments([segment], CELL) == [None]
+
+
+@pytest.mark.parametrize("segment, expected", [
+    ((-20, 0, 120, 0), (0, 0, 100, 0)),         # по нижней границе
+    ((100, -10, 100, 90), (100, 0, 100, 80)),   # по правой границе
+    ((30, 80, 60, 80), (30, 80, 60, 80)),       # отрезок границы целиком
+])
+def test_clip_on_boundary_is_kept(segment, expected):
+    assert clip_segments([segment], CELL) == [expected]
+    assert clip_segment(*segment, CELL) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("segment", [
+    (100, 10, 140, 10),     # касается правой грани концом
+    (-40, 80, 0, 80),       # касается угла продолжением границы
+    (100, 80, 140, 120),    # касается угла по диагонали
+])
+def test_clip_single_point_touch_is_dropped(segment):
+    assert clip_segments([segment], CELL) == [None]
+
+
+@pytest.mark.parametrize("point, inside", [
+    ((50, 40), True),
+    ((0, 80), True),        # в углу
+    ((100, 40), True),      # на грани
+    ((101, 40), False),
+])
+def test_clip_zero_length(point, inside):
+    segment = point + point
+    assert clip_segments([segment], CELL) == [segment if inside else None]
+
+
+@pytest.mark.parametrize("segment, expected", [
+    ((-20, -16, 120, 96), (0, 0, 100, 80)),     # диагональ через всю ячейку
+    ((120, 96, -20, -16), (100, 80, 0, 0)),     # та же в обратную сторону
+    ((50, 40, 150, 120), (50, 40, 100, 80)),    # изнутри наружу
+    ((-50, 30, 50, 130), (0, 80, 0, 80)),       # касается угла — вырождается в точку
+])
+def test_clip_diagonal(segment, expected):
+    assert clip_segment(*segment, CELL) == pytest.approx(expected)
+
+
+def test_clip_diagonal_through_corner_region():
+    clipped = clip_segment(-10, 50, 30, 90, CELL)
+    assert clipped == pytest.approx((0, 60, 20, 80))
+    assert clip_segments([(-10, 50, 30, 90)], CELL) == [pytest.approx((0, 60, 20, 80))]
+
+
+def test_clip_segments_batch_preserves_order_and_direction():
+    segments = [(-10, 10, 50, 10), (50, 10, -10, 10), (20, 100, 20, -100), (300, 0, 400, 0), (10, 10, 90, 70)]
+    assert clip_segments(segments, CELL) == [
+        (0, 10, 50, 10), (50, 10, 0, 10), (20, 80, 20, 0), None, (10, 10, 90, 70),
+    ]
+
+
+def test_clip_segments_agrees_with_clip_segment():
+    rnd = random.Random(5)
+    for _ in range(2000):
+        x1, y1 = rnd.randrange(-60, 160, 10), rnd.randrange(-60, 140, 10)
+        kind = rnd.random()
+        if kind < 0.4:
+            x2, y2 = rnd.randrange(-60, 160, 10), y1
+        elif kind < 0.8:
+            x2, y2 = x1, rnd.randrange(-60, 140, 10)
+        else:
+            x2, y2 = rnd.randrange(-60, 160, 10), rnd.randrange(-60, 140, 10)
+        (batch,) = clip_segments([(x1, y1, x2, y2)], CELL)
+        single = clip_segment(x1, y1, x2, y2, CELL)
+        if batch is None:
+            # Отброшенное пакетом — либо мимо, либо касание в одной точке
+            assert single is None or (single[0] == pytest.approx(single[2]) and
+                                      single[1] == pytest.approx(single[3]) and
+                                      (x1, y1) != (x2, y2))
+        else:
+            assert batch == pytest.approx(single)
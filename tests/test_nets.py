@@ -0,0 +1,160 @@
+import random
+
+import pytest
+
+from layout_model import ElementRecord
+from nets import NetIndex, UnionFind
+
+
+def wire(x1, y1, x2, y2, layer="M1", pen=4):
+    return ElementRecord("wire", layer, x1, y1, x2, y2, -3, pen)
+
+
+def contact(x, y, layer="CM1", size=6):
+    return ElementRecord("contact", layer, x, y, x, y, size, 0)
+
+
+def partition(index):
+    """Разбиение на цепи без учёта номеров"""
+    return sorted(sorted(members, key=str) for members in index.nets.values())
+
+
+def assert_consistent(index):
+    assert set(index.net_of) == set(index.shapes)
+    for net, members in index.nets.items():
+        assert members
+        for key in members:
+            assert index.net_of[key] == net
+    assert sum(len(m) for m in index.nets.values()) == len(index)
+
+
+def test_union_find():
+    uf = UnionFind(range(6))
+    uf.union(0, 1)
+    uf.union(2, 3)
+    uf.union(1, 3)
+    assert uf.find(0) == uf.find(2)
+    assert uf.find(4) != uf.find(0)
+    assert uf.size[uf.find(0)] == 4
+
+
+def test_connection_rules():
+    index = NetIndex([
+        ("a", wire(0, 0, 100, 0)),
+        ("b", wire(100, 0, 100, 100)),              # стык концов с a
+        ("c", wire(50, -50, 50, 0)),                # Т-образно к a
+        ("d", wire(0, 100, 100, 100, layer="SI")),  # другой слой над концом b
+        ("e", contact(0, 100)),                     # контакт на d
+        ("f", wire(-50, 100, 0, 100, layer="M2")),  # через контакт e к d
+        ("g", wire(300, 0, 400, 0)),
+        ("h", contact(200, 0)),                     # контакт без проводов
+    ])
+    assert_consistent(index)
+    assert index.members(index.net("a")) == {"a", "b", "c"}
+    assert index.members(index.net("d")) == {"d", "e", "f"}
+    assert index.members(index.net("g")) == {"g"}
+    assert index.members(index.net("h")) == {"h"}
+    assert index.net("missing") is None
+
+
+def test_contacts_connect_only_through_links():
+    pairs = [("l", contact(0, 0)), ("r", contact(20, 0)),
+             ("wl", wire(-50, 0, -5, 0)), ("wr", wire(25, 0, 80, 0, layer="SI"))]
+    assert len(NetIndex(pairs).nets) == 2
+    index = NetIndex(pairs, links=[("l", "r")])
+    assert partition(index) == [["l", "r", "wl", "wr"]]
+
+
+def test_link_survives_add_update():
+    index = NetIndex([("l", contact(0, 0)), ("r", contact(20, 0)), ("w", wire(20, 0, 80, 0))],
+                     links=[("l", "r")])
+    net = index.net("w")
+    assert index.members(net) == {"l", "r", "w"}
+    # Перемещение одного эллипса пары: связь сохраняется без явного links
+    index.add("l", contact(0, 200))
+    assert index.links["l"] == {"r"}
+    assert index.members(index.net("w")) == {"l", "r", "w"}
+    index.add("r", contact(500, 500))
+    assert index.members(index.net("l")) == {"l", "r"}
+    assert index.members(index.net("w")) == {"w"}
+    # Удаление рвёт связь у обеих сторон
+    index.remove("r")
+    assert "l" not in index.links
+    assert index.members(index.net("l")) == {"l"}
+
+
+def test_remove_splits_net_largest_part_keeps_number():
+    # Крест из четырёх лучей и контакта в центре; у правого луча есть продолжение
+    index = NetIndex([
+        ("c", contact(0, 0)),
+        ("n", wire(0, 0, 0, 100)), ("s", wire(0, 0, 0, -100)),
+        ("w", wire(0, 0, -100, 0)), ("e", wire(0, 0, 100, 0)),
+        ("e2", wire(100, 0, 200, 0)),
+    ])
+    # Лучи одного слоя касаются друг друга в центре: отодвигаем их от центра
+    # и соединяем перемычками hub (w–e) и hub2 (s–n), чтобы управлять разрезом
+    index.add("n", wire(0, 10, 0, 100))
+    index.add("s", wire(0, -10, 0, -100))
+    index.add("w", wire(-10, 0, -100, 0))
+    index.add("e", wire(10, 0, 100, 0))
+    index.add("hub", wire(-10, 0, 10, 0))
+    index.add("hub2", wire(0, -10, 0, 10))
+    assert len(index.nets) == 1
+    net = index.net("e")
+
+    index.remove("c")
+    assert len(index.nets) == 1
+    index.remove("hub2")
+    assert partition(index) == [["e", "e2", "hub", "w"], ["n"], ["s"]]
+    assert index.net("e2") == net
+    assert len({index.net("n"), index.net("s"), net}) == 3
+    assert_consistent(index)
+
+
+def random_record(rnd):
+    x, y = rnd.randrange(0, 600, 20), rnd.randrange(0, 600, 20)
+    r = rnd.random()
+    if r < 0.7:
+        dx, dy = rnd.choice([(0, 20), (0, 60), (40, 0), (100, 0)])
+        return wire(x, y, x + dx, y + dy, layer=rnd.choice(["M1", "SI"]), pen=rnd.choice([2, 4]))
+    return contact(x, y)
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_incremental_matches_rebuild(seed):
+    rnd = random.Random(seed)
+    records = {n: random_record(rnd) for n in range(400)}
+    # Пары двухточечных контактов
+    for n in range(400, 440, 2):
+        x, y = rnd.randrange(0, 600, 20), rnd.randrange(0, 600, 20)
+        records[n], records[n + 1] = contact(x - 10, y), contact(x + 10, y)
+    links = {(n, n + 1) for n in range(400, 440, 2)}
+    index = NetIndex(records.items(), links)
+    next_key = 1000
+
+    for step in range(1200):
+        r = rnd.random()
+        if r < 0.3:
+            key = rnd.choice(list(records))
+            del records[key]
+            links = {link for link in links if key not in link}
+            assert index.remove(key)
+        elif r < 0.6:
+            key = rnd.choice(list(records))
+            records[key] = random_record(rnd)
+            index.add(key, records[key])
+        else:
+            records[next_key] = random_record(rnd)
+            partner = rnd.choice(list(records)) if rnd.random() < 0.1 else None
+            if partner is not None and partner != next_key:
+                links.add((partner, next_key))
+                index.add(next_key, records[next_key], links=[partner])
+            else:
+                index.add(next_key, records[next_key])
+            next_key += 1
+        if step % 200 == 0:
+            assert_consistent(index)
+            assert partition(index) == partition(NetIndex(records.items(), links))
+
+    assert_consistent(index)
+    assert partition(index) == partition(NetIndex(records.items(), links))